@@ -0,0 +1,66 @@
+"""
+Measure the round trip latency and the throughput of requests between two agents using LocalWiseAgentTransport,
+with the registry in memory, so that it runs without broker nor Redis.
+
+Run it with:
+    python benchmarks/local_transport_benchmark.py
+"""
+import threading
+import time
+from typing import List, Optional
+
+from wiseagents import WiseAgent, WiseAgentMessage, WiseAgentMetaData, WiseAgentRegistry
+from wiseagents.transports import LocalWiseAgentTransport
+
+ROUND_TRIPS = 10_000
+PIPELINED_REQUESTS = 100_000
+
+
+class EchoAgent(WiseAgent):
+    """An agent answering each request with its message, and counting the responses it receives."""
+
+    def __init__(self, name):
+        self.responses = threading.Semaphore(0)
+        super().__init__(name, WiseAgentMetaData(description=name), LocalWiseAgentTransport(agent_name=name))
+
+    def process_request(self, request: WiseAgentMessage, conversation_history: List) -> Optional[str]:
+        return request.message
+
+    def process_response(self, message: WiseAgentMessage) -> bool:
+        self.responses.release()
+        return True
+
+    def process_event(self, event) -> bool:
+        return True
+
+    def process_error(self, error) -> bool:
+        return True
+
+
+def main():
+    WiseAgentRegistry.config = {"use_redis": False}
+    client, echo = EchoAgent("BenchmarkClient"), EchoAgent("BenchmarkEcho")
+    context = WiseAgentRegistry.create_context("Benchmark")
+    try:
+        start = time.perf_counter()
+        for i in range(ROUND_TRIPS):
+            client.send_request(WiseAgentMessage(message=f"Request {i}", context_name=context.name), echo.name)
+            client.responses.acquire()
+        elapsed = time.perf_counter() - start
+        print(f"{ROUND_TRIPS} sequential round trips: {elapsed / ROUND_TRIPS * 1e6:.1f} µs per round trip")
+
+        start = time.perf_counter()
+        for i in range(PIPELINED_REQUESTS):
+            client.send_request(WiseAgentMessage(message=f"Request {i}", context_name=context.name), echo.name)
+        for _ in range(PIPELINED_REQUESTS):
+            client.responses.acquire()
+        elapsed = time.perf_counter() - start
+        print(f"{PIPELINED_REQUESTS} pipelined requests: {PIPELINED_REQUESTS / elapsed:.0f} requests/s")
+    finally:
+        client.stop_agent()
+        echo.stop_agent()
+        WiseAgentRegistry.remove_context(context.name)
+
+
+if __name__ == "__main__":
+    main()
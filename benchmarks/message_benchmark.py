@@ -0,0 +1,71 @@
+"""
+Measure the cost of creating WiseAgentMessage objects, by creating 1M messages, and compare it with
+a message keeping its fields in a __dict__ and registering its YAML representer on each creation,
+as WiseAgentMessage did before using slots.
+
+Run it with:
+    python benchmarks/message_benchmark.py
+"""
+import gc
+import time
+import tracemalloc
+
+import yaml
+
+from wiseagents import WiseAgentMessage, WiseAgentMessageType
+from wiseagents.wise_agent_messaging import wiseAgentMessageType_representer
+
+MESSAGES = 1_000_000
+
+
+class DictWiseAgentMessage(yaml.YAMLObject):
+    """The previous WiseAgentMessage implementation."""
+    yaml_tag = u'!wiseagents.benchmarks.DictWiseAgentMessage'
+
+    def __init__(self, message, context_name, sender=None, message_type=None, tool_id=None, route_response_to=None,
+                 sender_instance_id=None):
+        self._message = message
+        self._sender = sender
+        self._message_type = message_type
+        self._tool_id = tool_id
+        self._route_response_to = route_response_to
+        self._context_name = context_name
+        self._sender_instance_id = sender_instance_id
+        self.__class__.yaml_dumper.add_representer(WiseAgentMessageType, wiseAgentMessageType_representer)
+
+
+def create(message_class):
+    return [message_class(message=f"Response {i}", context_name="CLI.5a1e2c7e", sender="Agent1",
+                          message_type=WiseAgentMessageType.RESPONSE) for i in range(MESSAGES)]
+
+
+def copy(message_class):
+    request = message_class(message="Request", context_name="CLI.5a1e2c7e", sender="Agent1")
+    return [request.copy_with(message=f"Response {i}") for i in range(MESSAGES)]
+
+
+def measure(name, function, message_class):
+    gc.collect()
+    start = time.perf_counter()
+    messages = function(message_class)
+    elapsed = time.perf_counter() - start
+    del messages
+    gc.collect()
+    tracemalloc.start()
+    messages = function(message_class)
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del messages
+    print(f"{name:>30} {elapsed:>10.2f} {elapsed / MESSAGES * 1e9:>14.0f} {memory / MESSAGES:>17.0f}")
+
+
+def main():
+    print(f"Creating {MESSAGES} messages")
+    print(f"{'':>30} {'total (s)':>10} {'per message (ns)':>14} {'memory per message (B)':>17}")
+    measure("dict + representer per message", create, DictWiseAgentMessage)
+    measure("slots", create, WiseAgentMessage)
+    measure("slots, copy_with", copy, WiseAgentMessage)
+
+
+if __name__ == "__main__":
+    main()
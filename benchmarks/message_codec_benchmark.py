@@ -0,0 +1,57 @@
+"""
+Compare the codecs used by the transports to encode the messages sent between agents,
+for messages of different sizes. The msgpack codec is only measured if msgpack is installed.
+
+Run it with:
+    python benchmarks/message_codec_benchmark.py
+"""
+import random
+import string
+import timeit
+
+from wiseagents import WiseAgentMessage, WiseAgentMessageType
+from wiseagents.wise_agent_messaging import get_message_codec
+
+MESSAGE_SIZES = [100, 1000, 10000, 100000]
+CODECS = ["json", "msgpack", "yaml"]
+DURATION = 0.5
+
+
+def message(size: int) -> WiseAgentMessage:
+    """A message whose content has the given number of characters."""
+    content = "".join(random.choices(string.ascii_letters + " ", k=size))
+    return WiseAgentMessage(message=content, context_name="CLI.5a1e2c7e-3f4b-4d6a-9c1b-2e8f7a6d5c4b",
+                            sender="PassThroughClientAgent1", message_type=WiseAgentMessageType.QUERY,
+                            route_response_to="PassThroughClientAgent1")
+
+
+def per_second(function) -> float:
+    """The number of calls of the given function per second."""
+    timer = timeit.Timer(function)
+    number, _ = timer.autorange()
+    count = max(number, int(number * DURATION / max(timer.timeit(number), 1e-9)))
+    return count / timer.timeit(count)
+
+
+def main():
+    random.seed(42)
+    codecs = {}
+    for name in CODECS:
+        try:
+            codecs[name] = get_message_codec(name)
+        except ImportError:
+            print(f"Skipping the {name} codec, which is not installed")
+    print(f"{'size (B)':>9} {'codec':>8} {'encoded (B)':>12} {'encode (msg/s)':>15} {'decode (msg/s)':>15} "
+          f"{'encode (MB/s)':>14} {'decode (MB/s)':>14}")
+    for size in MESSAGE_SIZES:
+        msg = message(size)
+        for name, codec in codecs.items():
+            data = codec.encode(msg)
+            encodes = per_second(lambda: codec.encode(msg))
+            decodes = per_second(lambda: codec.decode(data))
+            print(f"{size:>9} {name:>8} {len(data):>12} {encodes:>15.0f} {decodes:>15.0f} "
+                  f"{encodes * size / 1e6:>14.1f} {decodes * size / 1e6:>14.1f}")
+
+
+if __name__ == "__main__":
+    main()
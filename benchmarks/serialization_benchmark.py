@@ -0,0 +1,66 @@
+"""
+Compare the serializers used for the values stored in redis by the registry and the contexts,
+on chat histories similar to the ones produced by the agents.
+
+Run it with:
+    python benchmarks/serialization_benchmark.py
+"""
+import random
+import string
+import timeit
+
+from wiseagents.wise_agent_serialization import JSONWiseAgentSerializer, PickleWiseAgentSerializer
+
+HISTORY_SIZES = [10, 100, 1000]
+REPETITIONS = 20
+
+
+def random_text(words: int) -> str:
+    return " ".join("".join(random.choices(string.ascii_lowercase, k=random.randint(2, 10))) for _ in range(words))
+
+
+def chat_history(size: int) -> list:
+    """A chat history alternating user prompts, assistant answers and tool results of realistic sizes."""
+    history = [{"role": "system", "content": random_text(50)}]
+    for i in range(size - 1):
+        if i % 3 == 0:
+            history.append({"role": "user", "content": random_text(random.randint(10, 200))})
+        elif i % 3 == 1:
+            history.append({"role": "assistant", "content": random_text(random.randint(50, 500))})
+        else:
+            history.append({"tool_call_id": f"call_{i}", "role": "tool", "name": "get_current_weather",
+                            "content": random_text(random.randint(20, 100))})
+    return history
+
+
+def main():
+    random.seed(42)
+    serializers = {
+        "pickle": PickleWiseAgentSerializer(),
+        "json": JSONWiseAgentSerializer(compression_threshold=None),
+        "json+zlib": JSONWiseAgentSerializer(compression_threshold=1024),
+    }
+    print(f"{'messages':>8} {'serializer':>10} {'size (KB)':>10} {'dumps (ms)':>11} {'loads (ms)':>11}")
+    for size in HISTORY_SIZES:
+        history = chat_history(size)
+        for name, serializer in serializers.items():
+            data = serializer.dumps(history)
+            dumps = timeit.timeit(lambda: serializer.dumps(history), number=REPETITIONS) / REPETITIONS
+            loads = timeit.timeit(lambda: serializer.loads(data), number=REPETITIONS) / REPETITIONS
+            print(f"{size:>8} {name:>10} {len(data) / 1024:>10.1f} {dumps * 1000:>11.3f} {loads * 1000:>11.3f}")
+
+    # The contexts store each chat message as a separate redis list item
+    print()
+    print(f"{'per message':>19} {'size (B)':>10} {'dumps (us)':>11} {'loads (us)':>11}")
+    history = chat_history(1000)
+    for name, serializer in serializers.items():
+        data = [serializer.dumps(message) for message in history]
+        dumps = timeit.timeit(lambda: [serializer.dumps(message) for message in history], number=REPETITIONS)
+        loads = timeit.timeit(lambda: [serializer.loads(item) for item in data], number=REPETITIONS)
+        count = REPETITIONS * len(history)
+        print(f"{name:>19} {sum(len(item) for item in data) / len(data):>10.0f} "
+              f"{dumps / count * 1e6:>11.2f} {loads / count * 1e6:>11.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -13,6 +13,12 @@ from wiseagents.wise_agent_messaging import WiseAgentEvent
 from wiseagents.wise_agent_messaging import WiseAgentMessage
 from wiseagents.wise_agent_messaging import WiseAgentMessageType
 from wiseagents.wise_agent_messaging import WiseAgentTransport
+from wiseagents.wise_agent_messaging import (JSONWiseAgentMessageCodec, MsgpackWiseAgentMessageCodec,
+                                             WiseAgentMessageCodec, YAMLWiseAgentMessageCodec)
+from wiseagents.wise_agent_blob_store import LocalWiseAgentBlobStore, RedisWiseAgentBlobStore, WiseAgentBlobStore
+from wiseagents.wise_agent_history import WiseAgentHistoryPolicy
+from wiseagents.wise_agent_routing import WiseAgentRoutingIndex
+from wiseagents.wise_agent_serialization import JSONWiseAgentSerializer, PickleWiseAgentSerializer, WiseAgentSerializer
 
 # Define any necessary initialization code here
 
@@ -20,5 +26,8 @@ from wiseagents.wise_agent_messaging import WiseAgentTransport
 # __all__ = ['module1', 'module2', 'subpackage']
 __all__ = ['WiseAgentRegistry', 'WiseAgentContext', 'WiseAgent', 'WiseAgentTool', 'WiseAgentMetaData',
            'WiseAgentMessage', 'WiseAgentMessageType', 'WiseAgentTransport', 'WiseAgentEvent',
-           'WiseAgentCollaborationType',
+           'WiseAgentMessageCodec', 'JSONWiseAgentMessageCodec', 'MsgpackWiseAgentMessageCodec',
+           'YAMLWiseAgentMessageCodec', 'WiseAgentBlobStore', 'RedisWiseAgentBlobStore', 'LocalWiseAgentBlobStore',
+           'WiseAgentCollaborationType', 'WiseAgentHistoryPolicy', 'WiseAgentRoutingIndex',
+           'WiseAgentSerializer', 'JSONWiseAgentSerializer', 'PickleWiseAgentSerializer',
            'AbstractClassError', 'enforce_no_abstract_class_instances']
@@ -1,5 +1,6 @@
 
 import logging
+import queue
 from threading import Thread
 import threading
 import time
@@ -8,7 +9,7 @@ import uuid
 
 from openai.types.chat import ChatCompletionMessageParam
 from wiseagents import WiseAgent, WiseAgentCollaborationType, WiseAgentMetaData, WiseAgentRegistry, WiseAgentTransport
-from wiseagents.wise_agent_messaging import WiseAgentMessage
+from wiseagents.wise_agent_messaging import WiseAgentMessage, WiseAgentMessageType
 import gradio
 
 class AssistantAgent(WiseAgent):
@@ -19,13 +20,19 @@ class AssistantAgent(WiseAgent):
     yaml_tag = u'!wiseagents.agents.AssistantAgent'
     
     _response_delivery = None
-    _cond = threading.Condition()
-    _response : WiseAgentMessage = None
     _ctx = None
+    # How long, in seconds, a chat session of the web interface waits for each response, or chunk, to its request
+    RESPONSE_TIMEOUT = 300
     
     def __new__(cls, *args, **kwargs):
         """Create a new instance of the class, setting default values for the optional instance variables."""
         obj = super().__new__(cls)
+        # the queues of the responses received for the requests of the chat sessions of the web interface, including
+        # the CHUNK messages, by context name, and the contexts of the chat sessions by gradio session hash, both
+        # guarded by the sessions lock
+        obj._responses = {}
+        obj._sessions = {}
+        obj._sessions_lock = threading.Lock()
         return obj
 
     def __init__(self, name: str, metadata: WiseAgentMetaData , transport: WiseAgentTransport,
@@ -50,6 +57,14 @@ class AssistantAgent(WiseAgent):
             destination_agent_name={self.destination_agent_name},\
             response_delivery={self.response_delivery}"
     
+    def __getstate__(self) -> dict:
+        """Get the state of the agent, without the chat sessions and the responses being received."""
+        state = super().__getstate__()
+        state.pop("responses", None)
+        state.pop("sessions", None)
+        state.pop("sessions_lock", None)
+        return state
+
     def start_agent(self):
         super().start_agent()
         self._ctx = f'{self.name}.{str(uuid.uuid4())}'
@@ -58,13 +73,55 @@ class AssistantAgent(WiseAgent):
     
     def stop_agent(self):
         super().stop_agent()
-        WiseAgentRegistry.remove_context(self._ctx)
-
-    def slow_echo(self, message, history):
-            with self._cond:
-                self.handle_request(WiseAgentMessage(message=message, sender=self.name, context_name=self._ctx))
-                self._cond.wait()
-                return self._response.message
+        with self._sessions_lock:
+            context_names = [self._ctx, *self._sessions.values()]
+            self._sessions.clear()
+        for context_name in context_names:
+            if WiseAgentRegistry.does_context_exist(context_name):
+                WiseAgentRegistry.remove_context(context_name)
+
+    def _get_session_context(self, request: Optional[gradio.Request]) -> str:
+        """Get the name of the context of the chat session of the given request of the web interface, creating it
+        if needed, so that each session has its own conversation and receives only its own responses."""
+        if request is None or request.session_hash is None:
+            return self._ctx
+        with self._sessions_lock:
+            context_name = self._sessions.get(request.session_hash)
+            if context_name is None or not WiseAgentRegistry.does_context_exist(context_name):
+                # a new session, or a session whose context expired
+                context_name = f'{self.name}.{str(uuid.uuid4())}'
+                WiseAgentRegistry.create_context(context_name).set_collaboration_type(
+                    WiseAgentCollaborationType.CHAT)
+                self._sessions[request.session_hash] = context_name
+            return context_name
+
+    def slow_echo(self, message, history, request: gradio.Request = None):
+        """Send the message of the web interface and yield the response, growing as its chunks are received
+        when the response is streamed. The responses are matched to the chat session by their context."""
+        context_name = self._get_session_context(request)
+        responses = queue.Queue()
+        with self._sessions_lock:
+            self._responses[context_name] = responses
+        try:
+            self.handle_request(WiseAgentMessage(message=message, sender=self.name, context_name=context_name))
+            partial_response = ""
+            while True:
+                try:
+                    response = responses.get(timeout=self.RESPONSE_TIMEOUT)
+                except queue.Empty:
+                    logging.warning(f"No response received in context {context_name} after "
+                                    f"{self.RESPONSE_TIMEOUT} seconds")
+                    yield partial_response or "No response received, please try again."
+                    return
+                if response.message_type != WiseAgentMessageType.CHUNK:
+                    yield response.message
+                    return
+                partial_response += response.message
+                yield partial_response
+        finally:
+            with self._sessions_lock:
+                if self._responses.get(context_name) is responses:
+                    del self._responses[context_name]
 
     def process_request(self, request: WiseAgentMessage,
                         conversation_history: List[ChatCompletionMessageParam]) -> Optional[str]:
@@ -89,9 +146,13 @@ class AssistantAgent(WiseAgent):
     def process_response(self, response : WiseAgentMessage):
         """Process a response message just sending it back to the client."""
         print(f"AssistantAgent: process_response: {response}")
-        with self._cond:
-            self._response = response
-            self._cond.notify()
+        with self._sessions_lock:
+            responses = self._responses.get(response.context_name)
+        if responses is None:
+            logging.warning(f"Dropping response {response.message_id}, no chat session of context "
+                            f"{response.context_name} is waiting for it")
+            return True
+        responses.put(response)
         return True
 
     def process_event(self, event):
@@ -48,9 +48,12 @@ class SequentialCoordinatorWiseAgent(WiseAgent):
         sub_ctx_name = f'{self.name}.{str(uuid.uuid4())}'
 
         ctx = WiseAgentRegistry.create_sub_context(request.context_name, sub_ctx_name)
-        ctx.set_collaboration_type(WiseAgentCollaborationType.SEQUENTIAL)
-        ctx.set_agents_sequence(self._agents)
-        ctx.set_route_response_to(request.sender)
+        with ctx.batch():
+            ctx.set_collaboration_type(WiseAgentCollaborationType.SEQUENTIAL)
+            ctx.set_agents_sequence(self._agents)
+            ctx.set_route_response_to(request.sender)
+            if request.message_id is not None:
+                ctx.set_route_response_correlation_id(request.message_id)
         self.send_request(WiseAgentMessage(message=request.message, sender=self.name, context_name=ctx.name), self._agents[0])
 
     def process_response(self, response):
@@ -60,6 +63,9 @@ class SequentialCoordinatorWiseAgent(WiseAgent):
         Args:
             response (WiseAgentMessage): the response message to process
         """
+        if response.message_type == WiseAgentMessageType.CHUNK:
+            # the chunks of a response streamed by an agent of the sequence are not part of the coordination
+            return True
         if response.message:
             raise ValueError(f"Unexpected response message: {response.message}")
         return True
@@ -136,13 +142,16 @@ class SequentialMemoryCoordinatorWiseAgent(WiseAgent):
         sub_ctx_name = f'{self.name}.{str(uuid.uuid4())}'
 
         ctx = WiseAgentRegistry.create_sub_context(request.context_name, sub_ctx_name)
-        ctx.set_collaboration_type(WiseAgentCollaborationType.SEQUENTIAL_MEMORY)
-        if self.metadata.system_message:
-            ctx.append_chat_completion(messages={"role": "system", "content": self.metadata.system_message})
-
-        ctx.set_agents_sequence(self._agents)
-        ctx.set_route_response_to(request.sender)
-        ctx.add_query(request.message)
+        with ctx.batch():
+            ctx.set_collaboration_type(WiseAgentCollaborationType.SEQUENTIAL_MEMORY)
+            if self.metadata.system_message:
+                ctx.append_chat_completion(messages={"role": "system", "content": self.metadata.system_message})
+
+            ctx.set_agents_sequence(self._agents)
+            ctx.set_route_response_to(request.sender)
+            if request.message_id is not None:
+                ctx.set_route_response_correlation_id(request.message_id)
+            ctx.add_query(request.message)
         self.send_request(WiseAgentMessage(message=request.message, sender=self.name, context_name=ctx.name), self._agents[0])
 
 
@@ -161,11 +170,13 @@ class PhasedCoordinatorWiseAgent(WiseAgent):
         obj._phases = ["Data Collection", "Data Analysis"]
         obj._max_iterations = MAX_ITERATIONS_FOR_COORDINATOR
         obj._confidence_score_threshold = CONFIDENCE_SCORE_THRESHOLD
+        obj._agent_selection_top_k = None
         return obj
 
     def __init__(self, name: str, metadata: WiseAgentMetaData, transport: WiseAgentTransport, llm: WiseAgentLLM,
                  phases: Optional[List[str]] = None, max_iterations: Optional[int] = MAX_ITERATIONS_FOR_COORDINATOR,
-                 confidence_score_threshold: Optional[int] = CONFIDENCE_SCORE_THRESHOLD):
+                 confidence_score_threshold: Optional[int] = CONFIDENCE_SCORE_THRESHOLD,
+                 agent_selection_top_k: Optional[int] = None):
         """
         Initialize the agent.
 
@@ -178,11 +189,14 @@ class PhasedCoordinatorWiseAgent(WiseAgent):
             max_iterations (Optional[int]): the maximum number of iterations to run the phases, defaults to 5
             confidence_score_threshold (Optional[int]): the confidence score threshold to determine if the final answer
             is acceptable, defaults to 85
+            agent_selection_top_k (Optional[int]): the maximum number of agents, the most relevant for the query,
+            the LLM chooses from. Defaults to None, i.e. the LLM chooses among all the registered agents
         """
         self._name = name
         self._phases = phases if phases is not None else ["Data Collection", "Data Analysis"]
         self._max_iterations = max_iterations
         self._confidence_score_threshold = confidence_score_threshold
+        self._agent_selection_top_k = agent_selection_top_k
         super().__init__(name=name, metadata=metadata, transport=transport, llm=llm)
 
     def __repr__(self):
@@ -205,6 +219,11 @@ class PhasedCoordinatorWiseAgent(WiseAgent):
         """Get the confidence score threshold."""
         return self._confidence_score_threshold
 
+    @property
+    def agent_selection_top_k(self) -> Optional[int]:
+        """Get the maximum number of agents the LLM chooses from, None for all the registered agents."""
+        return self._agent_selection_top_k
+
     def handle_request(self, request):
         """
         Process a request message by kicking off the collaboration in phases.
@@ -218,23 +237,30 @@ class PhasedCoordinatorWiseAgent(WiseAgent):
         sub_ctx_name = f'{self.name}.{str(uuid.uuid4())}'
 
         ctx = WiseAgentRegistry.create_sub_context(request.context_name, sub_ctx_name)
-        ctx.set_collaboration_type(WiseAgentCollaborationType.PHASED)
-        ctx.set_route_response_to(request.sender)
-        logging.debug(f"Registred context: {WiseAgentRegistry.get_context(ctx.name)}")
-        # Determine the agents required to answer the query
+        # Determine the agents required to answer the query, among the most relevant ones if there are many agents
+        if self.agent_selection_top_k is not None:
+            agent_descriptions = WiseAgentRegistry.get_relevant_agent_names_and_descriptions(request.message,
+                                                                                            self.agent_selection_top_k)
+        else:
+            agent_descriptions = WiseAgentRegistry.get_agent_names_and_descriptions()
         agent_selection_prompt = ("Given the following query and a description of the agents that are available," +
                                   " determine all of the agents that could be required to solve the query." +
                                   " Format the response as a space separated list of agent names and don't include " +
                                   " anything else in the response.\n" +
                                   " Query: " + request.message + "\n" + "Available agents:\n" +
-                                  "\n".join(WiseAgentRegistry.get_agent_names_and_descriptions()) + "\n")
-        if self.metadata.system_message or self.llm.system_message:
-            ctx.append_chat_completion(messages={"role": "system", "content": self.metadata.system_message or self.llm.system_message})
-        ctx.append_chat_completion(messages={"role": "user", "content": agent_selection_prompt})
+                                  "\n".join(agent_descriptions) + "\n")
+        with ctx.batch():
+            ctx.set_collaboration_type(WiseAgentCollaborationType.PHASED)
+            ctx.set_route_response_to(request.sender)
+            if request.message_id is not None:
+                ctx.set_route_response_correlation_id(request.message_id)
+            if self.metadata.system_message or self.llm.system_message:
+                ctx.append_chat_completion(messages={"role": "system", "content": self.metadata.system_message or self.llm.system_message})
+            ctx.append_chat_completion(messages={"role": "user", "content": agent_selection_prompt})
+        logging.debug(f"Registred context: {WiseAgentRegistry.get_context(ctx.name)}")
 
         logging.debug(f"messages: {ctx.llm_chat_completion}")
         llm_response = self.llm.process_chat_completion(ctx.llm_chat_completion, tools=[])
-        ctx.append_chat_completion(messages=llm_response.choices[0].message)
 
         # Assign the agents to phases
         agent_assignment_prompt = ("Assign each of the agents that will be required to solve the query to one of the following phases:\n" +
@@ -243,13 +269,18 @@ class PhasedCoordinatorWiseAgent(WiseAgent):
                                    " Format the response as a space separated list of agents for each phase, where the first"
                                    " line contains the list of agents for the first phase and second line contains the list of"
                                    " agents for the second phase and so on. Don't include anything else in the response.\n")
-        ctx.append_chat_completion(messages={"role": "user", "content": agent_assignment_prompt})
+        with ctx.batch():
+            ctx.append_chat_completion(messages=llm_response.choices[0].message)
+            ctx.append_chat_completion(messages={"role": "user", "content": agent_assignment_prompt})
         llm_response = self.llm.process_chat_completion(ctx.llm_chat_completion, tools=[])
-        ctx.append_chat_completion(messages=llm_response.choices[0].message)     
         phases = [phase.split() for phase in llm_response.choices[0].message.content.splitlines()]
-        ctx.set_agent_phase_assignments(phases)
-        ctx.set_current_phase(0)
-        ctx.add_query(request.message)
+        with ctx.batch():
+            ctx.append_chat_completion(messages=llm_response.choices[0].message)
+            ctx.set_agent_phase_assignments(phases)
+            # without the agents assigned several times to a phase, which are requested once
+            phases = ctx.get_agent_phase_assignments()
+            ctx.set_current_phase(0)
+            ctx.add_query(request.message)
 
         # Kick off the first phase
         for agent in phases[0]:
@@ -265,17 +296,17 @@ class PhasedCoordinatorWiseAgent(WiseAgent):
         Args:
             response (WiseAgentMessage): the response message to process
         """
+        if response.message_type == WiseAgentMessageType.CHUNK:
+            # the chunks of a response streamed by an agent of the phase are not part of the coordination
+            return True
         ctx = WiseAgentRegistry.get_context(response.context_name)
         
         if response.message_type != WiseAgentMessageType.ACK:
             raise ValueError(f"Unexpected response message_type: {response.message_type} with message: {response.message}")
 
-        # Remove the agent from the required agents for this phase
-        ctx.remove_required_agent_for_current_phase(response.sender)
-
-        # If there are no more agents remaining in this phase, move on to the next phase,
-        # return the final answer, or iterate
-        if len(ctx.get_required_agents_for_current_phase()) == 0:
+        # Remove the agent from the required agents for this phase. If it was the last agent remaining
+        # in this phase, move on to the next phase, return the final answer, or iterate
+        if ctx.remove_required_agent_for_current_phase(response.sender):
             next_phase = ctx.get_agents_for_next_phase()
             if next_phase is None:
                 # Determine the final answer
@@ -298,10 +329,13 @@ class PhasedCoordinatorWiseAgent(WiseAgent):
                 # Determine if we should return the final answer or iterate
                 if score >= self.confidence_score_threshold:
                     self.send_response(WiseAgentMessage(message=final_answer, sender=self.name,
-                                                        context_name=response.context_name), ctx.get_route_response_to())
+                                                        context_name=response.context_name,
+                                                        correlation_id=ctx.get_route_response_correlation_id()),
+                                       ctx.get_route_response_to())
                 elif len(ctx.get_queries()) == self.max_iterations:
                     self.send_response(WiseAgentMessage(message=CANNOT_ANSWER, message_type=WiseAgentMessageType.CANNOT_ANSWER,
-                                                        sender=self.name, context_name=response.context_name),
+                                                        sender=self.name, context_name=response.context_name,
+                                                        correlation_id=ctx.get_route_response_correlation_id()),
                                        ctx.get_route_response_to())
                 else:
                     # Rephrase the query and iterate
@@ -316,9 +350,10 @@ class PhasedCoordinatorWiseAgent(WiseAgent):
                         # Note that llm_chat_completion is being used here so we have the full history
                         llm_response = self.llm.process_chat_completion(ctx.llm_chat_completion, tools=[])
                         rephrased_query = llm_response.choices[0].message.content
-                        ctx.append_chat_completion(messages=llm_response.choices[0].message)
-                        ctx.set_current_phase(0)
-                        ctx.add_query(rephrased_query)
+                        with ctx.batch():
+                            ctx.append_chat_completion(messages=llm_response.choices[0].message)
+                            ctx.set_current_phase(0)
+                            ctx.add_query(rephrased_query)
                         for agent in ctx.get_required_agents_for_current_phase():
                             self.send_request(WiseAgentMessage(message=rephrased_query, sender=self.name,
                                                                context_name=response.context_name),
@@ -3,7 +3,7 @@ import logging
 import uuid
 from typing import Callable, List, Optional
 
-from openai.types.chat import ChatCompletionMessageParam
+from openai.types.chat import ChatCompletionMessageParam, ChatCompletionToolParam
 from wiseagents import WiseAgent, WiseAgentCollaborationType, WiseAgentMessage, WiseAgentMessageType, WiseAgentMetaData, WiseAgentRegistry, WiseAgentTransport, \
     WiseAgentTool
 from wiseagents.llm import WiseAgentLLM
@@ -54,7 +54,8 @@ class PassThroughClientAgent(WiseAgent):
         return None
 
     def process_response(self, response):
-        """Process a response message just sending it back to the client."""
+        """Process a response message just sending it back to the client. The CHUNK messages of a streamed response
+        are delivered as they are received, before the complete response."""
         if self.response_delivery is not None:
             self.response_delivery(response)
         else:
@@ -108,9 +109,11 @@ class LLMOnlyWiseAgent(WiseAgent):
     def __new__(cls, *args, **kwargs):
         """Create a new instance of the class, setting default values for the instance variables."""
         obj = super().__new__(cls)
+        obj._stream = False
         return obj
 
-    def __init__(self, name: str, metadata: WiseAgentMetaData, llm : WiseAgentLLM, transport: WiseAgentTransport):
+    def __init__(self, name: str, metadata: WiseAgentMetaData, llm : WiseAgentLLM, transport: WiseAgentTransport,
+                 stream: Optional[bool] = False):
         """
         Initialize the agent.
 
@@ -119,8 +122,11 @@ class LLMOnlyWiseAgent(WiseAgent):
             metadata (WiseAgentMetaData): the metadata for the agent
             llm (WiseAgentLLM): the LLM agent to use for processing requests
             transport (WiseAgentTransport): the transport to use for communication
+            stream (Optional[bool]): whether the tokens generated by the LLM are sent to the sender of the request
+            as CHUNK messages as they are generated, before the complete response. Default is False
             
         """
+        self._stream = stream
         super().__init__(name=name, metadata=metadata, transport=transport, llm=llm)
 
     def __repr__(self):
@@ -153,6 +159,9 @@ class LLMOnlyWiseAgent(WiseAgent):
         if self.metadata.system_message or self.llm.system_message:
             conversation_history.append({"role": "system", "content": self.metadata.system_message or self.llm.system_message})
         conversation_history.append({"role": "user", "content": request.message})
+        if self.stream:
+            return self.send_response_chunks(request,
+                                             self.llm.process_chat_completion_stream(conversation_history, []))
         llm_response = self.llm.process_chat_completion(conversation_history, [])
         return llm_response.choices[0].message.content
 
@@ -168,6 +177,11 @@ class LLMOnlyWiseAgent(WiseAgent):
         """Get the name of the agent."""
         return self._name
 
+    @property
+    def stream(self) -> bool:
+        """Get whether the tokens generated by the LLM are sent as CHUNK messages as they are generated."""
+        return self._stream
+
 
 class LLMWiseAgentWithTools(WiseAgent):
     """
@@ -179,6 +193,8 @@ class LLMWiseAgentWithTools(WiseAgent):
     def __new__(cls, *args, **kwargs):
         """Create a new instance of the class, setting default values for the instance variables."""
         obj = super().__new__(cls)
+        # the hashes of the schemas of the tools and the tools in the form of ChatCompletionToolParam
+        obj._tools_OpenAI_format = None
         return obj
     
     def __init__(self, name: str, metadata: WiseAgentMetaData, llm : WiseAgentLLM, transport: WiseAgentTransport, tools: List[str]):
@@ -199,6 +215,12 @@ class LLMWiseAgentWithTools(WiseAgent):
         """Return a string representation of the agent."""
         return (f"{self.__class__.__name__}(name={self.name}, metadata={self.metadata}, llm={self.llm}, transport={self.transport}")
 
+    def __getstate__(self) -> dict:
+        """Return the state of the agent, without the cached tools."""
+        state = super().__getstate__()
+        state.pop("tools_OpenAI_format", None)
+        return state
+
     def process_event(self, event):
         """Do nothing"""
         return True
@@ -208,6 +230,23 @@ class LLMWiseAgentWithTools(WiseAgent):
         logging.error(error)
         return True
 
+    def get_tools_OpenAI_format(self) -> List[ChatCompletionToolParam]:
+        """
+        Get the tools of the agent in the form of ChatCompletionToolParam. The list is cached and only
+        assembled again when the hash of the schema of one of the tools changes in the registry.
+
+        Returns:
+            List[ChatCompletionToolParam]: the tools of the agent
+        """
+        schemas = WiseAgentRegistry.get_tool_schemas()
+        missing = [tool for tool in self._tools if tool not in schemas]
+        if missing:
+            raise ValueError(f"Tools {missing} of agent {self.name} are not registered")
+        hashes = tuple(schemas[tool]["hash"] for tool in self._tools)
+        if self._tools_OpenAI_format is None or self._tools_OpenAI_format[0] != hashes:
+            self._tools_OpenAI_format = (hashes, [schemas[tool]["tool_param"] for tool in self._tools])
+        return self._tools_OpenAI_format[1]
+
     def process_request(self, request: WiseAgentMessage, conversation_history: List[ChatCompletionMessageParam]) -> Optional[str]:
         """
         Process a request message by passing it to the LLM agent.
@@ -224,12 +263,12 @@ class LLMWiseAgentWithTools(WiseAgent):
         """
         sub_ctx_name = f'{self.name}.{str(uuid.uuid4())}'
         ctx = WiseAgentRegistry.create_sub_context(request.context_name,sub_ctx_name)
-        if self.llm.system_message:
-            ctx.append_chat_completion(messages= {"role": "system", "content": self.llm.system_message})
-        ctx.append_chat_completion(messages= {"role": "user", "content": request.message})
-        
-        for tool in self._tools:
-            ctx.append_available_tool_in_chat(tools=WiseAgentRegistry.get_tool(tool).get_tool_OpenAI_format())
+        with ctx.batch():
+            if self.llm.system_message:
+                ctx.append_chat_completion(messages= {"role": "system", "content": self.llm.system_message})
+            ctx.append_chat_completion(messages= {"role": "user", "content": request.message})
+            for tool in self.get_tools_OpenAI_format():
+                ctx.append_available_tool_in_chat(tools=tool)
             
         logging.debug(f"messages: {ctx.llm_chat_completion}, Tools: {ctx.llm_available_tools_in_chat}")
         # TODO: https://github.com/wise-agents/wise-agents/issues/205
@@ -9,20 +9,33 @@ from wiseagents.yaml import WiseAgentsLoader
 
 import yaml
 
-from wiseagents import WiseAgent, WiseAgentMessage, WiseAgentRegistry
+from wiseagents import WiseAgent, WiseAgentMessage, WiseAgentMessageType, WiseAgentRegistry
 # These unsued imports are need for yaml.load_all. If they are removed, the yaml.load_all will not find the constructors for these classes
 import wiseagents.agents
 from wiseagents.transports import StompWiseAgentTransport
 
 cond = threading.Condition()
+# Whether the chunks of the response being delivered were already printed
+_streaming = False
 
 global _passThroughClientAgent1
 
 def response_delivered(message: WiseAgentMessage):
+    global _streaming
+    if message.message_type == WiseAgentMessageType.CHUNK:
+        # the chunks of a streamed response are printed as they are received
+        if not _streaming:
+            print("C Response delivered: ", end="")
+            _streaming = True
+        print(message.message, end="", flush=True)
+        return
     with cond: 
-        response = message.message
-        msg = response
-        print(f"C Response delivered: {msg}")
+        if _streaming:
+            # the complete response was already printed chunk by chunk
+            print()
+            _streaming = False
+        else:
+            print(f"C Response delivered: {message.message}")
         cond.notify()
 
 def signal_handler(sig, frame):
@@ -90,15 +103,16 @@ def main():
                     file_path = default_file_path
             with open(file_path) as stream:
                 try:  
-
-                    for agent in yaml.load_all(stream, Loader=WiseAgentsLoader):
-                        agent : WiseAgent
-                        print(f'Loaded agent: {agent.name}')
-                        if agent.name == "PassThroughClientAgent1":
-                            _passThroughClientAgent1 = agent
-                            _passThroughClientAgent1.set_response_delivery(response_delivered)
-                        agent.start_agent()
-                        agent_list.append(agent)
+                    # register all the agents and tools of the file together
+                    with WiseAgentRegistry.bulk_registration():
+                        for agent in yaml.load_all(stream, Loader=WiseAgentsLoader):
+                            agent : WiseAgent
+                            print(f'Loaded agent: {agent.name}')
+                            if agent.name == "PassThroughClientAgent1":
+                                _passThroughClientAgent1 = agent
+                                _passThroughClientAgent1.set_response_delivery(response_delivered)
+                            agent.start_agent()
+                            agent_list.append(agent)
                 except yaml.YAMLError as exc:
                     traceback.print_exc()
                 print(f"registered agents= {WiseAgentRegistry.fetch_agents_metadata_dict()}")
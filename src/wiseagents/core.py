@@ -1,24 +1,36 @@
 import copy
+import hashlib
 import json
 import logging
 import os
-import pickle
+import threading
+import time
+import uuid
+import weakref
 
 from abc import abstractmethod
+from collections import OrderedDict
+from contextlib import contextmanager
 from enum import StrEnum, auto
-from typing import Any, Callable, Dict, Iterable, List, Optional
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple, Union
 
 import yaml
 from openai.types.chat import ChatCompletionToolParam, ChatCompletionMessageParam
 
+import numpy as np
 import redis
 
 from wiseagents import enforce_no_abstract_class_instances
+from wiseagents.constants import DEFAULT_EMBEDDING_MODEL_NAME
 from wiseagents.graphdb import WiseAgentGraphDB
 from wiseagents.llm import OpenaiAPIWiseAgentLLM, WiseAgentLLM
 from wiseagents.yaml import WiseAgentsYAMLObject
 from wiseagents.vectordb import WiseAgentVectorDB
 from wiseagents.wise_agent_messaging import WiseAgentMessage, WiseAgentMessageType, WiseAgentTransport, WiseAgentEvent
+from wiseagents.wise_agent_history import WiseAgentHistoryPolicy
+from wiseagents.wise_agent_routing import WiseAgentRoutingIndex
+from wiseagents.wise_agent_serialization import (WiseAgentSerializer, create_serializer, import_path,
+                                                  resolve_import_path)
 
 
 class WiseAgentCollaborationType(StrEnum):
@@ -29,12 +41,122 @@ class WiseAgentCollaborationType(StrEnum):
     CHAT = auto()
 
 
+# Return the version of a context field and, only if it differs from the version known by the caller, the field value.
+# KEYS[1] is the context hash or list holding the field, KEYS[2] the hash of versions, ARGV[1] the field and
+# ARGV[2] the known version
+_CACHED_HASH_READ_SCRIPT = """
+local version = redis.call('HGET', KEYS[2], ARGV[1]) or '0'
+if version == ARGV[2] then
+    return {version}
+end
+return {version, redis.call('HGET', KEYS[1], ARGV[1])}
+"""
+
+_CACHED_LIST_READ_SCRIPT = """
+local version = redis.call('HGET', KEYS[2], ARGV[1]) or '0'
+if version == ARGV[2] then
+    return {version}
+end
+return {version, redis.call('LRANGE', KEYS[1], 0, -1)}
+"""
+
+# Like _CACHED_LIST_READ_SCRIPT, but for lists that are only appended to: ARGV[3] is the length of the list known by
+# the caller, and only the items after it are returned, followed by the index of the first returned item
+_CACHED_LIST_TAIL_READ_SCRIPT = """
+local version = redis.call('HGET', KEYS[2], ARGV[1]) or '0'
+if version == ARGV[2] then
+    return {version}
+end
+local start = tonumber(ARGV[3])
+if redis.call('LLEN', KEYS[1]) < start then
+    start = 0
+end
+return {version, redis.call('LRANGE', KEYS[1], start, -1), start}
+"""
+
+_CACHED_SET_READ_SCRIPT = """
+local version = redis.call('HGET', KEYS[2], ARGV[1]) or '0'
+if version == ARGV[2] then
+    return {version}
+end
+return {version, redis.call('SMEMBERS', KEYS[1])}
+"""
+
+# Remove the agents and the agent instances whose heartbeat deadline passed. KEYS[1] is the sorted set of the
+# heartbeat deadlines of the agents, KEYS[2] the hash of the agents, KEYS[3] the hash of the agent embeddings,
+# KEYS[4] the sorted set of the heartbeat deadlines of the instances (<instance id>:<agent name>), ARGV[1] the
+# current time and ARGV[2] the prefix of the hashes of the agent instances. Returns the names of the dead agents
+# and the dead instances removed from the instances of their agent
+_SWEEP_DEAD_AGENTS_SCRIPT = """
+local dead = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1])
+for _, name in ipairs(dead) do
+    redis.call('ZREM', KEYS[1], name)
+    redis.call('HDEL', KEYS[2], name)
+    redis.call('HDEL', KEYS[3], name)
+    redis.call('DEL', ARGV[2] .. name)
+end
+local dead_instances = {}
+for _, member in ipairs(redis.call('ZRANGEBYSCORE', KEYS[4], '-inf', ARGV[1])) do
+    redis.call('ZREM', KEYS[4], member)
+    local separator = string.find(member, ':', 1, true)
+    if redis.call('HDEL', ARGV[2] .. string.sub(member, separator + 1), string.sub(member, 1, separator - 1)) == 1 then
+        table.insert(dead_instances, member)
+    end
+end
+return {dead, dead_instances}
+"""
+
+# Update the load of an agent instance, unless the instance has been unregistered meanwhile. KEYS[1] is the hash of
+# the agent instances, ARGV[1] the instance id and ARGV[2] the load delta
+_UPDATE_AGENT_INSTANCE_LOAD_SCRIPT = """
+if redis.call('HEXISTS', KEYS[1], ARGV[1]) == 1 then
+    return redis.call('HINCRBY', KEYS[1], ARGV[1], ARGV[2])
+end
+return nil
+"""
+
+# Remove an agent instance, and the agent itself when it was its last instance. KEYS[1] is the hash of the agent
+# instances, KEYS[2] the hash of the agents, KEYS[3] the hash of the agent embeddings, KEYS[4] the sorted set of the
+# heartbeat deadlines, KEYS[5] the sorted set of the heartbeat deadlines of the instances, ARGV[1] the instance id,
+# ARGV[2] the agent name and ARGV[3] the member of the instance in KEYS[5]
+_UNREGISTER_AGENT_INSTANCE_SCRIPT = """
+redis.call('HDEL', KEYS[1], ARGV[1])
+redis.call('ZREM', KEYS[5], ARGV[3])
+local remaining = redis.call('HLEN', KEYS[1])
+if remaining == 0 then
+    redis.call('HDEL', KEYS[2], ARGV[2])
+    redis.call('HDEL', KEYS[3], ARGV[2])
+    redis.call('ZREM', KEYS[4], ARGV[2])
+end
+return remaining
+"""
+
+# The Lua scripts registered with each redis client, by script, so that each script is registered once per client
+_registered_scripts : weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+_registered_scripts_lock = threading.Lock()
+
+
+def _get_script(redis_db: redis.Redis, script: str) -> redis.commands.core.Script:
+    '''Get the given Lua script registered with the given redis client, registering it the first time. The
+    registered script is run with EVALSHA, and loaded again if redis doesn't know it anymore.'''
+    registered = _registered_scripts.get(redis_db, {}).get(script)
+    if registered is None:
+        with _registered_scripts_lock:
+            scripts = _registered_scripts.setdefault(redis_db, {})
+            registered = scripts.get(script)
+            if registered is None:
+                registered = scripts[script] = redis_db.register_script(script)
+    return registered
+
+
 class WiseAgentTool(WiseAgentsYAMLObject):
-    ''' WiseAgentTool represents a tool that can be used by an agent to perform a specific task.'''
+    ''' WiseAgentTool represents a tool that can be used by an agent to perform a specific task.
+    The registry only stores the schema of the tool (see schema), the callback being resolved from its import path
+    by the process executing the tool.'''
     yaml_tag = u'!wiseagents.WiseAgentTool'
     
     def __init__(self, name: str, description: str, agent_tool: bool, parameters_json_schema: dict = {}, 
-                 call_back : Optional[Callable[...,str]] = None):
+                 call_back : Optional[Union[Callable[...,str], str]] = None):
        ''' Initialize the tool with the given name, description, agent tool, parameters json schema, and call back.
 
        Args:
@@ -42,7 +164,8 @@ class WiseAgentTool(WiseAgentsYAMLObject):
            description (str): a description of what the tool does
            agent_tool (bool): whether the tool is an agent tool
            parameters_json_schema (dict): the json schema for the parameters of the tool
-           call_back Optional(Callable[...,str]): the callback function to execute the tool'''     
+           call_back Optional(Union[Callable[...,str], str]): the callback function to execute the tool, or its
+           import path (module:function)'''     
        self._name = name
        self._description = description
        self._parameters_json_schema = parameters_json_schema
@@ -61,6 +184,33 @@ class WiseAgentTool(WiseAgentsYAMLObject):
         return cls(name=data.get('_name'), description=data.get('_description'), 
                    parameters_json_schema=data.get('_parameters_json_schema'),
                    call_back=data.get('_call_back'))
+
+    @classmethod
+    def from_schema(cls, schema: dict) -> 'WiseAgentTool':
+        '''Create the tool described by the given schema, as returned by the schema property, without registering it.
+
+        Args:
+            schema (dict): the schema of the tool
+
+        Returns:
+            WiseAgentTool: the tool'''
+        tool = cls.__new__(cls)
+        function = schema["tool_param"]["function"]
+        tool._name = function["name"]
+        tool._description = function["description"]
+        tool._parameters_json_schema = function.get("parameters", {})
+        tool._agent_tool = schema["agent_tool"]
+        tool._call_back = schema["call_back"]
+        tool._local_call_back = schema.get("local_call_back", False)
+        tool._schema = schema
+        return tool
+
+    def __getstate__(self) -> dict:
+        '''Return the state of the tool, without its cached schema.'''
+        state = dict(super().__getstate__())
+        state.pop("schema", None)
+        state.pop("local_call_back", None)
+        return state
     
     @property
     def name(self) -> str:
@@ -74,8 +224,33 @@ class WiseAgentTool(WiseAgentsYAMLObject):
     
     @property
     def call_back(self) -> Callable[...,str]:
-        """Get the callback function of the tool."""
+        """Get the callback function of the tool, resolving it from its import path if needed."""
+        if isinstance(self._call_back, str):
+            call_back = resolve_import_path(self._call_back)
+            if call_back is None:
+                raise ValueError(f"Can't resolve the callback {self._call_back} of the tool {self.name}")
+            self._call_back = call_back
         return self._call_back
+
+    @property
+    def call_back_path(self) -> Optional[str]:
+        """Get the import path of the callback function of the tool, None if it has none or it can't be imported."""
+        if self._call_back is None or isinstance(self._call_back, str):
+            return self._call_back
+        path = import_path(self._call_back)
+        if resolve_import_path(path) is not self._call_back:
+            return None
+        return path
+
+    @property
+    def has_local_call_back(self) -> bool:
+        """Whether the tool has a callback which can't be imported, e.g. a lambda, a closure or a function of
+        __main__, and can therefore only be executed by the process registering the tool."""
+        local_call_back = getattr(self, "_local_call_back", None)
+        if local_call_back is None:
+            local_call_back = self._call_back is not None and self.call_back_path is None
+        return local_call_back
+
     @property
     def json_schema(self) -> dict:
         """Get the json schema of the tool."""
@@ -85,31 +260,123 @@ class WiseAgentTool(WiseAgentsYAMLObject):
     def is_agent_tool(self) -> bool:
         """Get the agent tool of the tool."""
         return self._agent_tool
+
+    @property
+    def schema(self) -> dict:
+        """
+        Get the schema of the tool stored by the registry: the tool in the form of a ChatCompletionToolParam
+        (tool_param), whether it is an agent tool (agent_tool), the import path of its callback (call_back),
+        whether its callback can only be executed by the process registering it (local_call_back) and a hash of all
+        of them (hash).
+        """
+        schema = getattr(self, "_schema", None)
+        if schema is None:
+            schema = {"tool_param": {"type": "function",
+                                     "function": {
+                                         "name": self.name,
+                                         "description": self.description,
+                                         "parameters": self.json_schema
+                                     }},
+                      "agent_tool": self.is_agent_tool,
+                      "call_back": self.call_back_path,
+                      "local_call_back": self.has_local_call_back}
+            schema["hash"] = hashlib.sha256(json.dumps(schema, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+            self._schema = schema
+        return schema
+
+    @property
+    def hash(self) -> str:
+        """Get the hash of the schema of the tool, which changes when the tool changes."""
+        return self.schema["hash"]
        
     def get_tool_OpenAI_format(self) -> ChatCompletionToolParam:
-        '''The tool should be able to return itself in the form of a ChatCompletionToolParam
+        '''The tool should be able to return itself in the form of a ChatCompletionToolParam.
+        The returned dict is computed once and shared, so it must not be modified.
         
         Returns:
             ChatCompletionToolParam'''
-        return {"type": "function",
-                "function": {
-                "name": self.name,
-                "description": self.description,
-                "parameters": self.json_schema
-                } 
-        }
+        return self.schema["tool_param"]
     
     def default_call_back(self, **kwargs) -> str:
         '''The tool should be able to execute the function with the given parameters'''
         return json.dumps(kwargs)
     
     def exec(self, **kwargs) -> str:
-        '''The tool should be able to execute the function with the given parameters'''
+        '''The tool should be able to execute the function with the given parameters.
+        Raises ValueError in the processes which did not register the tool when its callback can't be imported.'''
         if self.call_back is None:
+            if self.has_local_call_back:
+                raise ValueError(f"The callback of the tool {self.name} can't be imported, it can only be executed "
+                                 f"by the process registering the tool")
             return self.default_call_back(**kwargs)
         return self.call_back(**kwargs)
 
 
+class _ContextValuesCache():
+    '''
+    A per-process LRU cache of the context fields read from redis, mapping (context name, creation time, field) to
+    (version, value). It keeps at most context_values_cache_size fields (default 4096), and indexes them by context
+    name, so that the fields of a removed context are evicted without scanning the whole cache.
+    It is shared by the context handles of the process, which are used by several threads.
+    '''
+
+    def __init__(self):
+        self._entries : OrderedDict[Tuple[str, float, str], Tuple[int, Any]] = OrderedDict()
+        self._keys_by_context : Dict[str, set[Tuple[str, float, str]]] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: Tuple[str, float, str]) -> Optional[Tuple[int, Any]]:
+        '''Get the version and value of the given field, None if it is not cached.'''
+        with self._lock:
+            cached = self._entries.get(key)
+            if cached is not None:
+                self._entries.move_to_end(key)
+            return cached
+
+    def put(self, key: Tuple[str, float, str], version: int, value: Any):
+        '''Cache the version and value of the given field, evicting the least recently used fields beyond
+        the size of the cache.'''
+        max_size = WiseAgentRegistry.get_config().get("context_values_cache_size", 4096)
+        if WiseAgentRegistry._registry_listener is None:
+            # the other processes notify the removal of the contexts
+            WiseAgentRegistry._start_registry_listener()
+        with self._lock:
+            self._entries[key] = (version, value)
+            self._entries.move_to_end(key)
+            self._keys_by_context.setdefault(key[0], set()).add(key)
+            while len(self._entries) > max_size:
+                self._discard(self._entries.popitem(last=False)[0])
+
+    def pop(self, key: Tuple[str, float, str]):
+        '''Evict the given field.'''
+        with self._lock:
+            if self._entries.pop(key, None) is not None:
+                self._discard(key)
+
+    def evict_context(self, context_name: str):
+        '''Evict the fields of the given context.'''
+        with self._lock:
+            for key in self._keys_by_context.pop(context_name, ()):
+                self._entries.pop(key, None)
+
+    def clear(self):
+        '''Evict all the fields.'''
+        with self._lock:
+            self._entries.clear()
+            self._keys_by_context.clear()
+
+    def _discard(self, key: Tuple[str, float, str]):
+        '''Remove the given evicted field from the index.'''
+        keys = self._keys_by_context.get(key[0])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._keys_by_context[key[0]]
+
+
 class WiseAgentContext():
     
     ''' A WiseAgentContext is a class that represents a context in which agents can communicate with each other.
@@ -134,6 +401,10 @@ class WiseAgentContext():
     # Used by both a sequential coordinator and a phased coordinator
     _route_response_to : str = None
 
+    # The id of the request the final response answers, i.e. its correlation id
+    # Used by both a sequential coordinator and a phased coordinator
+    _route_response_correlation_id : Optional[str] = None
+
     # A list that contains a list of agent names to be executed for each phase
     # Used by a phased coordinator
     _agent_phase_assignments : List[List[str]] = []
@@ -159,18 +430,47 @@ class WiseAgentContext():
     _use_redis : bool = False
     _config : Dict[str, Any] = {}
     _trace_enabled : bool = False
+    _parent_name : Optional[str] = None
+    _created_at : float = 0
+
+    # The fields that are stored in redis as native lists (one redis list per field)
+    # rather than as serialized values in the context hash
+    _REDIS_LIST_FIELDS = ("message_trace", "llm_chat_completion", "llm_required_tool_call",
+                          "llm_available_tools_in_chat", "queries")
 
+    # The list fields that are only appended to, so that only their new items need to be read from redis
+    _REDIS_APPEND_ONLY_LIST_FIELDS = ("message_trace", "llm_chat_completion", "llm_available_tools_in_chat", "queries")
 
-    def __init__(self, name: str, config : Optional[Dict[str,Any]] = {"use_redis": False}):
+    # The fields holding the state of the context when redis is not used
+    _IN_MEMORY_FIELDS = ("_message_trace", "_llm_chat_completion", "_llm_required_tool_call",
+                         "_llm_available_tools_in_chat", "_agents_sequence", "_route_response_to",
+                         "_route_response_correlation_id", "_agent_phase_assignments", "_current_phase",
+                         "_required_agents_for_current_phase", "_queries", "_collaboration_type", "_restart_sequence")
+
+    # The fields that are stored in redis as native sets, so that members can be removed atomically
+    _REDIS_SET_FIELDS = ("required_agents_for_current_phase",)
+
+    # A per-process cache of the fields read from redis. Every write bumps the version of the field in redis, so a
+    # cached value is refetched only when it changed. The creation time in the keys tells apart contexts created again
+    # with the same name
+    _redis_cache : _ContextValuesCache = _ContextValuesCache()
+
+
+    def __init__(self, name: str, config : Optional[Dict[str,Any]] = {"use_redis": False},
+                 parent_name: Optional[str] = None):
         ''' Initialize the context with the given name.
 
         Args:
-            name (str): the name of the context'''
+            name (str): the name of the context
+            config (Optional[Dict[str,Any]]): the registry configuration
+            parent_name (Optional[str]): the name of the parent context if this is a sub context'''
         self._name = name
         self._config = config
+        self._parent_name = parent_name
+        self._created_at = time.time()
         WiseAgentRegistry.register_context(self)
         if config.get("use_redis") == True and self._redis_db is None:
-            self._redis_db = redis.Redis(host=self._config["redis_host"], port=self._config["redis_port"])
+            self._redis_db = WiseAgentRegistry.get_redis_db()
             self._use_redis = True
         if (config.get("trace_enabled") == True):
             self._trace_enabled = True
@@ -189,74 +489,300 @@ class WiseAgentContext():
     
     def __getstate__(self) -> object:
         '''Get the state of the context.'''
-        state = super().__getstate__()
+        state = dict(super().__getstate__())
         if '_redis_db' in state:
             del state['_redis_db']
             del state['_use_redis']
+        state.pop('_thread_local', None)
+        state.pop('_lock', None)
         return state
     
     def __setstate__(self, state: object):
         '''Set the state of the context.'''
         self.__dict__.update(state)
         if self._config.get("use_redis") == True and self._redis_db is None:
-            self._redis_db = redis.Redis(host=self._config["redis_host"], port=self._config["redis_port"])
+            self._redis_db = WiseAgentRegistry.get_redis_db()
             self._use_redis = True
 
+    @classmethod
+    def from_descriptor(cls, descriptor: Dict[str, Any], config: Dict[str, Any]) -> 'WiseAgentContext':
+        '''Create a handle to a context that is already registered from its descriptor, without registering it again.
+
+        Args:
+            descriptor (Dict[str, Any]): the descriptor of the context, as returned by the descriptor property
+            config (Dict[str, Any]): the registry configuration
+        Returns:
+            WiseAgentContext: the context handle'''
+        context = cls.__new__(cls)
+        context._name = descriptor["name"]
+        context._parent_name = descriptor.get("parent_name")
+        context._created_at = descriptor.get("created_at", 0)
+        context._config = config
+        if config.get("use_redis") == True:
+            context._redis_db = WiseAgentRegistry.get_redis_db()
+            context._use_redis = True
+        if (config.get("trace_enabled") == True):
+            context._trace_enabled = True
+        return context
+
+    @property
+    def descriptor(self) -> Dict[str, Any]:
+        '''Get the descriptor of the context stored by the registry: the name, the parent name and the creation time.'''
+        return {"name": self._name, "parent_name": self._parent_name, "created_at": self._created_at}
+
+    @property
+    def _batch_state(self) -> threading.local:
+        '''Get the state of the batch of the current thread. It is per thread because a context handle
+        can be shared by the threads of the process.'''
+        local = self.__dict__.get("_thread_local")
+        if local is None:
+            local = self.__dict__.setdefault("_thread_local", threading.local())
+        return local
+
+    @property
+    def _in_memory_lock(self) -> threading.RLock:
+        '''Get the lock of the in-memory state of the context, which the mutations hold, and a batch for its whole
+        block. It is reentrant so that the mutations can be made within a batch.'''
+        lock = self.__dict__.get("_lock")
+        if lock is None:
+            lock = self.__dict__.setdefault("_lock", threading.RLock())
+        return lock
+
+    @property
+    def _batch_pipeline(self) -> Optional[redis.client.Pipeline]:
+        '''Get the redis pipeline buffering the mutations of the current batch, if any.'''
+        return getattr(self._batch_state, "pipeline", None)
+
+    @_batch_pipeline.setter
+    def _batch_pipeline(self, pipeline: Optional[redis.client.Pipeline]):
+        self._batch_state.pipeline = pipeline
+
+    @property
+    def _batch_keys(self) -> List[str]:
+        '''Get the fields modified by the current batch.'''
+        return getattr(self._batch_state, "keys", [])
+
+    @_batch_keys.setter
+    def _batch_keys(self, keys: List[str]):
+        self._batch_state.keys = keys
+
+    @property
+    def _batch_values(self) -> Dict[str, Any]:
+        '''Get the values of the hash fields set by the current batch.'''
+        return getattr(self._batch_state, "values", {})
+
+    @_batch_values.setter
+    def _batch_values(self, values: Dict[str, Any]):
+        self._batch_state.values = values
+
+    @property
+    def _serializer(self) -> WiseAgentSerializer:
+        '''Get the serializer used for the values stored in redis.'''
+        return WiseAgentRegistry.get_serializer()
+
+    def _redis_key(self, key: str) -> str:
+        '''Get the name of the redis key holding the given field of the context.'''
+        return f"{self.name}:{key}"
+
+    def _cache_key(self, key: str) -> Tuple[str, float, str]:
+        '''Get the key of the given field of the context in the local cache.'''
+        return (self.name, self._created_at, key)
+
+    def _redis_pipeline(self) -> redis.client.Pipeline:
+        '''Get the pipeline to use for a write, i.e. the pipeline of the current batch if any or a new transaction.'''
+        if self._batch_pipeline is not None:
+            return self._batch_pipeline
+        return self._redis_db.pipeline(transaction=True)
+
+    def _execute_redis_write(self, pipe: redis.client.Pipeline, keys: List[str]) -> Optional[List[Any]]:
+        '''Bump the version of the given fields and execute the pipeline.
+        Within a batch the write is only buffered and will be executed when the batch is flushed.
+
+        Args:
+            pipe (redis.client.Pipeline): the pipeline holding the write commands
+            keys (List[str]): the fields modified by the write commands
+        Returns:
+            Optional[List[Any]]: the results of the write commands followed by the new version of each field,
+            or None if the write was buffered in a batch'''
+        if self._batch_pipeline is not None:
+            self._batch_keys.extend(key for key in keys if key not in self._batch_keys)
+            return None
+        for key in keys:
+            pipe.hincrby(self._redis_key("versions"), key, 1)
+        return pipe.execute()
+
+    def _set_redis_value(self, key: str, stored_value: Any, value: Any):
+        '''Set a field of the context hash in redis and update the local cache.
+
+        Args:
+            key (str): the field to set
+            stored_value (Any): the value as stored in redis
+            value (Any): the value as returned by the getter'''
+        pipe = self._redis_pipeline()
+        pipe.hset(self.name, key, value=stored_value)
+        if self._batch_pipeline is not None:
+            self._batch_values[key] = copy.copy(value)
+        redis_return = self._execute_redis_write(pipe, [key])
+        if redis_return is not None:
+            self._redis_cache.put(self._cache_key(key), redis_return[-1], copy.copy(value))
+
     def _append_to_redis_list(self, key: str, value: Any):
-        '''Append a value to a list in redis.'''
-        pipe = self._redis_db.pipeline(transaction=True)
-        while True:
-            pipe.watch(self.name)
-            try:
-                if(pipe.hexists(self.name, key) == False):
-                    pipe.multi()
-                    pipe.hset(self.name, key, value=pickle.dumps([value]))
-                    pipe.execute()
-                    return
-                else:
-                    redis_stored_messages = pipe.hget(self.name, key)
-                    stored_messages : List  = pickle.loads(redis_stored_messages)
-                    stored_messages.append(value)
-                    pipe.multi()
-                    pipe.hset(self.name, key, value=pickle.dumps(stored_messages))
-                    pipe.execute()
-                    return
-            except redis.WatchError:
-                logging.debug("WatchError in append_to_redis_list for {key}")
-                continue
+        '''Append a value to a list in redis. RPUSH is atomic, so no optimistic locking is needed.'''
+        pipe = self._redis_pipeline()
+        pipe.rpush(self._redis_key(key), self._serializer.dumps(value))
+        redis_return = self._execute_redis_write(pipe, [key])
+        if redis_return is None:
+            return
+        version = redis_return[-1]
+        cached = self._redis_cache.get(self._cache_key(key))
+        if cached is not None and cached[0] == version - 1:
+            # nobody else modified the list since it was cached, so the cache can be extended locally
+            self._redis_cache.put(self._cache_key(key), version, cached[1] + (copy.copy(value),))
+
     def _remove_from_redis_list(self, key: str, value: Any):
-        '''Remove a value to a list in redis.'''
-        pipe = self._redis_db.pipeline(transaction=True)
-        while True:
-            pipe.watch(self.name)
-            try:
-                if(pipe.hexists(self.name, key) == False):
-                    pipe.unwatch()
-                    return
-                else:
-                    redis_stored_messages = pipe.hget(self.name, key)
-                    stored_messages : List  = pickle.loads(redis_stored_messages)
-                    stored_messages.remove(value)
-                    pipe.multi()
-                    pipe.hset(self.name, key, value=pickle.dumps(stored_messages))
-                    pipe.execute()
-                    return
-            except redis.WatchError:
-                logging.debug("WatchError in remove_from_redis_list for {key}")
-                continue
+        '''Remove the first occurrence of a value from a list in redis.'''
+        pipe = self._redis_pipeline()
+        pipe.lrem(self._redis_key(key), 1, self._serializer.dumps(value))
+        self._execute_redis_write(pipe, [key])
+
+    @contextmanager
+    def batch(self):
+        '''Buffer the mutations of the context made within a with block and apply them together when the block exits.
+
+        In redis mode the buffered mutations are sent as a single MULTI/EXEC transaction, so they cost a single
+        round trip and other agents see either all or none of them. If the block raises an exception, the
+        buffered mutations are discarded. Within the block, getters of hash fields (e.g. get_agent_phase_assignments)
+        return the buffered values, while getters of list fields (e.g. llm_chat_completion) don't see the
+        buffered appends yet. Nested batches are merged into the outermost one.
+        In memory the block holds the lock of the context, so that the mutations of the other threads wait for it
+        to exit, and if it raises an exception the fields are restored to their values before the block.
+
+        Example:
+            with ctx.batch():
+                ctx.set_collaboration_type(WiseAgentCollaborationType.SEQUENTIAL)
+                ctx.set_agents_sequence(agents)
+                ctx.set_route_response_to(request.sender)
+        '''
+        if not self._use_redis:
+            with self._in_memory_lock:
+                # the lists are mutated in place, so the block mutates copies and the originals are restored
+                previous = {field: getattr(self, field) for field in self._IN_MEMORY_FIELDS}
+                for field, value in previous.items():
+                    setattr(self, field, copy.copy(value))
+                try:
+                    yield self
+                except BaseException:
+                    for field, value in previous.items():
+                        setattr(self, field, value)
+                    raise
+            return
+        if self._batch_pipeline is not None:
+            yield self
+            return
+        self._batch_pipeline = self._redis_db.pipeline(transaction=True)
+        self._batch_keys = []
+        self._batch_values = {}
+        try:
+            yield self
+            if self._batch_keys:
+                for key in self._batch_keys:
+                    self._batch_pipeline.hincrby(self._redis_key("versions"), key, 1)
+                versions = self._batch_pipeline.execute()[-len(self._batch_keys):]
+                for key, version in zip(self._batch_keys, versions):
+                    if key in self._batch_values:
+                        self._redis_cache.put(self._cache_key(key), version, self._batch_values[key])
+                    elif key not in self._REDIS_APPEND_ONLY_LIST_FIELDS:
+                        self._redis_cache.pop(self._cache_key(key))
+        finally:
+            self._batch_pipeline.reset()
+            self._batch_pipeline = None
+            self._batch_keys = []
+            self._batch_values = {}
+
+    def _get_cached_from_redis(self, key: str, script: str, redis_key: str, decode: Callable[[Any], Any]) -> Any:
+        '''Get a field of the context from the local cache, fetching it from redis only if its version has changed.
+
+        Args:
+            key (str): the field to get
+            script (str): the Lua script returning the version of the field and, if it changed, its stored value
+            redis_key (str): the redis key holding the field
+            decode (Callable[[Any], Any]): the function converting the stored value to the value returned by the getter
+        Returns:
+            Any: the value of the field'''
+        if self._batch_pipeline is not None and key in self._batch_values:
+            return self._batch_values[key]
+        cached = self._redis_cache.get(self._cache_key(key))
+        known_version = cached[0] if cached is not None else -1
+        redis_return = _get_script(self._redis_db, script)(keys=[redis_key, self._redis_key("versions")],
+                                                              args=[key, known_version])
+        if len(redis_return) == 1:
+            return cached[1]
+        self._check_version(cached, redis_return[0])
+        value = decode(redis_return[1])
+        self._redis_cache.put(self._cache_key(key), int(redis_return[0]), value)
+        return value
+
+    def _check_version(self, cached: Optional[Tuple[int, Any]], version: bytes):
+        '''Evict the cached fields of the context when a field that was cached has no version anymore, i.e. the
+        context was removed, in case the notification of its removal was missed.'''
+        if cached is not None and cached[0] > 0 and int(version) == 0:
+            self._redis_cache.evict_context(self.name)
 
     def _get_list_from_redis(self, key: str) -> List:
         '''Get a list from redis.'''
-        redis_return =  self._redis_db.hget(self.name, key)
-        if (redis_return is not None):
-            return pickle.loads(redis_return)
-        else:
-            return []
+        if key in self._REDIS_APPEND_ONLY_LIST_FIELDS:
+            return list(self._get_appended_list_from_redis(key))
+        return list(self._get_cached_from_redis(key, _CACHED_LIST_READ_SCRIPT, self._redis_key(key),
+                                                lambda items: [self._serializer.loads(item) for item in items]))
+
+    def _get_appended_list_from_redis(self, key: str) -> Tuple:
+        '''Get a list that is only appended to from redis, reading and deserializing only the items appended since
+        the list was cached. The items are cached as a tuple, which is replaced rather than extended in place, since
+        it is shared by the threads of the process.'''
+        cached = self._redis_cache.get(self._cache_key(key))
+        known_version, items = cached if cached is not None else (-1, ())
+        redis_return = _get_script(self._redis_db, _CACHED_LIST_TAIL_READ_SCRIPT)(
+            keys=[self._redis_key(key), self._redis_key("versions")], args=[key, known_version, len(items)])
+        if len(redis_return) == 1:
+            return items
+        self._check_version(cached, redis_return[0])
+        items = items[:int(redis_return[2])] + tuple(self._serializer.loads(item) for item in redis_return[1])
+        self._redis_cache.put(self._cache_key(key), int(redis_return[0]), items)
+        return items
+
+    def _get_set_from_redis(self, key: str) -> List[str]:
+        '''Get the members of a set of strings from redis.'''
+        return list(self._get_cached_from_redis(key, _CACHED_SET_READ_SCRIPT, self._redis_key(key),
+                                                lambda members: [member.decode("utf-8") for member in members]))
+
+    def _get_value_from_redis(self, key: str, decode: Callable[[Optional[bytes]], Any]) -> Any:
+        '''Get a field of the context hash from redis.'''
+        return self._get_cached_from_redis(key, _CACHED_HASH_READ_SCRIPT, self.name, decode)
+
+    def _get_serialized_list_from_redis(self, key: str) -> List:
+        '''Get a list that is stored as a single serialized value in the context hash.'''
+        return list(self._get_value_from_redis(key, lambda value: self._serializer.loads(value) if value is not None else []))
+
+    def _delete_redis_data(self):
+        '''Delete the hash, the versions, the children index and all the list and set fields of the context from redis.'''
+        self._redis_db.delete(self.name, self._redis_key("versions"), self._redis_key("children"),
+                              *[self._redis_key(key) for key in self._REDIS_LIST_FIELDS + self._REDIS_SET_FIELDS])
+        self._redis_cache.evict_context(self.name)
 
     @property   
     def name(self) -> str:
         """Get the name of the context."""
         return self._name
+
+    @property
+    def parent_name(self) -> Optional[str]:
+        """Get the name of the parent context or None if this is not a sub context."""
+        return self._parent_name
+
+    @property
+    def created_at(self) -> float:
+        """Get the time the context was created at, in seconds since the epoch."""
+        return self._created_at
     
     @property
     def trace_enabled(self) -> bool:
@@ -277,7 +803,8 @@ class WiseAgentContext():
             if (self._use_redis == True):
                 self._append_to_redis_list("message_trace", message.__repr__())
             else:
-                self._message_trace.append(message)   
+                with self._in_memory_lock:
+                    self._message_trace.append(message)
                 
     
     @property
@@ -289,6 +816,20 @@ class WiseAgentContext():
             return self._llm_chat_completion   
             
     
+    def get_chat_completion_since(self, index: int) -> List[ChatCompletionMessageParam]:
+        '''Get the chat completion messages appended to the context after the first index messages.
+        This allows to keep a local copy of the chat completion up to date reading only the new messages.
+
+        Args:
+            index (int): the number of messages already known by the caller
+
+        Returns:
+            List[ChatCompletionMessageParam]: the messages from the given index on'''
+        if (self._use_redis == True):
+            return list(self._get_appended_list_from_redis("llm_chat_completion")[index:])
+        else:
+            return self._llm_chat_completion[index:]
+
     def append_chat_completion(self, messages: Iterable[ChatCompletionMessageParam]):
         '''Append chat completion to the context.
 
@@ -298,7 +839,8 @@ class WiseAgentContext():
         if (self._use_redis == True):
             self._append_to_redis_list("llm_chat_completion", messages)
         else:
-            self._llm_chat_completion.append(messages)
+            with self._in_memory_lock:
+                self._llm_chat_completion.append(messages)
 
 
     @property
@@ -318,7 +860,8 @@ class WiseAgentContext():
         if (self._use_redis == True):
             self._append_to_redis_list("llm_required_tool_call", tool_name)
         else:
-            self._llm_required_tool_call.append(tool_name)
+            with self._in_memory_lock:
+                self._llm_required_tool_call.append(tool_name)
     
     def remove_required_tool_call(self, tool_name: str):
         '''Remove required tool call from the context.
@@ -328,7 +871,8 @@ class WiseAgentContext():
         if (self._use_redis == True):
             self._remove_from_redis_list("llm_required_tool_call", tool_name) #remove first occurence of tool_name
         else:
-            self._llm_required_tool_call.remove(tool_name) #remove first occurence of tool_name
+            with self._in_memory_lock:
+                self._llm_required_tool_call.remove(tool_name) #remove first occurence of tool_name
         
     @property
     def llm_available_tools_in_chat(self) -> List[ChatCompletionToolParam]:
@@ -346,7 +890,8 @@ class WiseAgentContext():
         if (self._use_redis == True):
             self._append_to_redis_list("llm_available_tools_in_chat", tools)
         else:
-            self._llm_available_tools_in_chat.append(tools)
+            with self._in_memory_lock:
+                self._llm_available_tools_in_chat.append(tools)
     
     def get_agents_sequence(self) -> List[str]:
         """
@@ -359,7 +904,7 @@ class WiseAgentContext():
             List[str]: the sequence of agents names or an empty list if no sequence has been set for this context
         """
         if (self._use_redis == True):
-            return self._get_list_from_redis("agents_sequence")
+            return self._get_serialized_list_from_redis("agents_sequence")
         else:
             return self._agents_sequence
 
@@ -373,9 +918,10 @@ class WiseAgentContext():
             agents_sequence (List[str]): the sequence of agent names
         """
         if (self._use_redis == True):
-            self._redis_db.hset(self.name, "agents_sequence", pickle.dumps(agents_sequence))
+            self._set_redis_value("agents_sequence", self._serializer.dumps(agents_sequence), agents_sequence)
         else:
-            self._agents_sequence = agents_sequence
+            with self._in_memory_lock:
+                self._agents_sequence = agents_sequence
 
     def get_route_response_to(self) -> Optional[str]:
         """
@@ -386,7 +932,8 @@ class WiseAgentContext():
             Optional[str]: the name of the agent where the final response should be routed to or None if no agent is set
         """
         if (self._use_redis == True):
-            return self._redis_db.hget(self.name, "route_response_to").decode("utf-8")
+            return self._get_value_from_redis("route_response_to",
+                                              lambda value: value.decode("utf-8") if value is not None else None)
         else: 
             return self._route_response_to
             
@@ -399,9 +946,38 @@ class WiseAgentContext():
             agent (str): the name of the agent where the final response should be routed to
         """
         if (self._use_redis == True):
-            self._redis_db.hset(self.name, "route_response_to", agent)
+            self._set_redis_value("route_response_to", agent, agent)
+        else:
+            with self._in_memory_lock:
+                self._route_response_to = agent
+
+    def get_route_response_correlation_id(self) -> Optional[str]:
+        """
+        Get the id of the request the final response for this context answers, which is the correlation id of the
+        final response. This is used by a sequential coordinator and a phased coordinator.
+
+        Returns:
+            Optional[str]: the id of the request the final response answers or None if it is not set
+        """
+        if (self._use_redis == True):
+            return self._get_value_from_redis("route_response_correlation_id",
+                                              lambda value: value.decode("utf-8") if value is not None else None)
+        else:
+            return self._route_response_correlation_id
+
+    def set_route_response_correlation_id(self, correlation_id: str):
+        """
+        Set the id of the request the final response for this context answers, which is the correlation id of the
+        final response. This is used by a sequential coordinator and a phased coordinator.
+
+        Args:
+            correlation_id (str): the id of the request the final response answers
+        """
+        if (self._use_redis == True):
+            self._set_redis_value("route_response_correlation_id", correlation_id, correlation_id)
         else:
-            self._route_response_to = agent
+            with self._in_memory_lock:
+                self._route_response_correlation_id = correlation_id
 
     def get_next_agent_in_sequence(self, current_agent: str):
         """
@@ -437,7 +1013,7 @@ class WiseAgentContext():
             given chat uuid
         """
         if (self._use_redis == True):
-            return self._get_list_from_redis("agent_phase_assignments")
+            return self._get_serialized_list_from_redis("agent_phase_assignments")
         else:
             return self._agent_phase_assignments
 
@@ -450,12 +1026,17 @@ class WiseAgentContext():
         Args:
             agent_phase_assignments (List[List[str]]): The agents to be executed in each phase, represented as a
             list of lists, where the size of the outer list corresponds to the number of phases and each element
-            in the list is a list of agent names for that phase.
+            in the list is a list of agent names for that phase. An agent assigned several times to a phase is
+            only kept once, since each agent is required once per phase.
         """
+        # the required agents of the current phase are a set, in which the duplicates would collapse
+        agent_phase_assignments = [list(dict.fromkeys(phase)) for phase in agent_phase_assignments]
         if (self._use_redis == True):
-            self._redis_db.hset(self.name, "agent_phase_assignments", value=pickle.dumps(agent_phase_assignments))
+            self._set_redis_value("agent_phase_assignments", self._serializer.dumps(agent_phase_assignments),
+                                  agent_phase_assignments)
         else:
-            self._agent_phase_assignments = agent_phase_assignments
+            with self._in_memory_lock:
+                self._agent_phase_assignments = agent_phase_assignments
 
     def get_current_phase(self) -> int:
         """
@@ -468,11 +1049,8 @@ class WiseAgentContext():
             int: the current phase, represented as an integer in the zero-indexed list of phases
         """
         if (self._use_redis == True):
-            redis_return = self._redis_db.hget(self.name, "current_phase")
-            if redis_return is not None:
-                return pickle.loads(redis_return)
-            else:
-                return None
+            return self._get_value_from_redis("current_phase",
+                                              lambda value: self._serializer.loads(value) if value is not None else None)
         else:
             return self._current_phase
 
@@ -485,13 +1063,20 @@ class WiseAgentContext():
             phase (int): the current phase, represented as an integer in the zero-indexed list of phases
         """
         if (self._use_redis == True):
-            pipeline=self._redis_db.pipeline(transaction=True)
-            pipeline.hset(self.name, "current_phase", pickle.dumps(phase))
-            pipeline.hset(self.name, "required_agents_for_current_phase", value=pickle.dumps(self.get_agent_phase_assignments()[phase]))
-            pipeline.execute()
+            required_agents_key = self._redis_key("required_agents_for_current_phase")
+            required_agents = self.get_agent_phase_assignments()[phase]
+            pipeline=self._redis_pipeline()
+            pipeline.hset(self.name, "current_phase", self._serializer.dumps(phase))
+            pipeline.delete(required_agents_key)
+            if required_agents:
+                pipeline.sadd(required_agents_key, *required_agents)
+            if self._batch_pipeline is not None:
+                self._batch_values["current_phase"] = phase
+            self._execute_redis_write(pipeline, ["current_phase", "required_agents_for_current_phase"])
         else:
-            self._current_phase = phase
-            self._required_agents_for_current_phase = copy.deepcopy(self._agent_phase_assignments[phase])
+            with self._in_memory_lock:
+                self._current_phase = phase
+                self._required_agents_for_current_phase = copy.deepcopy(self._agent_phase_assignments[phase])
 
     def get_agents_for_next_phase(self) -> Optional[List]:
         """
@@ -522,23 +1107,40 @@ class WiseAgentContext():
             if there are no remaining agents that need to be executed for the current phase
         """
         if (self._use_redis == True):
-            return self._get_list_from_redis("required_agents_for_current_phase")
+            return self._get_set_from_redis("required_agents_for_current_phase")
         else:
             return self._required_agents_for_current_phase
 
-    def remove_required_agent_for_current_phase(self, agent_name: str):
+    def remove_required_agent_for_current_phase(self, agent_name: str) -> bool:
         """
         Remove the given agent from the list of required agents for the current phase for this
         context. This is used by a phased coordinator.
+        In redis mode the removal and the check of the remaining agents are done atomically in a single
+        round trip, so when the agents of a phase complete concurrently exactly one of the calls returns True.
 
         Args:
-            chat_uuid (str): the chat uuid
             agent_name (str): the name of the agent to remove
+
+        Returns:
+            bool: True if the agent was removed by this call and it was the last required agent for the current
+            phase, False otherwise
         """
         if (self._use_redis == True):
-            self._remove_from_redis_list("required_agents_for_current_phase", agent_name)
+            key = "required_agents_for_current_phase"
+            pipeline = self._redis_pipeline()
+            pipeline.srem(self._redis_key(key), agent_name)
+            pipeline.scard(self._redis_key(key))
+            redis_return = self._execute_redis_write(pipeline, [key])
+            if redis_return is None:
+                raise ValueError("The required agents for the current phase can't be removed within a batch")
+            removed, remaining = redis_return[0], redis_return[1]
+            return removed == 1 and remaining == 0
         else:
-            self._required_agents_for_current_phase.remove(agent_name)
+            with self._in_memory_lock:
+                if agent_name not in self._required_agents_for_current_phase:
+                    return False
+                self._required_agents_for_current_phase.remove(agent_name)
+                return len(self._required_agents_for_current_phase) == 0
 
     def get_current_query(self) -> Optional[str]:
         """
@@ -551,7 +1153,12 @@ class WiseAgentContext():
             Optional[str]: the current query or None if there is no current query
         """
         if (self._use_redis == True):
-            return self._get_list_from_redis("queries")[0]
+            # return the last query
+            redis_return = self._redis_db.lindex(self._redis_key("queries"), -1)
+            if redis_return is not None:
+                return self._serializer.loads(redis_return)
+            else:
+                return None
         else:
             if self._queries:
                 # return the last query
@@ -570,7 +1177,8 @@ class WiseAgentContext():
         if (self._use_redis == True):
             self._append_to_redis_list("queries", query)
         else:
-            self._queries.append(query)
+            with self._in_memory_lock:
+                self._queries.append(query)
 
     def get_queries(self) -> List[str]:
         """
@@ -589,11 +1197,9 @@ class WiseAgentContext():
     def collaboration_type(self) -> WiseAgentCollaborationType:
         """Get the collaboration type for this context."""
         if (self._use_redis == True):
-            collaboration_type = self._redis_db.hget(self.name, "collaboration_type")
-            if (collaboration_type is not None):
-                return WiseAgentCollaborationType(collaboration_type.decode("utf-8"))
-            else:
-                return WiseAgentCollaborationType.INDEPENDENT   
+            return self._get_value_from_redis("collaboration_type",
+                                              lambda value: WiseAgentCollaborationType(value.decode("utf-8"))
+                                              if value is not None else WiseAgentCollaborationType.INDEPENDENT)
         else:
             return self._collaboration_type
 
@@ -606,9 +1212,10 @@ class WiseAgentContext():
         """
             
         if (self._use_redis == True):
-            self._redis_db.hset(self.name, "collaboration_type", value=collaboration_type.value)
+            self._set_redis_value("collaboration_type", collaboration_type.value, collaboration_type)
         else:
-            self._collaboration_type = collaboration_type
+            with self._in_memory_lock:
+                self._collaboration_type = collaboration_type
     
     def set_restart_sequence(self, restart_sequence: bool):
         """
@@ -619,9 +1226,10 @@ class WiseAgentContext():
             restart_sequence(bool): whether to restart a sequence of agents
         """
         if (self._use_redis == True):
-            self._redis_db.hset(self.name, "restart_sequence", value=pickle.dumps(restart_sequence))
+            self._set_redis_value("restart_sequence", self._serializer.dumps(restart_sequence), restart_sequence)
         else:
-            self._restart_sequence = restart_sequence
+            with self._in_memory_lock:
+                self._restart_sequence = restart_sequence
     
     def get_restart_sequence(self) -> bool:
         """
@@ -634,11 +1242,8 @@ class WiseAgentContext():
             bool: whether to restart the sequence for the chat uuid for this context
         """
         if (self._use_redis == True):
-            restart = self._redis_db.hget(self.name, "restart_sequence")
-            if restart is not None:
-                return pickle.loads(restart)
-            else:
-                return False
+            return self._get_value_from_redis("restart_sequence",
+                                              lambda value: self._serializer.loads(value) if value is not None else False)
         else:
             return self._restart_sequence
         
@@ -654,9 +1259,10 @@ class WiseAgentMetaData(WiseAgentsYAMLObject):
         obj._system_message = None
         obj._pre_user_messages = None
         obj._post_user_messages = None
+        obj._replicated = False
         return obj
     def __init__(self, description : str, system_message: Optional[str] = None, pre_user_messages: Optional[List[str]] = None,
-                 post_user_messages: Optional[List[str]] = None):
+                 post_user_messages: Optional[List[str]] = None, replicated: Optional[bool] = False):
         ''' Initialize the metadata with the given system message.
 
         Args:
@@ -667,16 +1273,20 @@ class WiseAgentMetaData(WiseAgentsYAMLObject):
             completions using its LLM (e.g., when processing a request)
             post_user_messages (Optional[List[str]]): an optional list of user messages that can be used by the agent when processing chat
             completions using its LLM (e.g., when processing a response)
+            replicated (Optional[bool]): whether several instances of the agent can run under the same name,
+            sharing its request queue
         '''
         self._description = description
         self._system_message = system_message
         self._pre_user_messages = pre_user_messages
         self._post_user_messages = post_user_messages
+        self._replicated = replicated
 
     def __repr__(self):
         '''Return a string representation of the metadata.'''
         return (f"{self.__class__.__name__}(description={self.description}, system_message={self.system_message},"
-                f"pre_user_messages={self.pre_user_messages},post_user_messages={self.post_user_messages})")
+                f"pre_user_messages={self.pre_user_messages},post_user_messages={self.post_user_messages},"
+                f"replicated={self.replicated})")
     
     def __eq__(self, value: object) -> bool:
         return self.__repr__() == value.__repr__()
@@ -701,11 +1311,16 @@ class WiseAgentMetaData(WiseAgentsYAMLObject):
         """Get the list of post user messages associated with the agent."""
         return self._post_user_messages
 
+    @property
+    def replicated(self) -> bool:
+        """Get whether several instances of the agent can run under the same name."""
+        return self._replicated
+
 
 class WiseAgent(WiseAgentsYAMLObject):
     ''' A WiseAgent is an abstract class that represents an agent that can send and receive messages to and from other agents.
     '''
-    
+
     def __new__(cls, *args, **kwargs):
         '''Create a new instance of the class, setting default values for the instance variables.'''
         obj = super().__new__(cls)
@@ -714,14 +1329,23 @@ class WiseAgent(WiseAgentsYAMLObject):
         obj._vector_db = None
         obj._graph_db = None
         obj._collection_name = "wise-agent-collection"
+        obj._history_policy = None
+        obj._instance_id = None
+        obj._dedup_window = None
+        obj._max_concurrency = 1
+        # The request handled by the current thread and the messages sent for it, when they are recorded
+        obj._request_state = threading.local()
         return obj
 
     def __init__(self, name: str, metadata: WiseAgentMetaData, transport: WiseAgentTransport, llm: Optional[WiseAgentLLM] = None,
                  vector_db: Optional[WiseAgentVectorDB] = None,
                  collection_name: Optional[str] = "wise-agent-collection",
-                 graph_db: Optional[WiseAgentGraphDB] = None):
-        ''' 
-        Initialize the agent with the given name, metadata, transport, LLM, vector DB, collection name, and graph DB.
+                 graph_db: Optional[WiseAgentGraphDB] = None,
+                 history_policy: Optional[WiseAgentHistoryPolicy] = None, dedup_window: Optional[int] = None,
+                 max_concurrency: int = 1):
+        '''
+        Initialize the agent with the given name, metadata, transport, LLM, vector DB, collection name, graph DB,
+        history policy, dedup window and maximum concurrency.
 
 
         Args:
@@ -732,6 +1356,12 @@ class WiseAgent(WiseAgentsYAMLObject):
             vector_db (Optional[WiseAgentVectorDB]): the vector DB associated with the agent
             collection_name (Optional[str]) = "wise-agent-collection": the vector DB collection name associated with the agent
             graph_db (Optional[WiseAgentGraphDB]): the graph DB associated with the agent
+            history_policy (Optional[WiseAgentHistoryPolicy]): the policy limiting the conversation history
+            passed to process_request, None to pass the whole history
+            dedup_window (Optional[int]): the number of seconds the requests received are remembered, so that
+            their duplicates are not processed again, None to process all the requests
+            max_concurrency (int): the maximum number of requests handled concurrently, by a pool of
+            threads when it is greater than 1. Default is 1
         '''
         self._name = name
         self._metadata = metadata
@@ -739,20 +1369,104 @@ class WiseAgent(WiseAgentsYAMLObject):
         self._vector_db = vector_db
         self._collection_name = collection_name
         self._graph_db = graph_db
+        self._history_policy = history_policy
+        self._dedup_window = dedup_window
+        self._max_concurrency = max_concurrency
         self._transport = transport
         self.start_agent()
 
     def start_agent(self):
-        ''' Start the agent by setting the call backs and starting the transport.'''
-        self.transport.set_call_backs(self.handle_request, self.process_event, self.process_error,
+        ''' Start the agent by setting the call backs and starting the transport.
+        If the agent is replicated, it is registered as a new instance of the agent with its name.'''
+        if self.metadata.replicated and self._instance_id is None:
+            self._instance_id = uuid.uuid4().hex
+        self.transport.instance_id = self._instance_id
+        self.transport.max_concurrency = self._max_concurrency
+        self.transport.set_call_backs(self._receive_request, self.process_event, self.process_error,
                                       self.process_response)
         self.transport.start()
-        WiseAgentRegistry.register_agent(self.name, self.metadata)
+        WiseAgentRegistry.register_agent(self.name, self.metadata, self._instance_id)
 
     def stop_agent(self):
-        ''' Stop the agent by stopping the transport and removing the agent from the registry.'''
+        ''' Stop the agent by stopping the transport and removing the agent (or its instance) from the registry.'''
         self.transport.stop()
-        WiseAgentRegistry.unregister_agent(self.name)
+        WiseAgentRegistry.unregister_agent(self.name, self._instance_id)
+
+    def _receive_request(self, request: WiseAgentMessage) -> bool:
+        '''Handle a request received by the transport. The messages sent while handling it are correlated to it.
+        When the agent has a dedup window, these messages are recorded, and the duplicates of the request received
+        within the window are not processed again: the recorded messages are sent again instead, or the duplicates
+        are dropped while the request is being processed. Requests received after their deadline are not processed.'''
+        if request.expired:
+            return self.process_expired_request(request)
+        dedup = bool(self._dedup_window) and request.message_id is not None
+        if dedup and not WiseAgentRegistry.claim_request(self.name, request.message_id, self._dedup_window):
+            self._replay_request(request)
+            return True
+        state = self._request_state
+        # requests can be handled recursively when the transport delivers the messages in the sending thread
+        previous = (getattr(state, "request", None), getattr(state, "sent", None))
+        state.request, state.sent = request, ([] if dedup else None)
+        try:
+            result = self._handle_instance_request(request)
+            if dedup:
+                WiseAgentRegistry.set_request_responses(self.name, request.message_id, state.sent,
+                                                        self._dedup_window)
+            return result
+        except BaseException:
+            if dedup:
+                WiseAgentRegistry.release_request(self.name, request.message_id)
+            raise
+        finally:
+            state.request, state.sent = previous
+
+    def process_expired_request(self, request: WiseAgentMessage) -> bool:
+        '''
+        Report a request received after its deadline, which is not processed. By default, a warning is logged
+        and a CANNOT_ANSWER response is sent to the sender of the request, so that it doesn't wait for a response.
+
+        Args:
+            request (WiseAgentMessage): the expired request
+
+        Returns:
+            True if the request was reported successfully, False otherwise
+        '''
+        logging.warning(f"Agent {self.name} skipped the request {request.message_id} of {request.sender}, "
+                        f"expired since {request.deadline}")
+        if request.sender is not None and WiseAgentRegistry.get_context(request.context_name) is not None:
+            self.send_response(WiseAgentMessage(message="The request expired before it was processed",
+                                                message_type=WiseAgentMessageType.CANNOT_ANSWER,
+                                                context_name=request.context_name,
+                                                correlation_id=request.message_id),
+                               request.sender, request.sender_instance_id)
+        return True
+
+    def _replay_request(self, request: WiseAgentMessage):
+        '''Send again the responses recorded for a duplicate request, with their original ids. The requests sent to
+        other agents are not sent again, since that would restart their collaboration: the response of a coordinator,
+        sent once the collaboration completes, is recorded for the request when it is sent.'''
+        sent = WiseAgentRegistry.get_request_responses(self.name, request.message_id)
+        if sent is None:
+            logging.info(f"Agent {self.name} dropped a duplicate of request {request.message_id} being processed")
+            return
+        logging.info(f"Agent {self.name} replaying the responses sent for the duplicate request {request.message_id}")
+        for kind, message, dest_agent_name, dest_instance_id in sent:
+            if kind == "request":
+                continue
+            if dest_instance_id is None:
+                self.transport.send_response(message, dest_agent_name)
+            else:
+                self.transport.send_response(message, dest_agent_name, dest_instance_id)
+
+    def _handle_instance_request(self, request: WiseAgentMessage) -> bool:
+        '''Handle a request, keeping the load of this instance up to date when the agent is replicated.'''
+        if self._instance_id is None:
+            return self.handle_request(request)
+        WiseAgentRegistry.update_agent_instance_load(self.name, self._instance_id, 1)
+        try:
+            return self.handle_request(request)
+        finally:
+            WiseAgentRegistry.update_agent_instance_load(self.name, self._instance_id, -1)
 
     def __repr__(self):
         '''Return a string representation of the agent.'''
@@ -762,11 +1476,23 @@ class WiseAgent(WiseAgentsYAMLObject):
     def __eq__(self, value: object) -> bool:
         return isinstance(value, WiseAgent) and self.__repr__() == value.__repr__()
 
+    def __getstate__(self) -> dict:
+        '''Get the state of the agent, without its per-thread and per-instance state.'''
+        state = dict(super().__getstate__())
+        state.pop("instance_id", None)
+        state.pop("request_state", None)
+        return state
+
     @property
     def name(self) -> str:
         """Get the name of the agent."""
         return self._name
 
+    @property
+    def instance_id(self) -> Optional[str]:
+        """Get the id of this instance of the agent, None if the agent is not replicated."""
+        return self._instance_id
+
     @property
     def metadata(self) -> WiseAgentMetaData:
         """Get the metadata associated with the agent."""
@@ -797,31 +1523,131 @@ class WiseAgent(WiseAgentsYAMLObject):
         """Get the transport associated with the agent."""
         return self._transport
 
+    @property
+    def history_policy(self) -> Optional[WiseAgentHistoryPolicy]:
+        """Get the policy limiting the conversation history passed to process_request."""
+        return self._history_policy
+
+    @history_policy.setter
+    def history_policy(self, history_policy: Optional[WiseAgentHistoryPolicy]):
+        """Set the policy limiting the conversation history passed to process_request."""
+        self._history_policy = history_policy
+
+    @property
+    def dedup_window(self) -> Optional[int]:
+        """Get the number of seconds the requests received are remembered to drop their duplicates,
+        None if all the requests are processed."""
+        return self._dedup_window
+
+    @dedup_window.setter
+    def dedup_window(self, dedup_window: Optional[int]):
+        """Set the number of seconds the requests received are remembered to drop their duplicates."""
+        self._dedup_window = dedup_window
+
+    @property
+    def max_concurrency(self) -> int:
+        """Get the maximum number of requests handled concurrently."""
+        return self._max_concurrency
+
+    @max_concurrency.setter
+    def max_concurrency(self, max_concurrency: int):
+        """Set the maximum number of requests handled concurrently. It is used when the agent is started."""
+        self._max_concurrency = max_concurrency
+
+    def _prepare_message(self, message: WiseAgentMessage) -> WiseAgentMessage:
+        '''Set the sender, id and correlation id of a message about to be sent, and offload its contents if they are
+        large, once, so that the message sent and the message traced only carry their reference.'''
+        message.sender = self.name
+        message.sender_instance_id = self._instance_id
+        if message.message_id is None:
+            message.message_id = uuid.uuid4().hex
+        request = getattr(self._request_state, "request", None)
+        if request is not None:
+            # the work done for a request is as urgent as the request, and useless once the request expired
+            if message.correlation_id is None:
+                message.correlation_id = request.message_id
+            if message.priority is None:
+                message.priority = request.priority
+            if message.deadline is None:
+                message.deadline = request.deadline
+        return self.transport.claim_check(message)
+
+    def _record_sent_message(self, kind: str, message: WiseAgentMessage, dest_agent_name: str,
+                             dest_instance_id: Optional[str] = None):
+        '''Record a message sent for the request handled by the current thread, when the request can be replayed.
+        A response sent later, e.g. the final response of a coordinator sent when the collaboration completes, is
+        recorded for the request it is correlated to.'''
+        request = getattr(self._request_state, "request", None)
+        sent = getattr(self._request_state, "sent", None)
+        if sent is not None and (kind == "request" or message.correlation_id == request.message_id):
+            sent.append((kind, message, dest_agent_name, dest_instance_id))
+        elif kind == "response" and self._dedup_window and message.correlation_id is not None:
+            WiseAgentRegistry.add_request_response(self.name, message.correlation_id,
+                                                   (kind, message, dest_agent_name, dest_instance_id),
+                                                   self._dedup_window)
+
     def send_request(self, message: WiseAgentMessage, dest_agent_name: str):
         '''Send a request message to the destination agent with the given name.
 
         Args:
             message (WiseAgentMessage): the message to send
             dest_agent_name (str): the name of the destination agent'''
-        message.sender = self.name
+        message = self._prepare_message(message)
         context = WiseAgentRegistry.get_context(message.context_name)
         self.transport.send_request(message, dest_agent_name)
+        self._record_sent_message("request", message, dest_agent_name)
         if context is not None:
             context.trace(message)
         else:
             logging.warning(f"Context {message.context_name} not found")
 
-    def send_response(self, message: WiseAgentMessage, dest_agent_name):
+    def send_response(self, message: WiseAgentMessage, dest_agent_name, dest_instance_id: Optional[str] = None):
         '''Send a response message to the destination agent with the given name.
 
         Args:
             message (WiseAgentMessage): the message to send
-            dest_agent_name (str): the name of the destination agent'''
-        message.sender = self.name
+            dest_agent_name (str): the name of the destination agent
+            dest_instance_id (Optional[str]): the id of the instance of the destination agent that sent the request,
+            when the destination agent is replicated'''
+        message = self._prepare_message(message)
         context = WiseAgentRegistry.get_context(message.context_name)
-        self.transport.send_response(message, dest_agent_name)
+        if dest_instance_id is None:
+            self.transport.send_response(message, dest_agent_name)
+        else:
+            self.transport.send_response(message, dest_agent_name, dest_instance_id)
+        self._record_sent_message("response", message, dest_agent_name, dest_instance_id)
         context.trace(message)
 
+    def send_response_chunks(self, request: WiseAgentMessage, chunks: Iterable[str]) -> str:
+        '''Send the chunks of a response being generated, e.g. the tokens streamed by the LLM, to the sender of the
+        request as they arrive, as CHUNK messages correlated to the request. The chunks are not traced in the context
+        nor recorded for the dedup window, since the complete response is sent when it is ready. The chunks are only
+        sent when the response goes straight back to the sender of the request: in a sequential or phased
+        coordination the sender is another agent of the coordination, which only expects the complete response.
+
+        Args:
+            request (WiseAgentMessage): the request the response is generated for
+            chunks (Iterable[str]): the chunks of the response
+
+        Returns:
+            str: the complete response'''
+        collaboration_type = WiseAgentRegistry.get_context(request.context_name).collaboration_type
+        send_chunks = request.sender is not None and collaboration_type not in (
+            WiseAgentCollaborationType.SEQUENTIAL, WiseAgentCollaborationType.SEQUENTIAL_MEMORY,
+            WiseAgentCollaborationType.PHASED)
+        response = []
+        for chunk in chunks:
+            response.append(chunk)
+            if not send_chunks:
+                continue
+            message = self._prepare_message(WiseAgentMessage(message=chunk, context_name=request.context_name,
+                                                             message_type=WiseAgentMessageType.CHUNK))
+            if request.sender_instance_id is None:
+                self.transport.send_response(message, request.sender)
+            else:
+                self.transport.send_response(message, request.sender, request.sender_instance_id)
+        return "".join(response)
+
     def handle_request(self, request: WiseAgentMessage) -> bool:
         """
         Callback method to handle the given request for this agent. This method optionally retrieves
@@ -850,6 +1676,7 @@ class WiseAgent(WiseAgentsYAMLObject):
         """
         Get the conversation history for the given chat id from the given context, depending on the
         type of collaboration the agent is involved in (i.e., sequential, phased, independent).
+        If the agent has a history policy, only the part of the history allowed by the policy is returned.
 
         Args:
             context (WiseAgentContext): the shared context
@@ -864,10 +1691,17 @@ class WiseAgent(WiseAgentsYAMLObject):
                 or collaboration_type == WiseAgentCollaborationType.CHAT
                 or collaboration_type == WiseAgentCollaborationType.SEQUENTIAL_MEMORY):
             # this agent is involved in phased collaboration or a chat, so it needs the conversation history
-            return context.llm_chat_completion
+            if self._history_policy is not None:
+                return self._history_policy.get_history(context)
+            return self._get_local_conversation_history(context)
         # for sequential collaboration and independent agents, the shared history is not needed
         return []
 
+    def _get_local_conversation_history(self, context: WiseAgentContext) -> List[ChatCompletionMessageParam]:
+        '''Get a copy of the conversation history of the given context. In redis mode it is built from the
+        per-process cache of the context, which only reads the messages appended since the previous request.'''
+        return context.get_chat_completion_since(0)
+
     @abstractmethod
     def process_request(self, request: WiseAgentMessage,
                         conversation_history: List[ChatCompletionMessageParam]) -> Optional[str]:
@@ -911,7 +1745,7 @@ class WiseAgent(WiseAgentsYAMLObject):
                 # let the sender know that this agent has finished processing the request
                 self.send_response(
                     WiseAgentMessage(message=response_str, message_type=WiseAgentMessageType.ACK, sender=self.name,
-                                     context_name=context.name), request.sender)
+                                     context_name=context.name), request.sender, request.sender_instance_id)
             elif (collaboration_type == WiseAgentCollaborationType.SEQUENTIAL 
                     or collaboration_type == WiseAgentCollaborationType.SEQUENTIAL_MEMORY):
                 if collaboration_type == WiseAgentCollaborationType.SEQUENTIAL_MEMORY:
@@ -930,9 +1764,10 @@ class WiseAgent(WiseAgentsYAMLObject):
                     else:
                         logging.debug(f"Sequential coordination complete - sending response from " + self.name + " to "
                                       + context.get_route_response_to())
-                        self.send_response(WiseAgentMessage(message=response_str, sender=self.name,
-                                                            context_name=context.name),
-                                           context.get_route_response_to())
+                        self.send_response(WiseAgentMessage(
+                            message=response_str, sender=self.name, context_name=context.name,
+                            correlation_id=context.get_route_response_correlation_id()),
+                            context.get_route_response_to())
                 else:
                     logging.debug(f"Sequential coordination continuing - sending response from " + self.name
                                   + " to " + next_agent)
@@ -941,7 +1776,7 @@ class WiseAgent(WiseAgentsYAMLObject):
             else:
                 self.send_response(WiseAgentMessage(message=response_str, sender=self.name,
                                                     context_name=context.name),
-                                   request.sender)
+                                   request.sender, request.sender_instance_id)
         return True
 
     @abstractmethod
@@ -996,10 +1831,81 @@ class WiseAgentRegistry:
     agents_metadata_dict : dict[str, WiseAgentMetaData] = {}
     contexts : dict[str, WiseAgentContext] = {}
     tools: dict[str, WiseAgentTool] = {}
+    # The tools registered by this process, used instead of the tools created from the stored schemas as long as
+    # their schema didn't change (used when redis is used)
+    _local_tools : dict[str, WiseAgentTool] = {}
+    # The tools created from the stored schemas, by schema hash (used when redis is used)
+    _remote_tools : dict[str, WiseAgentTool] = {}
+    # The embeddings of the agent descriptions used to route the queries (used when redis is not used)
+    # It is replaced rather than modified, so that the routing index reuses the matrix built from it until it changes
+    agents_embeddings : dict[str, np.ndarray] = {}
+    # Maps an agent name to the time it is considered dead unless it renews its heartbeat (used when redis is not used)
+    agents_heartbeats : dict[str, float] = {}
+    # Maps an agent name and instance id to the time the instance is considered dead unless it renews its heartbeat
+    # (used when redis is not used)
+    agents_instances_heartbeats : dict[Tuple[str, str], float] = {}
+    # Maps the name of a replicated agent to the number of requests each of its instances is processing, by instance id
+    # (used when redis is not used)
+    agents_instances : dict[str, dict[str, int]] = {}
+    _agents_instances_lock : threading.RLock = threading.RLock()
     
     config: dict[str, Any] = {}
     
     redis_db : redis.Redis = None
+    redis_connection_pool : redis.ConnectionPool = None
+
+    # A per-process LRU of the context handles created from the descriptors stored in redis,
+    # mapping a context name to (stored descriptor, context)
+    _context_handles : OrderedDict[str, Tuple[bytes, WiseAgentContext]] = OrderedDict()
+    _context_handles_lock : threading.Lock = threading.Lock()
+
+    # The channel on which the changes of the agents and tools hashes, and the removal of the contexts, are notified
+    REGISTRY_CHANNEL = "wise-agents:registry"
+    # The prefix of the notifications of the removal of a context, followed by its name
+    CONTEXT_REMOVED_NOTIFICATION = "context_removed:"
+    # A per-process read-through cache of the agents and tools hashes, mapping the hash name to (load time, content).
+    # It is invalidated by the notifications published on REGISTRY_CHANNEL when an agent or a tool is registered or
+    # unregistered, and reloaded anyway after registry_cache_ttl seconds in case a notification was missed
+    _registry_cache : dict[str, Tuple[float, dict[str, Any]]] = {}
+    # Incremented by each invalidation, so that a hash loaded while it was being invalidated is not cached
+    _registry_cache_generations : dict[str, int] = {}
+    _registry_cache_lock : threading.RLock = threading.RLock()
+    _registry_listener : threading.Thread = None
+
+    _routing_index : WiseAgentRoutingIndex = None
+
+    # The agents registered by this process, whose heartbeats are renewed when agent_heartbeat_ttl is configured
+    _local_agents : dict[str, WiseAgentMetaData] = {}
+    # The ids of the instances of the replicated agents registered by this process, by agent name
+    _local_agent_instances : dict[str, set[str]] = {}
+    # Maps an agent name and a request id to the deadline of the claim and the messages sent for the request
+    # (used when redis is not used)
+    _processed_requests : OrderedDict[Tuple[str, str], Tuple[float, Optional[list]]] = OrderedDict()
+    # Maps an agent name and a request id to the deadline and the responses sent for the request once it was
+    # processed, e.g. the final response of a coordinator (used when redis is not used)
+    _late_request_responses : OrderedDict[Tuple[str, str], Tuple[float, list]] = OrderedDict()
+    _processed_requests_lock : threading.Lock = threading.Lock()
+
+    # The agents and tools collected by the bulk_registration block of each thread
+    _bulk_registration_state : threading.local = threading.local()
+    _agent_heartbeat : threading.Thread = None
+    _agent_heartbeat_stop : threading.Event = threading.Event()
+    # The names of the agents whose heartbeat expired and the time they were read, read again at most every
+    # agent_heartbeat_interval seconds and reset by the sweeps and the registrations (used when redis is used)
+    _dead_agent_names : Optional[Tuple[float, set[str]]] = None
+
+    serializer : WiseAgentSerializer = None
+
+    # Maps a context name to the names of its sub contexts (used when redis is not used)
+    context_children : dict[str, set[str]] = {}
+    # Map a context name to the time it expires because of context_ttl and context_idle_ttl (used when redis is not used)
+    context_deadlines : dict[str, float] = {}
+    context_idle_deadlines : dict[str, float] = {}
+    # Guards the contexts, their sub contexts and their deadlines (used when redis is not used)
+    _contexts_lock : threading.RLock = threading.RLock()
+
+    _context_reaper : threading.Thread = None
+    _context_reaper_stop : threading.Event = threading.Event()
     
     
     @classmethod
@@ -1028,53 +1934,613 @@ class WiseAgentRegistry:
         for more information see 
         https://wise-agents.github.io/wise_agents_architecture/#distributed-architecture
         """
+        if cls.serializer is not None:
+            # already initialized
+            return cls.config
         try: 
             if cls.config is None or cls.config == {}:
                 file_name = cls.find_file(file_name="registry_config.yaml", config_directory=".wise-agents")
                 cls.config : Dict[str, Any] = yaml.load(open(file_name), Loader=yaml.FullLoader)
             if cls.config.get("use_redis") == True and cls.redis_db is None:
-                if (cls.config.get("redis_ssl") is True):
-                    cls.redis_db = redis.Redis(
-                    host=cls.config["redis_host"], port=cls.config["redis_port"],
-                    username=cls.config["redis_username"], # use your Redis user. More info https://redis.io/docs/latest/operate/oss_and_stack/management/security/acl/
-                    password=cls.config["redis_password"], # use your Redis password
-                    ssl=True,
-                    ssl_certfile=cls.config["redis_ssl_certfile"],
-                    ssl_keyfile=cls.config["redis_ssl_keyfile"],
-                    ssl_ca_certs=cls.config["redis_ssl_ca_certs"])
-
-                else:
-                    cls.redis_db = redis.Redis(host=cls.config["redis_host"], port=cls.config["redis_port"])
+                cls.redis_connection_pool = cls._create_redis_connection_pool(cls.config)
+                cls.redis_db = redis.Redis(connection_pool=cls.redis_connection_pool)
+            if cls.serializer is None:
+                cls.serializer = create_serializer(cls.config)
             return cls.config
         except Exception as e:
             logging.error(e)
             exit(1)
     
     @classmethod
-    def register_agent(cls, agent_name : str, agent_metadata :WiseAgentMetaData):
+    def _create_redis_connection_pool(cls, config: dict[str, Any]) -> redis.ConnectionPool:
+        """
+        Create the redis connection pool shared by the registry and all the contexts of the process.
+
+        Args:
+            config (dict[str, Any]): the registry configuration
+        """
+        pool_args = {"host": config["redis_host"], "port": config["redis_port"],
+                     "max_connections": config.get("redis_max_connections"),
+                     "socket_timeout": config.get("redis_socket_timeout"),
+                     "socket_connect_timeout": config.get("redis_socket_connect_timeout"),
+                     "health_check_interval": config.get("redis_health_check_interval", 0)}
+        if (config.get("redis_ssl") is True):
+            return redis.ConnectionPool(
+                connection_class=redis.SSLConnection,
+                username=config["redis_username"], # use your Redis user. More info https://redis.io/docs/latest/operate/oss_and_stack/management/security/acl/
+                password=config["redis_password"], # use your Redis password
+                ssl_certfile=config["redis_ssl_certfile"],
+                ssl_keyfile=config["redis_ssl_keyfile"],
+                ssl_ca_certs=config["redis_ssl_ca_certs"],
+                **pool_args)
+        return redis.ConnectionPool(**pool_args)
+
+    @classmethod
+    def get_redis_db(cls) -> redis.Redis:
+        """
+        Get the redis client shared by the registry and all the contexts of the process.
+        All the clients use the same connection pool, configured by registry_config.yaml.
+        """
+        cls.get_config()
+        return cls.redis_db
+
+    @classmethod
+    def get_serializer(cls) -> WiseAgentSerializer:
+        """
+        Get the serializer used for the values stored in redis, configured by the serializer
+        and serializer_compression_threshold keys of the configuration
+        """
+        cls.get_config()
+        return cls.serializer
+
+    @classmethod
+    def register_agent(cls, agent_name : str, agent_metadata :WiseAgentMetaData, instance_id: Optional[str] = None):
         """
-        Register an agent with the registry
+        Register an agent with the registry. If agent_heartbeat_ttl is configured, the heartbeat of the agent
+        is renewed periodically until it is unregistered, and an agent with the same name whose heartbeat
+        expired is replaced.
+        A replicated agent can be registered several times with the same name, once for each of its instances,
+        as long as all the instances are replicated.
+        Within a bulk_registration block, the agent is only registered when the block exits.
+
+        Args:
+            agent_name (str): the name of the agent
+            agent_metadata (WiseAgentMetaData): the metadata of the agent
+            instance_id (Optional[str]): the id of the instance of a replicated agent
         """
+        cls.register_agents([(agent_name, agent_metadata, instance_id)])
+
+    @classmethod
+    def register_agents(cls, agents: List[Tuple[str, WiseAgentMetaData, Optional[str]]],
+                        tools: Optional[List[WiseAgentTool]] = None):
+        """
+        Register several agents and tools with the registry at once. The name conflicts of all the agents are
+        checked together, and in redis mode all the agents and tools are registered in a single transaction,
+        so that registering many agents costs a few round trips to redis instead of a few per agent.
+        Either all or none of the agents and tools are registered.
+        Within a bulk_registration block, the agents and tools are only registered when the block exits.
+
+        Args:
+            agents (List[Tuple[str, WiseAgentMetaData, Optional[str]]]): the name, the metadata and the instance id
+            (None if the agent is not replicated) of each agent
+            tools (Optional[List[WiseAgentTool]]): the tools
+
+        Raises:
+            NameError: if agents with the same names already exist and are not replicated
+        """
+        tools = tools or []
+        for agent_name, agent_metadata, instance_id in agents:
+            if instance_id is not None and not agent_metadata.replicated:
+                raise ValueError(f"Agent {agent_name} is not replicated, it can't be registered with an instance id")
+        pending = getattr(cls._bulk_registration_state, "pending", None)
+        if pending is not None:
+            pending[0].extend(agents)
+            pending[1].extend(tools)
+            return
+        # the last registration of each name provides the metadata of the agent
+        agents_metadata = {agent_name: agent_metadata for agent_name, agent_metadata, _ in agents}
+        names = list(agents_metadata)
+        embeddings = {}
+        if names and cls.get_config().get("agent_routing_index") == True:
+            descriptions = [agents_metadata[agent_name].description for agent_name in names]
+            embeddings = dict(zip(names, cls.get_routing_index().embed_descriptions(descriptions)))
+        heartbeat_ttl = cls.get_config().get("agent_heartbeat_ttl")
         if (cls.get_config().get("use_redis") == True):
+            for tool in tools:
+                cls._check_tool_call_back(tool)
             pipe = cls.redis_db.pipeline(transaction=True)
             while True:
-                pipe.watch("agents")
+                pipe.watch("agents", "agents_heartbeats")
                 try:
-                    if(pipe.hexists("agents", agent_name) == True):
+                    existing = {}
+                    if names:
+                        existing = {agent_name: (cls.serializer.loads(metadata) if metadata is not None else None,
+                                                 cls._is_heartbeat_expired(deadline))
+                                    for agent_name, metadata, deadline in zip(
+                                        names, pipe.hmget("agents", names), pipe.zmscore("agents_heartbeats", names))}
+                    conflicts = cls._get_agent_name_conflicts(agents, existing)
+                    if conflicts:
                         pipe.unwatch()
-                        raise NameError(f"Agent with name {agent_name} already exists")
-                    else:
-                        pipe.multi()
-                        pipe.hset("agents", key=agent_name, value=pickle.dumps(agent_metadata))
-                        pipe.execute()
-                    return
+                        cls._raise_agent_name_conflicts(conflicts)
+                    pipe.multi()
+                    if names:
+                        pipe.hset("agents", mapping={agent_name: cls.serializer.dumps(agents_metadata[agent_name])
+                                                     for agent_name in names})
+                        pipe.publish(cls.REGISTRY_CHANNEL, "agents")
+                        if embeddings:
+                            pipe.hset("agents_embeddings", mapping={agent_name: embedding.tobytes()
+                                                                    for agent_name, embedding in embeddings.items()})
+                        # remove the embeddings of the descriptions of dead agents with the same names
+                        without_embedding = [agent_name for agent_name in names if agent_name not in embeddings]
+                        if without_embedding:
+                            pipe.hdel("agents_embeddings", *without_embedding)
+                        pipe.publish(cls.REGISTRY_CHANNEL, "agents_embeddings")
+                        # remove the instances of dead agents with the same names
+                        replaced = [cls._agent_instances_key(agent_name) for agent_name in names
+                                    if existing[agent_name][0] is None or existing[agent_name][1]]
+                        if replaced:
+                            pipe.delete(*replaced)
+                        for agent_name, _, instance_id in agents:
+                            if instance_id is not None:
+                                pipe.hset(cls._agent_instances_key(agent_name), key=instance_id, value=0)
+                        if heartbeat_ttl:
+                            deadline = time.time() + heartbeat_ttl
+                            pipe.zadd("agents_heartbeats", {agent_name: deadline for agent_name in names})
+                            instances = {cls._agent_instance_heartbeat_member(agent_name, instance_id): deadline
+                                         for agent_name, _, instance_id in agents if instance_id is not None}
+                            if instances:
+                                pipe.zadd("agents_instances_heartbeats", instances)
+                    if tools:
+                        pipe.hset("tools", mapping={tool.name: cls.serializer.dumps(tool.schema) for tool in tools})
+                        pipe.publish(cls.REGISTRY_CHANNEL, "tools")
+                    pipe.execute()
+                    if names:
+                        cls._invalidate_registry_hash("agents")
+                        cls._invalidate_registry_hash("agents_embeddings")
+                    if tools:
+                        cls._local_tools.update({tool.name: tool for tool in tools})
+                        cls._invalidate_registry_hash("tools")
+                    break
                 except redis.WatchError:
-                    logging.debug("WatchError in register_agent")
+                    logging.debug("WatchError in register_agents")
                     continue
         else:
-            if cls.agents_metadata_dict.get(agent_name) is not None:
-                raise NameError(f"Agent with name {agent_name} already exists")
-        cls.agents_metadata_dict[agent_name] = agent_metadata
+            with cls._agents_instances_lock:
+                existing = {agent_name: (cls.agents_metadata_dict.get(agent_name),
+                                         cls._is_heartbeat_expired(cls.agents_heartbeats.get(agent_name)))
+                            for agent_name in names}
+                conflicts = cls._get_agent_name_conflicts(agents, existing)
+                if conflicts:
+                    cls._raise_agent_name_conflicts(conflicts)
+                cls._replace_agents_embeddings(embeddings, [agent_name for agent_name in names
+                                                            if agent_name not in embeddings])
+                for agent_name in names:
+                    cls.agents_metadata_dict[agent_name] = agents_metadata[agent_name]
+                    if existing[agent_name][0] is None or existing[agent_name][1]:
+                        cls.agents_instances.pop(agent_name, None)
+                    if heartbeat_ttl:
+                        cls.agents_heartbeats[agent_name] = time.time() + heartbeat_ttl
+                for agent_name, _, instance_id in agents:
+                    if instance_id is not None:
+                        cls.agents_instances.setdefault(agent_name, {})[instance_id] = 0
+                        if heartbeat_ttl:
+                            cls.agents_instances_heartbeats[(agent_name, instance_id)] = time.time() + heartbeat_ttl
+                for tool in tools:
+                    cls.tools[tool.name] = tool
+        for agent_name, _, instance_id in agents:
+            if instance_id is not None:
+                cls._local_agent_instances.setdefault(agent_name, set()).add(instance_id)
+        if heartbeat_ttl and names:
+            cls._local_agents.update(agents_metadata)
+            cls.start_agent_heartbeat()
+
+    @classmethod
+    def _get_agent_name_conflicts(cls, agents: List[Tuple[str, WiseAgentMetaData, Optional[str]]],
+                                  existing: dict[str, Tuple[Optional[WiseAgentMetaData], bool]]) -> List[str]:
+        """
+        Get the names of the agents which can't be registered, either because an agent with the same name is
+        already registered and alive, or because the name is registered several times, unless all the
+        registrations are instances of a replicated agent.
+
+        Args:
+            agents (List[Tuple[str, WiseAgentMetaData, Optional[str]]]): the agents to register
+            existing (dict[str, Tuple[Optional[WiseAgentMetaData], bool]]): the metadata of the registered agent
+            with each name (None if there is none) and whether its heartbeat expired
+
+        Returns:
+            List[str]: the conflicting names
+        """
+        registrations: dict[str, List[Optional[str]]] = {}
+        for agent_name, _, instance_id in agents:
+            registrations.setdefault(agent_name, []).append(instance_id)
+        conflicts = []
+        for agent_name, instance_ids in registrations.items():
+            replicas = all(instance_id is not None for instance_id in instance_ids)
+            metadata, expired = existing[agent_name]
+            if (metadata is not None and not expired and not (replicas and metadata.replicated)) or \
+                    (len(instance_ids) > 1 and not replicas):
+                conflicts.append(agent_name)
+        return conflicts
+
+    @classmethod
+    def _raise_agent_name_conflicts(cls, conflicts: List[str]):
+        """Raise a NameError for the given conflicting agent names."""
+        if len(conflicts) == 1:
+            raise NameError(f"Agent with name {conflicts[0]} already exists")
+        raise NameError(f"Agents with names {', '.join(conflicts)} already exist")
+
+    @classmethod
+    @contextmanager
+    def bulk_registration(cls):
+        """
+        Collect the agents and tools registered within a with block, e.g. while loading a YAML file with
+        yaml.load_all and starting the loaded agents, and register them together with register_agents when
+        the block exits. Within the block, the collected agents and tools are not returned by the registry yet.
+        If the block raises an exception, nothing is registered. Nested blocks are merged into the outermost one.
+
+        Example:
+            with WiseAgentRegistry.bulk_registration():
+                for agent in yaml.load_all(stream, Loader=WiseAgentsLoader):
+                    agent.start_agent()
+        """
+        if getattr(cls._bulk_registration_state, "pending", None) is not None:
+            yield
+            return
+        pending = ([], [])
+        cls._bulk_registration_state.pending = pending
+        try:
+            yield
+        finally:
+            cls._bulk_registration_state.pending = None
+        if pending[0] or pending[1]:
+            cls.register_agents(pending[0], pending[1])
+
+    @classmethod
+    def _agent_instances_key(cls, agent_name: str) -> str:
+        """Get the name of the redis hash mapping the instance ids of the given agent to their load."""
+        return f"agents_instances:{agent_name}"
+
+    @classmethod
+    def _agent_instance_heartbeat_member(cls, agent_name: str, instance_id: str) -> str:
+        """Get the member of the given agent instance in the redis sorted set of the instance heartbeats. The
+        instance ids are generated without colons, so the agent name starts after the first one."""
+        return f"{instance_id}:{agent_name}"
+
+    @classmethod
+    def get_agent_instances(cls, agent_name: str) -> dict[str, int]:
+        """
+        Get the instances of the replicated agent with the given name.
+
+        Args:
+            agent_name (str): the name of the agent
+
+        Returns:
+            dict[str, int]: the number of requests each instance is processing, by instance id
+        """
+        if (cls.get_config().get("use_redis") == True):
+            return {instance_id.decode("utf-8"): int(load) for instance_id, load
+                    in cls.redis_db.hgetall(cls._agent_instances_key(agent_name)).items()}
+        else:
+            with cls._agents_instances_lock:
+                return dict(cls.agents_instances.get(agent_name, {}))
+
+    @classmethod
+    def update_agent_instance_load(cls, agent_name: str, instance_id: str, delta: int):
+        """
+        Update the number of requests an instance of a replicated agent is processing.
+
+        Args:
+            agent_name (str): the name of the agent
+            instance_id (str): the id of the instance
+            delta (int): the number of requests to add to (or remove from, when negative) the load of the instance
+        """
+        if (cls.get_config().get("use_redis") == True):
+            _get_script(cls.redis_db, _UPDATE_AGENT_INSTANCE_LOAD_SCRIPT)(
+                keys=[cls._agent_instances_key(agent_name)], args=[instance_id, delta])
+        else:
+            with cls._agents_instances_lock:
+                instances = cls.agents_instances.get(agent_name)
+                if instances is not None and instance_id in instances:
+                    instances[instance_id] += delta
+
+    @classmethod
+    def _processed_request_key(cls, agent_name: str, request_id: str) -> str:
+        """Get the name of the redis key holding the messages sent by the given agent for the given request."""
+        return f"processed_requests:{agent_name}:{request_id}"
+
+    @classmethod
+    def claim_request(cls, agent_name: str, request_id: str, window: int) -> bool:
+        """
+        Claim the processing of the request with the given id by the given agent, for the given number of seconds.
+        Only the first claim succeeds, so that the duplicates of a request (e.g. redelivered by the transport or sent
+        again by the client) are not processed again.
+
+        Args:
+            agent_name (str): the name of the agent
+            request_id (str): the id of the request
+            window (int): the number of seconds the request is remembered
+
+        Returns:
+            bool: True if the request was claimed, False if it was already claimed within the window
+        """
+        if (cls.get_config().get("use_redis") == True):
+            # an empty value until the messages sent for the request are set
+            return bool(cls.redis_db.set(cls._processed_request_key(agent_name, request_id), b"", nx=True, ex=window))
+        else:
+            key = (agent_name, request_id)
+            now = time.time()
+            with cls._processed_requests_lock:
+                # the entries are mostly ordered by deadline, so the expired ones are at the beginning
+                while cls._processed_requests and next(iter(cls._processed_requests.values()))[0] < now:
+                    cls._processed_requests.popitem(last=False)
+                entry = cls._processed_requests.get(key)
+                if entry is not None and entry[0] >= now:
+                    return False
+                cls._processed_requests.pop(key, None)
+                cls._processed_requests[key] = (now + window, None)
+                return True
+
+    @classmethod
+    def set_request_responses(cls, agent_name: str, request_id: str, responses: list, window: int):
+        """
+        Set the messages sent by the given agent for the request with the given id it claimed.
+
+        Args:
+            agent_name (str): the name of the agent
+            request_id (str): the id of the request
+            responses (list): the messages sent for the request, as (kind, message, destination agent name,
+            destination instance id) tuples where kind is request or response
+            window (int): the number of seconds the messages are kept
+        """
+        if (cls.get_config().get("use_redis") == True):
+            cls.redis_db.set(cls._processed_request_key(agent_name, request_id), cls.serializer.dumps(responses),
+                             ex=window)
+        else:
+            with cls._processed_requests_lock:
+                cls._processed_requests[(agent_name, request_id)] = (time.time() + window, responses)
+
+    @classmethod
+    def _late_request_responses_key(cls, agent_name: str, request_id: str) -> str:
+        """Get the name of the redis list holding the responses sent by the given agent for the given request once
+        it was processed."""
+        return f"processed_responses:{agent_name}:{request_id}"
+
+    @classmethod
+    def add_request_response(cls, agent_name: str, request_id: str, response: tuple, window: int):
+        """
+        Add a response sent by the given agent for the request with the given id once the request was processed,
+        e.g. the final response of a coordinator sent when the collaboration completes.
+
+        Args:
+            agent_name (str): the name of the agent
+            request_id (str): the id of the request
+            response (tuple): the response, as a (kind, message, destination agent name, destination instance id)
+            tuple, as the messages set by set_request_responses
+            window (int): the number of seconds the response is kept
+        """
+        if (cls.get_config().get("use_redis") == True):
+            key = cls._late_request_responses_key(agent_name, request_id)
+            pipe = cls.redis_db.pipeline(transaction=True)
+            pipe.rpush(key, cls.serializer.dumps(response))
+            pipe.expire(key, window)
+            pipe.execute()
+        else:
+            key = (agent_name, request_id)
+            now = time.time()
+            with cls._processed_requests_lock:
+                while cls._late_request_responses and next(iter(cls._late_request_responses.values()))[0] < now:
+                    cls._late_request_responses.popitem(last=False)
+                _, responses = cls._late_request_responses.pop(key, (None, []))
+                cls._late_request_responses[key] = (now + window, responses + [response])
+
+    @classmethod
+    def get_request_responses(cls, agent_name: str, request_id: str) -> Optional[list]:
+        """
+        Get the messages sent by the given agent for the request with the given id.
+
+        Args:
+            agent_name (str): the name of the agent
+            request_id (str): the id of the request
+
+        Returns:
+            Optional[list]: the messages set by set_request_responses followed by the responses added by
+            add_request_response, None if the request is still being processed or was not claimed within the window
+        """
+        if (cls.get_config().get("use_redis") == True):
+            pipe = cls.redis_db.pipeline(transaction=False)
+            pipe.get(cls._processed_request_key(agent_name, request_id))
+            pipe.lrange(cls._late_request_responses_key(agent_name, request_id), 0, -1)
+            data, late_responses = pipe.execute()
+            if not data:
+                return None
+            return cls.serializer.loads(data) + [cls.serializer.loads(response) for response in late_responses]
+        else:
+            now = time.time()
+            with cls._processed_requests_lock:
+                entry = cls._processed_requests.get((agent_name, request_id))
+                if entry is None or entry[0] < now or entry[1] is None:
+                    return None
+                late_entry = cls._late_request_responses.get((agent_name, request_id))
+                return entry[1] + (late_entry[1] if late_entry is not None and late_entry[0] >= now else [])
+
+    @classmethod
+    def release_request(cls, agent_name: str, request_id: str):
+        """
+        Release the claim of the given agent on the request with the given id, e.g. when processing it failed,
+        so that it can be processed again.
+
+        Args:
+            agent_name (str): the name of the agent
+            request_id (str): the id of the request
+        """
+        if (cls.get_config().get("use_redis") == True):
+            cls.redis_db.delete(cls._processed_request_key(agent_name, request_id))
+        else:
+            with cls._processed_requests_lock:
+                cls._processed_requests.pop((agent_name, request_id), None)
+
+    @classmethod
+    def _is_heartbeat_expired(cls, deadline: Optional[float]) -> bool:
+        """Whether the given heartbeat deadline passed. Agents registered without heartbeat are never expired."""
+        return deadline is not None and deadline < time.time()
+
+    @classmethod
+    def _get_agent_heartbeat_interval(cls) -> float:
+        """Get the number of seconds between two renewals of the heartbeats and sweeps of the dead agents."""
+        return cls.get_config().get("agent_heartbeat_interval", cls.get_config()["agent_heartbeat_ttl"] / 3)
+
+    @classmethod
+    def _get_dead_agent_names(cls) -> set[str]:
+        """
+        Get the names of the agents whose heartbeat expired. In redis mode they are read at most every
+        agent_heartbeat_interval seconds, as the sweeps remove the dead agents anyway, so they are at most as stale as
+        the registry is between two sweeps.
+        """
+        if not cls.get_config().get("agent_heartbeat_ttl"):
+            return set()
+        if (cls.get_config().get("use_redis") == True):
+            now = time.time()
+            cached = cls._dead_agent_names
+            if cached is not None and now - cached[0] < cls._get_agent_heartbeat_interval():
+                return cached[1]
+            dead = {name.decode("utf-8") for name in cls.redis_db.zrangebyscore("agents_heartbeats", "-inf", now)}
+            cls._dead_agent_names = (now, dead)
+            return dead
+        else:
+            with cls._agents_instances_lock:
+                return {name for name, deadline in cls.agents_heartbeats.items()
+                        if cls._is_heartbeat_expired(deadline)}
+
+    @classmethod
+    def renew_agent_heartbeats(cls):
+        """
+        Renew the heartbeats of the agents and agent instances registered by this process. An agent or an instance
+        that was removed by a sweeper while it was still running (e.g. because the process was paused for longer
+        than agent_heartbeat_ttl) is registered again.
+        """
+        heartbeat_ttl = cls.get_config().get("agent_heartbeat_ttl")
+        local_agents = dict(cls._local_agents)
+        if not heartbeat_ttl or not local_agents:
+            return
+        deadline = time.time() + heartbeat_ttl
+        if (cls.get_config().get("use_redis") == True):
+            local_instances = {agent_name: list(cls._local_agent_instances.get(agent_name, ()))
+                               for agent_name in local_agents}
+            pipe = cls.redis_db.pipeline(transaction=False)
+            pipe.zadd("agents_heartbeats", {agent_name: deadline for agent_name in local_agents})
+            instances = {cls._agent_instance_heartbeat_member(agent_name, instance_id): deadline
+                         for agent_name, instance_ids in local_instances.items() for instance_id in instance_ids}
+            if instances:
+                pipe.zadd("agents_instances_heartbeats", instances)
+            for agent_name in local_agents:
+                pipe.hexists("agents", agent_name)
+            for agent_name, instance_ids in local_instances.items():
+                for instance_id in instance_ids:
+                    # restores the instances removed by a sweeper while their agent has other instances alive
+                    pipe.hsetnx(cls._agent_instances_key(agent_name), instance_id, 0)
+            results = pipe.execute()[2 if instances else 1:]
+            removed = [agent_name for agent_name, exists in zip(local_agents, results) if not exists]
+            if removed:
+                pipe = cls.redis_db.pipeline(transaction=True)
+                pipe.hset("agents", mapping={agent_name: cls.serializer.dumps(local_agents[agent_name])
+                                             for agent_name in removed})
+                for agent_name in removed:
+                    for instance_id in cls._local_agent_instances.get(agent_name, ()):
+                        pipe.hsetnx(cls._agent_instances_key(agent_name), instance_id, 0)
+                pipe.publish(cls.REGISTRY_CHANNEL, "agents")
+                pipe.execute()
+                cls._invalidate_registry_hash("agents")
+        else:
+            with cls._agents_instances_lock:
+                for agent_name, agent_metadata in local_agents.items():
+                    cls.agents_heartbeats[agent_name] = deadline
+                    cls.agents_metadata_dict.setdefault(agent_name, agent_metadata)
+                    for instance_id in cls._local_agent_instances.get(agent_name, ()):
+                        cls.agents_instances_heartbeats[(agent_name, instance_id)] = deadline
+                        cls.agents_instances.setdefault(agent_name, {}).setdefault(instance_id, 0)
+
+    @classmethod
+    def sweep_dead_agents(cls) -> List[str]:
+        """
+        Remove from the registry the agents whose heartbeat expired, e.g. because their process died
+        without unregistering them, and the instances of replicated agents whose heartbeat expired.
+
+        Returns:
+            List[str]: the names of the agents that have been removed
+        """
+        if (cls.get_config().get("use_redis") == True):
+            now = time.time()
+            dead, dead_instances = _get_script(cls.redis_db, _SWEEP_DEAD_AGENTS_SCRIPT)(
+                keys=["agents_heartbeats", "agents", "agents_embeddings", "agents_instances_heartbeats"],
+                args=[now, cls._agent_instances_key("")])
+            dead = [name.decode("utf-8") for name in dead]
+            dead_instances = [tuple(reversed(member.decode("utf-8").split(":", 1))) for member in dead_instances]
+            # no agent is dead right after a sweep
+            cls._dead_agent_names = (now, set())
+            if dead:
+                pipe = cls.redis_db.pipeline(transaction=False)
+                pipe.publish(cls.REGISTRY_CHANNEL, "agents")
+                pipe.publish(cls.REGISTRY_CHANNEL, "agents_embeddings")
+                pipe.execute()
+                cls._invalidate_registry_hash("agents")
+                cls._invalidate_registry_hash("agents_embeddings")
+        else:
+            with cls._agents_instances_lock:
+                dead = list(cls._get_dead_agent_names())
+                for agent_name in dead:
+                    cls.agents_heartbeats.pop(agent_name, None)
+                    cls.agents_metadata_dict.pop(agent_name, None)
+                    cls.agents_instances.pop(agent_name, None)
+                cls._replace_agents_embeddings(removed=dead)
+                dead_instances = []
+                for key, deadline in list(cls.agents_instances_heartbeats.items()):
+                    if cls._is_heartbeat_expired(deadline):
+                        del cls.agents_instances_heartbeats[key]
+                        instances = cls.agents_instances.get(key[0])
+                        if instances is not None and instances.pop(key[1], None) is not None:
+                            dead_instances.append(key)
+        for agent_name in dead:
+            logging.warning(f"Agent {agent_name} removed from the registry since its heartbeat expired")
+        for agent_name, instance_id in dead_instances:
+            logging.warning(f"Instance {instance_id} of agent {agent_name} removed from the registry since its "
+                            f"heartbeat expired")
+        return dead
+
+    @classmethod
+    def start_agent_heartbeat(cls, interval: Optional[float] = None):
+        """
+        Start a background thread renewing the heartbeats of the agents registered by this process and
+        removing the dead agents from the registry. It is started automatically when an agent is registered
+        and agent_heartbeat_ttl is configured.
+
+        Args:
+            interval (Optional[float]): the number of seconds between two runs, defaults to the
+            agent_heartbeat_interval configuration or a third of agent_heartbeat_ttl
+        """
+        if cls._agent_heartbeat is not None:
+            return
+        if interval is None:
+            interval = cls._get_agent_heartbeat_interval()
+        cls._agent_heartbeat_stop.clear()
+
+        def beat():
+            while not cls._agent_heartbeat_stop.wait(interval):
+                try:
+                    cls.renew_agent_heartbeats()
+                    cls.sweep_dead_agents()
+                except Exception as e:
+                    logging.error(f"Error renewing the agent heartbeats: {e}")
+
+        cls._agent_heartbeat = threading.Thread(target=beat, name="WiseAgentHeartbeat", daemon=True)
+        cls._agent_heartbeat.start()
+
+    @classmethod
+    def stop_agent_heartbeat(cls):
+        """Stop the background thread renewing the heartbeats of the agents registered by this process."""
+        if cls._agent_heartbeat is not None:
+            cls._agent_heartbeat_stop.set()
+            cls._agent_heartbeat.join()
+            cls._agent_heartbeat = None
     @classmethod    
     def register_context(cls, context : WiseAgentContext):
         """
@@ -1082,22 +2548,48 @@ class WiseAgentRegistry:
         """
         if (cls.does_context_exist(context.name) == True):
             raise NameError(f"Context with name {context.name} already exists")
+        context_ttl = cls.get_config().get("context_ttl")
+        context_idle_ttl = cls.get_config().get("context_idle_ttl")
         if (cls.get_config().get("use_redis") == True):
-            cls.redis_db.hset("contexts", key=context.name, value=pickle.dumps(context))
+            pipe = cls.redis_db.pipeline(transaction=True)
+            descriptor = cls.serializer.dumps(context.descriptor)
+            pipe.hset("contexts", key=context.name, value=descriptor)
+            if context.parent_name is not None:
+                pipe.sadd(f"{context.parent_name}:children", context.name)
+            if context_ttl:
+                pipe.zadd("contexts_deadlines", {context.name: context.created_at + context_ttl})
+            if context_idle_ttl:
+                pipe.zadd("contexts_idle_deadlines", {context.name: context.created_at + context_idle_ttl})
+            pipe.execute()
+            cls._cache_context_handle(context.name, descriptor, context)
         else:
-            cls.contexts[context.name] = context
+            with cls._contexts_lock:
+                cls.contexts[context.name] = context
+                if context.parent_name is not None:
+                    cls.context_children.setdefault(context.parent_name, set()).add(context.name)
+                if context_ttl:
+                    cls.context_deadlines[context.name] = context.created_at + context_ttl
+                if context_idle_ttl:
+                    cls.context_idle_deadlines[context.name] = context.created_at + context_idle_ttl
+        if (context_ttl or context_idle_ttl) and cls._context_reaper is None:
+            cls.start_context_reaper()
     @classmethod    
     def fetch_agents_metadata_dict(cls) -> dict [str, WiseAgentMetaData]:
         """
-        Get the dict with the agent names as keys and metadata as values
+        Get the dict with the agent names as keys and metadata as values.
+        If agent_heartbeat_ttl is configured, the agents whose heartbeat expired are not included.
         """
         if (cls.get_config().get("use_redis") == True):
-            redis_dict = cls.redis_db.hgetall("agents")
-            return_dictionary : Dict[str, WiseAgentMetaData]= {}
-            for key in redis_dict:
-                return_dictionary[key.decode('utf-8')] = pickle.loads(redis_dict[key])
-            return return_dictionary
-        else:
+            agents = dict(cls._get_registry_hash("agents"))
+            dead_agent_names = cls._get_dead_agent_names()
+            if dead_agent_names:
+                agents = {name: metadata for name, metadata in agents.items() if name not in dead_agent_names}
+            return agents
+        with cls._agents_instances_lock:
+            dead_agent_names = cls._get_dead_agent_names()
+            if dead_agent_names:
+                return {name: metadata for name, metadata in cls.agents_metadata_dict.items()
+                        if name not in dead_agent_names}
             return cls.agents_metadata_dict
     
     @classmethod
@@ -1109,7 +2601,8 @@ class WiseAgentRegistry:
             dictionary = cls.redis_db.hgetall("contexts")
             return_dictionary : Dict[str, WiseAgentContext]= {}
             for key in dictionary:
-                 return_dictionary[key] = pickle.loads(dictionary.get(key))
+                context_name = key.decode("utf-8")
+                return_dictionary[context_name] = cls._get_context_handle(context_name, dictionary.get(key))
             return return_dictionary
         else:
             return cls.contexts
@@ -1120,28 +2613,71 @@ class WiseAgentRegistry:
         Get the agent metadata for the agent with the given name
         """
         if (cls.get_config().get("use_redis") == True):
-            return_byte = cls.redis_db.hget("agents", key=agent_name)
-            if return_byte is not None:
-                return pickle.loads(return_byte)
-            else:  
-                return None
+            return cls._get_registry_hash("agents").get(agent_name)
         else:
             return cls.agents_metadata_dict.get(agent_name) 
     
     @classmethod
     def get_context(cls, context_name: str) -> WiseAgentContext:
-        """ Get the context with the given name """
+        """
+        Get the context with the given name. If context_idle_ttl is configured, getting a context
+        postpones its idle expiry.
+        """
         context : WiseAgentContext = None
+        context_idle_ttl = cls.get_config().get("context_idle_ttl")
         if (cls.get_config().get("use_redis") == True):
-            ctx = cls.redis_db.hget("contexts", key=context_name)
-            if ctx is not None:
-                context : WiseAgentContext = pickle.loads(ctx)
+            if context_idle_ttl:
+                pipe = cls.redis_db.pipeline(transaction=False)
+                pipe.hget("contexts", key=context_name)
+                pipe.zadd("contexts_idle_deadlines", {context_name: time.time() + context_idle_ttl}, xx=True, gt=True)
+                ctx = pipe.execute()[0]
             else:
-                context = None
+                ctx = cls.redis_db.hget("contexts", key=context_name)
+            context = cls._get_context_handle(context_name, ctx)
         else:
             context = cls.contexts.get(context_name)
+            if context is not None and context_idle_ttl:
+                cls.context_idle_deadlines[context_name] = time.time() + context_idle_ttl
+        return context
+
+    @classmethod
+    def _get_context_handle(cls, context_name: str, descriptor: Optional[bytes]) -> Optional[WiseAgentContext]:
+        """
+        Get the handle of the context with the given name from the per-process LRU, creating it from the
+        descriptor stored in redis if it is not cached or the cached handle is stale.
+
+        Args:
+            context_name (str): the name of the context
+            descriptor (Optional[bytes]): the descriptor stored in redis, None if the context doesn't exist
+        Returns:
+            Optional[WiseAgentContext]: the context handle, None if the context doesn't exist
+        """
+        with cls._context_handles_lock:
+            cached = cls._context_handles.get(context_name)
+            if descriptor is None:
+                cls._context_handles.pop(context_name, None)
+                return None
+            if cached is not None and cached[0] == descriptor:
+                cls._context_handles.move_to_end(context_name)
+                return cached[1]
+        value = cls.serializer.loads(descriptor)
+        if isinstance(value, WiseAgentContext):
+            # a whole context stored by a previous version
+            context = value
+        else:
+            context = WiseAgentContext.from_descriptor(value, cls.config)
+        cls._cache_context_handle(context_name, descriptor, context)
         return context
 
+    @classmethod
+    def _cache_context_handle(cls, context_name: str, descriptor: bytes, context: WiseAgentContext):
+        """Add the context handle to the per-process LRU, evicting the least recently used handles beyond context_cache_size."""
+        with cls._context_handles_lock:
+            cls._context_handles[context_name] = (descriptor, context)
+            cls._context_handles.move_to_end(context_name)
+            while len(cls._context_handles) > cls.get_config().get("context_cache_size", 1024):
+                cls._context_handles.popitem(last=False)
+
     @classmethod
     def create_context(cls, context_name: str) -> WiseAgentContext:
         """ Create the context with the given name """
@@ -1166,7 +2702,8 @@ class WiseAgentRegistry:
             raise NameError(f"Sub Context name {sub_context_name} cannot contain an underscore")
         if cls.does_context_exist(parent_context_name):
             logging.debug(f"set_collaboration_type (0.0) cls.config: {cls.config}")
-            sub_context = WiseAgentContext(f'{parent_context_name}_{sub_context_name}', cls.config)
+            sub_context = WiseAgentContext(f'{parent_context_name}_{sub_context_name}', cls.config,
+                                           parent_name=parent_context_name)
             logging.debug(f"set_collaboration_type (0.1) sub_context: {sub_context} _use_redis: {sub_context._use_redis}")
     
             return sub_context
@@ -1178,7 +2715,7 @@ class WiseAgentRegistry:
     @classmethod
     def remove_context(cls, context_name: str, merge_chat_to_parent: Optional[bool] = False) -> Optional[WiseAgentContext]:
         """
-        Remove the context from the registry
+        Remove the context from the registry, together with all its sub contexts
 
         Args:
             context_name (str): the name of the context
@@ -1189,20 +2726,138 @@ class WiseAgentRegistry:
         """
         parent_context_name = None
         parent_context = None
-        if ("_" in context_name and merge_chat_to_parent): # it has a parent context
-            parent_context_name = "_".join(context_name.split("_")[:-1])
+        context = cls.get_context(context_name)
+        if context is not None:
+            # the parent recorded when the context was registered
+            parent_context_name = context.parent_name
+        if (parent_context_name is not None and merge_chat_to_parent):
             parent_context = cls.get_context(parent_context_name)
-            context = cls.get_context(context_name)
             if parent_context is not None and context is not None:
                 parent_context.append_chat_completion(context.llm_chat_completion)
             else:
                 raise NameError(f"Parent context with name {parent_context_name} or context with name {context_name} does not exist")
+        for sub_context_name in cls.get_sub_context_names(context_name):
+            cls.remove_context(sub_context_name)
         logging.info(f"Removing context {context_name}")    
         if (cls.get_config().get("use_redis") == True):
-            cls.redis_db.hdel("contexts", context_name)
+            if context is not None and context._use_redis:
+                context._delete_redis_data()
+            pipe = cls.redis_db.pipeline(transaction=True)
+            pipe.hdel("contexts", context_name)
+            pipe.delete(f"{context_name}:children")
+            if parent_context_name is not None:
+                pipe.srem(f"{parent_context_name}:children", context_name)
+            pipe.zrem("contexts_deadlines", context_name)
+            pipe.zrem("contexts_idle_deadlines", context_name)
+            pipe.publish(cls.REGISTRY_CHANNEL, cls.CONTEXT_REMOVED_NOTIFICATION + context_name)
+            pipe.execute()
+            cls._evict_context(context_name)
         else:
-            cls.contexts.pop(context_name)
+            # the context may be removed concurrently, e.g. by the reaper
+            with cls._contexts_lock:
+                cls.contexts.pop(context_name, None)
+                cls.context_children.pop(context_name, None)
+                if parent_context_name is not None:
+                    cls.context_children.get(parent_context_name, set()).discard(context_name)
+                cls.context_deadlines.pop(context_name, None)
+                cls.context_idle_deadlines.pop(context_name, None)
         return parent_context
+
+    @classmethod
+    def get_sub_context_names(cls, context_name: str) -> List[str]:
+        """
+        Get the names of the direct sub contexts of the context with the given name
+
+        Args:
+            context_name (str): the name of the context
+        Returns:
+            List[str]: the names of the sub contexts
+        """
+        if (cls.get_config().get("use_redis") == True):
+            return [name.decode("utf-8") for name in cls.redis_db.smembers(f"{context_name}:children")]
+        else:
+            with cls._contexts_lock:
+                return list(cls.context_children.get(context_name, set()))
+
+    @classmethod
+    def reap_expired_contexts(cls) -> List[str]:
+        """
+        Remove the contexts, together with their sub contexts, that lived longer than context_ttl seconds
+        or that were not used for more than context_idle_ttl seconds. A context that is idle is kept
+        as long as one of its sub contexts is still in use.
+
+        Returns:
+            List[str]: the names of the expired contexts that have been removed
+        """
+        now = time.time()
+        if (cls.get_config().get("use_redis") == True):
+            pipe = cls.redis_db.pipeline(transaction=False)
+            pipe.zrangebyscore("contexts_deadlines", "-inf", now)
+            pipe.zrangebyscore("contexts_idle_deadlines", "-inf", now)
+            expired, idle = [{name.decode("utf-8") for name in names} for names in pipe.execute()]
+        else:
+            with cls._contexts_lock:
+                expired = {name for name, deadline in cls.context_deadlines.items() if deadline <= now}
+                idle = {name for name, deadline in cls.context_idle_deadlines.items() if deadline <= now}
+
+        def in_use(context_name: str) -> bool:
+            return any((sub_context_name not in expired and sub_context_name not in idle) or in_use(sub_context_name)
+                       for sub_context_name in cls.get_sub_context_names(context_name))
+
+        expired |= {context_name for context_name in idle if not in_use(context_name)}
+        # only remove the contexts that are not sub contexts of other expired contexts, since the sub contexts are
+        # removed with their parent
+        descendants = set()
+
+        def add_descendants(context_name: str):
+            for sub_context_name in cls.get_sub_context_names(context_name):
+                if sub_context_name not in descendants:
+                    descendants.add(sub_context_name)
+                    add_descendants(sub_context_name)
+
+        for context_name in expired:
+            add_descendants(context_name)
+        removed = []
+        for context_name in sorted(expired - descendants):
+            if cls.does_context_exist(context_name):
+                logging.info(f"Context {context_name} expired")
+                cls.remove_context(context_name)
+                removed.append(context_name)
+        return removed
+
+    @classmethod
+    def start_context_reaper(cls, interval: Optional[float] = None):
+        """
+        Start a background thread removing the expired contexts periodically.
+        It is started automatically when a context is registered and context_ttl or context_idle_ttl is configured.
+
+        Args:
+            interval (Optional[float]): the number of seconds between two runs, defaults to the
+            context_reaper_interval configuration or 60 seconds
+        """
+        if cls._context_reaper is not None:
+            return
+        if interval is None:
+            interval = cls.get_config().get("context_reaper_interval", 60)
+        cls._context_reaper_stop.clear()
+
+        def reap():
+            while not cls._context_reaper_stop.wait(interval):
+                try:
+                    cls.reap_expired_contexts()
+                except Exception as e:
+                    logging.error(f"Error removing expired contexts: {e}")
+
+        cls._context_reaper = threading.Thread(target=reap, name="WiseAgentContextReaper", daemon=True)
+        cls._context_reaper.start()
+
+    @classmethod
+    def stop_context_reaper(cls):
+        """Stop the background thread removing the expired contexts."""
+        if cls._context_reaper is not None:
+            cls._context_reaper_stop.set()
+            cls._context_reaper.join()
+            cls._context_reaper = None
     
     @classmethod
     def does_context_exist(cls, context_name: str) -> bool:
@@ -1218,37 +2873,95 @@ class WiseAgentRegistry:
                 return True
     
     @classmethod
-    def unregister_agent(cls, agent_name: str):
-        """
-        Remove the agent from the registry this should be used only on agents which already stopped transport connection
+    def unregister_agent(cls, agent_name: str, instance_id: Optional[str] = None):
         """
+        Remove the agent from the registry this should be used only on agents which already stopped transport connection.
+        If an instance id is given, only this instance of the replicated agent is removed, and the agent
+        is removed with its last instance.
+
+        Args:
+            agent_name (str): the name of the agent
+            instance_id (Optional[str]): the id of the instance of a replicated agent
+        """
+        if instance_id is not None:
+            local_instances = cls._local_agent_instances.get(agent_name, set())
+            local_instances.discard(instance_id)
+            if not local_instances:
+                cls._local_agent_instances.pop(agent_name, None)
+                cls._local_agents.pop(agent_name, None)
+        else:
+            cls._local_agent_instances.pop(agent_name, None)
+            cls._local_agents.pop(agent_name, None)
         if (cls.get_config().get("use_redis") == True):
-            cls.redis_db.hdel("agents", agent_name)
+            pipe = cls.redis_db.pipeline(transaction=True)
+            if instance_id is not None:
+                _get_script(cls.redis_db, _UNREGISTER_AGENT_INSTANCE_SCRIPT)(
+                    keys=[cls._agent_instances_key(agent_name), "agents", "agents_embeddings", "agents_heartbeats",
+                          "agents_instances_heartbeats"],
+                    args=[instance_id, agent_name, cls._agent_instance_heartbeat_member(agent_name, instance_id)],
+                    client=pipe)
+            else:
+                pipe.hdel("agents", agent_name)
+                pipe.hdel("agents_embeddings", agent_name)
+                pipe.zrem("agents_heartbeats", agent_name)
+                pipe.delete(cls._agent_instances_key(agent_name))
+            pipe.publish(cls.REGISTRY_CHANNEL, "agents")
+            pipe.publish(cls.REGISTRY_CHANNEL, "agents_embeddings")
+            pipe.execute()
+            cls._invalidate_registry_hash("agents")
+            cls._invalidate_registry_hash("agents_embeddings")
         else:
-            if cls.agents_metadata_dict.get(agent_name) is not None:
-                cls.agents_metadata_dict.pop(agent_name)
+            with cls._agents_instances_lock:
+                instances = cls.agents_instances.get(agent_name)
+                if instance_id is not None:
+                    cls.agents_instances_heartbeats.pop((agent_name, instance_id), None)
+                if instance_id is not None and instances is not None:
+                    instances.pop(instance_id, None)
+                    if instances:
+                        return
+                for other_instance_id in (instances or {}):
+                    cls.agents_instances_heartbeats.pop((agent_name, other_instance_id), None)
+                cls.agents_instances.pop(agent_name, None)
+                if cls.agents_metadata_dict.get(agent_name) is not None:
+                    cls.agents_metadata_dict.pop(agent_name)
+                cls._replace_agents_embeddings(removed=[agent_name])
+                cls.agents_heartbeats.pop(agent_name, None)
         
     @classmethod
     def register_tool(cls, tool : WiseAgentTool):
         """
-        Register a tool with the registry
+        Register a tool with the registry. In redis mode only the schema of the tool is stored, and the tool is
+        executed with the callback resolved from its import path, except in this process which keeps the tool.
+        Within a bulk_registration block, the tool is only registered when the block exits.
         """
-        if (cls.get_config().get("use_redis") == True):
-            cls.redis_db.hset("tools", key=tool.name, value=pickle.dumps(tool))
+        pending = getattr(cls._bulk_registration_state, "pending", None)
+        if pending is not None:
+            pending[1].append(tool)
+        elif (cls.get_config().get("use_redis") == True):
+            cls._check_tool_call_back(tool)
+            pipe = cls.redis_db.pipeline(transaction=True)
+            pipe.hset("tools", key=tool.name, value=cls.serializer.dumps(tool.schema))
+            pipe.publish(cls.REGISTRY_CHANNEL, "tools")
+            pipe.execute()
+            cls._local_tools[tool.name] = tool
+            cls._invalidate_registry_hash("tools")
         else:
             cls.tools[tool.name] = tool
     
+    @classmethod
+    def _check_tool_call_back(cls, tool: WiseAgentTool):
+        '''Warn that the given tool can only be executed by this process when its callback can't be imported.'''
+        if tool.has_local_call_back:
+            logging.warning(f"The callback of the tool {tool.name} can't be imported (e.g. a lambda, a closure or a "
+                            f"function of __main__), the tool can only be executed by this process")
+
     @classmethod
     def get_tools(cls) -> dict[str, WiseAgentTool]:
         """
         Get the list of tools
         """
         if (cls.get_config().get("use_redis") == True):
-            dictionary = cls.redis_db.hgetall("tools")
-            return_dictionary : Dict[str, WiseAgentTool]= {}
-            for key in dictionary:
-                 return_dictionary[key] = pickle.loads(dictionary.get(key))
-            return return_dictionary
+            return {tool_name: cls.get_tool(tool_name) for tool_name in cls.get_tool_schemas()}
         else:
             return cls.tools
     
@@ -1258,15 +2971,211 @@ class WiseAgentRegistry:
         Get the tool with the given name
         """
         if (cls.get_config().get("use_redis") == True):
-            pipe = cls.redis_db.pipeline(transaction=True)
-            piped_res= pipe.hexists("tools", key=tool_name).hget("tools", key=tool_name).execute()
-            if piped_res[0]:
-                return pickle.loads(piped_res[1])
-            else:
+            schema = cls.get_tool_schemas().get(tool_name)
+            if schema is None:
                 return None
+            tool = cls._local_tools.get(tool_name)
+            if tool is not None and tool.hash == schema["hash"]:
+                return tool
+            tool = cls._remote_tools.get(schema["hash"])
+            if tool is None:
+                tool = WiseAgentTool.from_schema(schema)
+                cls._remote_tools[schema["hash"]] = tool
+            return tool
         else:
             return cls.tools.get(tool_name)
 
+    @classmethod
+    def get_tool_schemas(cls) -> dict[str, dict]:
+        """
+        Get the schemas of the tools, as returned by WiseAgentTool.schema, by tool name. Their hashes can be used to
+        find out whether a tool changed. The returned dict must not be modified.
+        """
+        if (cls.get_config().get("use_redis") == True):
+            return cls._get_registry_hash("tools", cls._decode_tool_schema)
+        else:
+            return {tool_name: tool.schema for tool_name, tool in cls.tools.items()}
+
+    @classmethod
+    def _decode_tool_schema(cls, value: bytes) -> dict:
+        """Decode a tool schema stored in redis, accepting the whole tools stored by previous versions."""
+        schema = cls.serializer.loads(value)
+        if isinstance(schema, WiseAgentTool):
+            return schema.schema
+        return schema
+
+    @classmethod
+    def get_routing_index(cls) -> WiseAgentRoutingIndex:
+        """
+        Get the index used to find the agents relevant for a query, using the embedding model configured by
+        agent_routing_embedding_model if it was not set with set_routing_index
+        """
+        if cls._routing_index is None:
+            cls._routing_index = WiseAgentRoutingIndex(
+                cls.get_config().get("agent_routing_embedding_model", DEFAULT_EMBEDDING_MODEL_NAME))
+        return cls._routing_index
+
+    @classmethod
+    def set_routing_index(cls, routing_index: WiseAgentRoutingIndex):
+        """
+        Set the index used to find the agents relevant for a query, e.g. to use different embeddings
+
+        Args:
+            routing_index (WiseAgentRoutingIndex): the routing index
+        """
+        cls._routing_index = routing_index
+
+    @classmethod
+    def get_relevant_agent_names_and_descriptions(cls, query: str, top_k: int) -> List[str]:
+        """
+        Get the names and descriptions of the top_k agents whose descriptions are the most relevant for the given query.
+        The embeddings of the agent descriptions are kept by the registry when agent_routing_index is configured,
+        and computed on first use for the agents registered without it.
+
+        Args:
+            query (str): the query
+            top_k (int): the maximum number of agents to return
+        Returns:
+            List[str]: the list of agent names and descriptions, the most relevant first
+        """
+        agents = cls.fetch_agents_metadata_dict()
+        if len(agents) <= top_k:
+            return cls._format_agent_names_and_descriptions(agents.items())
+        if (cls.get_config().get("use_redis") == True):
+            agents_embeddings = cls._get_registry_hash("agents_embeddings",
+                                                       lambda value: np.frombuffer(value, dtype=np.float32))
+        else:
+            agents_embeddings = cls.agents_embeddings
+        missing = [agent_name for agent_name in agents if agent_name not in agents_embeddings]
+        if missing:
+            embeddings = dict(zip(missing, cls.get_routing_index().embed_descriptions(
+                [agents[agent_name].description for agent_name in missing])))
+            cls._store_agents_embeddings(embeddings)
+            agents_embeddings = {**agents_embeddings, **embeddings}
+        # the index reuses the matrix of all the embeddings, scoring only the rows of the agents alive
+        agent_names = cls.get_routing_index().get_most_relevant_agents(
+            query, agents_embeddings, top_k, agents if len(agents) != len(agents_embeddings) else None)
+        return cls._format_agent_names_and_descriptions((agent_name, agents[agent_name]) for agent_name in agent_names)
+
+    @classmethod
+    def _store_agents_embeddings(cls, agents_embeddings: dict[str, np.ndarray]):
+        """Store the embeddings of the descriptions of agents that were registered without them."""
+        if (cls.get_config().get("use_redis") == True):
+            pipe = cls.redis_db.pipeline(transaction=True)
+            pipe.hset("agents_embeddings", mapping={agent_name: embedding.tobytes()
+                                                    for agent_name, embedding in agents_embeddings.items()})
+            pipe.publish(cls.REGISTRY_CHANNEL, "agents_embeddings")
+            pipe.execute()
+            cls._invalidate_registry_hash("agents_embeddings")
+        else:
+            with cls._agents_instances_lock:
+                cls._replace_agents_embeddings(agents_embeddings)
+
+    @classmethod
+    def _replace_agents_embeddings(cls, updated: Optional[dict[str, np.ndarray]] = None,
+                                   removed: Iterable[str] = ()):
+        """Replace the in-memory embeddings of the agent descriptions with a copy holding the given changes."""
+        removed = [agent_name for agent_name in removed if agent_name in cls.agents_embeddings]
+        if not updated and not removed:
+            return
+        agents_embeddings = dict(cls.agents_embeddings)
+        for agent_name in removed:
+            del agents_embeddings[agent_name]
+        agents_embeddings.update(updated or {})
+        cls.agents_embeddings = agents_embeddings
+
+    @classmethod
+    def _get_registry_hash(cls, hash_name: str, decode: Optional[Callable[[bytes], Any]] = None) -> dict[str, Any]:
+        """
+        Get the content of a registry hash (e.g. agents or tools) from the local cache, loading it from redis if it was
+        invalidated or loaded more than registry_cache_ttl seconds ago (default 30, 0 disables the cache).
+        The returned dict is the cached one, so it must not be modified.
+
+        Args:
+            hash_name (str): the name of the hash, e.g. agents or tools
+            decode (Optional[Callable[[bytes], Any]]): the function decoding the values, by default the serializer
+        Returns:
+            dict[str, Any]: the deserialized values of the hash by name
+        """
+        ttl = cls.get_config().get("registry_cache_ttl", 30)
+        if not ttl:
+            return cls._load_registry_hash(hash_name, decode)
+        cached = cls._registry_cache.get(hash_name)
+        if cached is not None and time.time() - cached[0] < ttl:
+            return cached[1]
+        cls._start_registry_listener()
+        generation = cls._registry_cache_generations.get(hash_name, 0)
+        loaded_at = time.time()
+        content = cls._load_registry_hash(hash_name, decode)
+        with cls._registry_cache_lock:
+            if cls._registry_cache_generations.get(hash_name, 0) == generation:
+                cls._registry_cache[hash_name] = (loaded_at, content)
+        return content
+
+    @classmethod
+    def _load_registry_hash(cls, hash_name: str, decode: Optional[Callable[[bytes], Any]] = None) -> dict[str, Any]:
+        """Load and decode the content of the given hash from redis."""
+        decode = decode or cls.serializer.loads
+        return {key.decode("utf-8"): decode(value) for key, value in cls.redis_db.hgetall(hash_name).items()}
+
+    @classmethod
+    def _invalidate_registry_hash(cls, hash_name: Optional[str] = None):
+        """Remove the given hash, or all the hashes, from the local cache."""
+        with cls._registry_cache_lock:
+            for name in [hash_name] if hash_name is not None else list(cls._registry_cache):
+                cls._registry_cache_generations[name] = cls._registry_cache_generations.get(name, 0) + 1
+                cls._registry_cache.pop(name, None)
+            if hash_name is None or hash_name == "agents":
+                # an agent whose heartbeat expired may have been registered again
+                cls._dead_agent_names = None
+
+    @classmethod
+    def _start_registry_listener(cls):
+        """Start the thread receiving the notifications invalidating the local cache of the agents and tools hashes."""
+        with cls._registry_cache_lock:
+            if cls._registry_listener is not None:
+                return
+
+            def on_notification(message):
+                notification = message["data"].decode("utf-8")
+                if notification.startswith(cls.CONTEXT_REMOVED_NOTIFICATION):
+                    cls._evict_context(notification[len(cls.CONTEXT_REMOVED_NOTIFICATION):])
+                else:
+                    cls._invalidate_registry_hash(notification)
+
+            def on_error(error, pubsub, thread):
+                # notifications may have been missed, so drop the cache and subscribe again when it is used
+                logging.error(f"Error receiving the registry notifications: {error}")
+                thread.stop()
+                pubsub.close()
+                with cls._registry_cache_lock:
+                    if cls._registry_listener is thread:
+                        cls._registry_listener = None
+                cls._invalidate_registry_hash()
+                WiseAgentContext._redis_cache.clear()
+
+            pubsub = cls.redis_db.pubsub(ignore_subscribe_messages=True)
+            pubsub.subscribe(**{cls.REGISTRY_CHANNEL: on_notification})
+            cls._registry_listener = pubsub.run_in_thread(sleep_time=1, daemon=True, exception_handler=on_error)
+
+    @classmethod
+    def _evict_context(cls, context_name: str):
+        """Evict the handle and the fields of the given context from the local caches."""
+        with cls._context_handles_lock:
+            cls._context_handles.pop(context_name, None)
+        WiseAgentContext._redis_cache.evict_context(context_name)
+
+    @classmethod
+    def stop_registry_listener(cls):
+        """Stop the thread receiving the notifications invalidating the local cache of the agents and tools hashes."""
+        with cls._registry_cache_lock:
+            listener = cls._registry_listener
+            cls._registry_listener = None
+        if listener is not None:
+            listener.stop()
+            listener.join()
+        cls._invalidate_registry_hash()
+
     @classmethod
     def get_agent_names_and_descriptions(cls) -> List[str]:
         """
@@ -1275,8 +3184,13 @@ class WiseAgentRegistry:
         Returns:
             List[str]: the list of agent descriptions
         """
+        return cls._format_agent_names_and_descriptions(cls.fetch_agents_metadata_dict().items())
+
+    @classmethod
+    def _format_agent_names_and_descriptions(cls, agents: Iterable[Tuple[str, WiseAgentMetaData]]) -> List[str]:
+        """Format the given agent names and metadata for an agent selection prompt."""
         agent_descriptions = []
-        for agent_name, agent_metadata in cls.fetch_agents_metadata_dict().items():
+        for agent_name, agent_metadata in agents:
             agent_descriptions.append(f"Agent Name: {agent_name} Agent Description: {agent_metadata.description}")
 
         return agent_descriptions
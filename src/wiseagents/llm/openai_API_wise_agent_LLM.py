@@ -1,4 +1,5 @@
-from typing import Dict, Iterable, Optional
+import logging
+from typing import Dict, Iterable, Iterator, Optional
 
 import openai
 from openai.types.chat import ChatCompletionMessageParam, ChatCompletion, ChatCompletionToolParam
@@ -106,6 +107,33 @@ class OpenaiAPIWiseAgentLLM(WiseAgentRemoteLLM):
             **self.openai_config
             )
         return response
+
+    def process_chat_completion_stream(self,
+                                       messages: Iterable[ChatCompletionMessageParam],
+                                       tools: Iterable[ChatCompletionToolParam]) -> Iterator[str]:
+        '''Process a chat completion, yielding the content of the response as the tokens are received.
+        This method is implemented from superclass WiseAgentLLM.
+
+        Args:
+            messages (Iterable[ChatCompletionMessageParam]): the messages to process
+            tools (Iterable[ChatCompletionToolParam]): the tools to use
+
+        Returns:
+                Iterator[str]: the chunks of the content of the response'''
+        logging.debug(f"Streaming WiseAgentLLM on remote machine at {self.remote_address}")
+        if (self.client is None):
+            self.connect()
+        stream = self.client.chat.completions.create(
+            messages=messages,
+            model=self.model_name,
+            tools=tools,
+            tool_choice="auto",  # auto is default, but we'll be explicit
+            stream=True,
+            **self.openai_config
+            )
+        for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
         
     @property
     def api_key(self):
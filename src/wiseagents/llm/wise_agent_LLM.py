@@ -1,5 +1,5 @@
 from abc import abstractmethod
-from typing import Iterable, Optional
+from typing import Iterable, Iterator, Optional
 
 import yaml
 from openai.types.chat import ChatCompletionMessageParam, ChatCompletion, ChatCompletionToolParam
@@ -60,4 +60,21 @@ class WiseAgentLLM(WiseAgentsYAMLObject):
         
         Returns:
                 ChatCompletion: the chat completion result'''
-        ...
\ No newline at end of file
+        ...
+
+    def process_chat_completion_stream(self,
+                                       messages: Iterable[ChatCompletionMessageParam],
+                                       tools: Iterable[ChatCompletionToolParam]) -> Iterator[str]:
+        '''Process a chat completion, yielding the content of the response as it is generated.
+        By default, the whole content is yielded at once once process_chat_completion returns: subclasses
+        supporting streaming should override this method.
+
+        Args:
+            messages (Iterable[ChatCompletionMessageParam]): the messages to process
+            tools (Iterable[ChatCompletionToolParam]): the tools to use
+
+        Returns:
+                Iterator[str]: the chunks of the content of the response'''
+        content = self.process_chat_completion(messages, tools).choices[0].message.content
+        if content:
+            yield content
\ No newline at end of file
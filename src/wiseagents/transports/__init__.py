@@ -4,8 +4,9 @@
 
 # Define any necessary initialization code here
 
-from wiseagents.transports.stomp import StompWiseAgentTransport
+from wiseagents.transports.local import LocalWiseAgentTransport
+from wiseagents.transports.stomp import StompConnectionManager, StompWiseAgentTransport
 
 
 # Optionally, you can define __all__ to specify the public interface of the package
-__all__ = ['StompWiseAgentTransport']
+__all__ = ['LocalWiseAgentTransport', 'StompConnectionManager', 'StompWiseAgentTransport']
@@ -0,0 +1,151 @@
+import itertools
+import logging
+import queue
+import threading
+from typing import Optional
+
+from wiseagents import WiseAgentMessage, WiseAgentTransport
+
+# The default priority of the messages, as for the STOMP brokers
+DEFAULT_PRIORITY = 4
+
+# The queues shared by the transports of the process, by destination, created when they are first used
+_queues: dict[str, queue.PriorityQueue] = {}
+_queues_lock = threading.Lock()
+# Keeps the messages of the same priority in the order they were sent
+_sequence = itertools.count()
+
+
+def _get_queue(destination: str) -> queue.PriorityQueue:
+    '''Get the queue of the given destination, creating it if needed.'''
+    with _queues_lock:
+        destination_queue = _queues.get(destination)
+        if destination_queue is None:
+            destination_queue = _queues[destination] = queue.PriorityQueue()
+        return destination_queue
+
+
+class LocalWiseAgentTransport(WiseAgentTransport):
+    '''
+    A transport for sending messages between agents running in the same process, without broker nor serialization.
+    The messages are delivered through in-memory queues, using the same destinations as StompWiseAgentTransport,
+    and each transport has a dispatcher thread per queue it consumes, calling the call backs as the STOMP listeners do:
+    the requests of an agent are processed one at a time, or by as many dispatcher threads as its maximum concurrency,
+    concurrently with its responses, and the instances of a replicated agent share its request queue. The messages with a higher priority are delivered first and the
+    expired messages are discarded, as done by the brokers. Each receiver gets its own copy of the message.
+    '''
+
+    yaml_tag = u'!wiseagents.transports.LocalWiseAgentTransport'
+    # How often, in seconds, the dispatcher threads check whether the transport was stopped
+    POLL_INTERVAL = 0.1
+
+    _dispatchers: Optional[list[threading.Thread]] = None
+    _stop_event: Optional[threading.Event] = None
+
+    def __init__(self, agent_name: str):
+        '''Initialize the transport.
+
+        Args:
+            agent_name (str): the agent name'''
+        self._agent_name = agent_name
+
+    def __repr__(self) -> str:
+        return f"agent_name={self._agent_name}"
+
+    def __getstate__(self) -> object:
+        '''Return the state of the transport, without its dispatcher threads.'''
+        state = super().__getstate__()
+        state.pop('dispatchers', None)
+        state.pop('stop_event', None)
+        return state
+
+    def start(self):
+        '''Start the dispatcher threads consuming the queues of the agent.'''
+        if self._dispatchers is not None:
+            return
+        self._stop_event = threading.Event()
+        destinations = [(self.request_queue, 'request_receiver', f"LocalWiseAgentTransport-{self.request_queue}")]
+        if self.max_concurrency > 1:
+            # competing for the requests, a dispatcher only takes a request when it is free to handle it
+            destinations = [(self.request_queue, 'request_receiver', f"LocalWiseAgentTransport-{self.request_queue}-{i}")
+                            for i in range(self.max_concurrency)]
+        destinations.append((self.response_queue, 'response_receiver', f"LocalWiseAgentTransport-{self.response_queue}"))
+        if self.instance_id is not None:
+            # the responses to the requests sent by this instance of a replicated agent
+            destinations.append((self.instance_response_queue, 'response_receiver',
+                                 f"LocalWiseAgentTransport-{self.instance_response_queue}"))
+        self._dispatchers = [threading.Thread(target=self._dispatch, args=(destination, receiver), name=name,
+                                              daemon=True)
+                             for destination, receiver, name in destinations]
+        for dispatcher in self._dispatchers:
+            dispatcher.start()
+
+    def _dispatch(self, destination: str, receiver: str):
+        '''Deliver the messages of the given queue to the given call back until the transport is stopped.'''
+        destination_queue = _get_queue(destination)
+        stop_event = self._stop_event
+        while not stop_event.is_set():
+            try:
+                _, _, message = destination_queue.get(timeout=self.POLL_INTERVAL)
+            except queue.Empty:
+                continue
+            if message.expired:
+                logging.debug(f"Discarding expired message {message.message_id} sent to {destination}")
+                continue
+            try:
+                getattr(self, receiver)(message)
+            except Exception:
+                logging.exception(f"Error processing message {message.message_id} sent to {destination}")
+
+    def _send(self, message: WiseAgentMessage, destination: str):
+        '''Put a copy of the message in the queue of the given destination.'''
+        priority = message.priority if message.priority is not None else DEFAULT_PRIORITY
+        _get_queue(destination).put((-priority, next(_sequence), message.copy_with(message_id=message.message_id)))
+
+    def send_request(self, message: WiseAgentMessage, dest_agent_name: str):
+        '''Send a request message to an agent.
+
+        Args:
+            message (WiseAgentMessage): the message to send
+            dest_agent_name (str): the destination agent name'''
+        self._send(message, '/queue/request/' + dest_agent_name)
+
+    def send_response(self, message: WiseAgentMessage, dest_agent_name: str, dest_instance_id: Optional[str] = None):
+        '''Send a response message to an agent.
+
+        Args:
+            message (WiseAgentMessage): the message to send
+            dest_agent_name (str): the destination agent name
+            dest_instance_id (Optional[str]): the id of the instance of the destination agent when it is replicated'''
+        response_destination = '/queue/response/' + dest_agent_name
+        if dest_instance_id is not None:
+            response_destination += '.' + dest_instance_id
+        self._send(message, response_destination)
+
+    def stop(self):
+        '''Stop the dispatcher threads, after they deliver the message they are delivering.'''
+        if self._dispatchers is None:
+            return
+        self._stop_event.set()
+        for dispatcher in self._dispatchers:
+            # the transport can be stopped by a call back
+            if dispatcher is not threading.current_thread():
+                dispatcher.join()
+        self._dispatchers = None
+
+    @property
+    def agent_name(self) -> str:
+        '''Get the agent name.'''
+        return self._agent_name
+    @property
+    def request_queue(self) -> str:
+        '''Get the request queue.'''
+        return '/queue/request/' + self.agent_name
+    @property
+    def response_queue(self) -> str:
+        '''Get the response queue.'''
+        return '/queue/response/' + self.agent_name
+    @property
+    def instance_response_queue(self) -> str:
+        '''Get the response queue of this instance of a replicated agent.'''
+        return self.response_queue + '.' + self.instance_id
@@ -1,11 +1,16 @@
+import itertools
 import logging
 import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
 
 import stomp
 import stomp.utils
-import yaml
 
 from wiseagents import WiseAgentMessage, WiseAgentTransport
+from wiseagents.wise_agent_messaging import decode_message
 
 
 class WiseAgentRequestQueueListener(stomp.ConnectionListener):
@@ -28,7 +33,8 @@ class WiseAgentRequestQueueListener(stomp.ConnectionListener):
 
     def on_message(self, message: stomp.utils.Frame):
         '''Handle a message.'''
-        self.transport.request_receiver(yaml.load(message.body, yaml.Loader))
+        self.transport.dispatch_request(decode_message(message.body, message.headers.get('content-type'),
+                                                       message.headers.get('content-encoding')), message.headers)
 
 class WiseAgentResponseQueueListener(stomp.ConnectionListener):
     '''A listener for the response queue.'''
@@ -45,26 +51,309 @@ class WiseAgentResponseQueueListener(stomp.ConnectionListener):
 
     def on_message(self, message: stomp.utils.Frame):
         '''Handle a message.'''
-        self.transport.response_receiver(yaml.load(message.body, yaml.Loader))
+        self.transport.dispatch_response(decode_message(message.body, message.headers.get('content-type'),
+                                                        message.headers.get('content-encoding')))
+
+
+class _StompSubscription():
+    '''A subscription of a connection shared by StompConnectionManager.'''
+
+    def __init__(self, destination: str, listener: stomp.ConnectionListener, ack: str, headers: dict[str, str],
+                 index: int):
+        self.destination = destination
+        self.listener = listener
+        self.ack = ack
+        self.headers = headers
+        # the index of the connection of the subscription
+        self.index = index
+
+
+def _track_thread(threads: set[threading.Thread]):
+    '''Add the current thread, a new thread of an executor, to the given threads of the executor.'''
+    threads.add(threading.current_thread())
+
+
+class _StompRoutingListener(stomp.ConnectionListener):
+    '''A listener routing the frames received by a shared connection to the listeners of their subscription.'''
+
+    def __init__(self, manager: 'StompConnectionManager', index: int):
+        self.manager = manager
+        self.index = index
+
+    def on_message(self, frame: stomp.utils.Frame):
+        '''Pass the message to the listener of its subscription.'''
+        listener = self.manager.get_listener(frame.headers.get('subscription'))
+        if listener is None:
+            logging.warning(f"Discarding message {frame.headers.get('message-id')} of unknown subscription "
+                            f"{frame.headers.get('subscription')}")
+            return
+        listener.on_message(frame)
+
+    def on_error(self, frame: stomp.utils.Frame):
+        '''Pass the error to the listeners of all the subscriptions of the connection.'''
+        for listener in self.manager.get_listeners(self.index):
+            listener.on_error(frame)
+
+    def on_disconnected(self):
+        '''Reconnect the connection and restore its subscriptions, unless it was closed with its last subscription.'''
+        self.manager.reconnect_in_background(self.index)
+
+
+class StompConnectionManager():
+    '''
+    Shares STOMP connections between the transports of a process. The subscriptions of all the transports are
+    multiplexed over a fixed number of connections to the broker (stomp_shared_connections in the registry
+    configuration, default 1) and the frames received are routed to the listener of their subscription, so that the
+    number of connections, heartbeats and receiver threads of a process does not grow with its number of agents.
+    The connections are opened when they get their first subscription and closed when they lose their last one.
+    A connection lost while it still has subscriptions is reconnected in the background, with increasing delays
+    between the attempts, and its subscriptions are restored.
+    '''
+
+    # The delays in seconds between the attempts to reconnect a lost connection
+    RECONNECT_DELAY = 1
+    MAX_RECONNECT_DELAY = 30
+
+    # The managers of the process, by broker host and port
+    _managers: dict[tuple[str, int], 'StompConnectionManager'] = {}
+    _managers_lock = threading.Lock()
+
+    def __init__(self, host: str, port: int, connections: int = 1):
+        '''Initialize the manager.
+
+        Args:
+            host (str): the host of the broker
+            port (int): the port of the broker
+            connections (int): the number of connections the subscriptions are spread over'''
+        if connections < 1:
+            raise ValueError(f"The number of shared connections must be at least 1, not {connections}")
+        self._host = host
+        self._port = port
+        self._connections: list[Optional[stomp.Connection]] = [None] * connections
+        self._subscriptions: dict[str, _StompSubscription] = {}
+        self._subscription_ids = itertools.count()
+        self._lock = threading.RLock()
+        # held while connecting each connection, instead of the lock of the manager, so that a connect only blocks
+        # the users of the same connection
+        self._connect_locks = [threading.RLock() for _ in range(connections)]
+        # the indexes of the connections being reconnected in the background
+        self._reconnecting: set[int] = set()
+
+    @classmethod
+    def get(cls, host: str, port: int) -> 'StompConnectionManager':
+        '''Get the manager of the connections of the process to the given broker, creating it if needed.
+
+        Args:
+            host (str): the host of the broker
+            port (int): the port of the broker
+
+        Returns:
+            StompConnectionManager: the manager'''
+        with cls._managers_lock:
+            manager = cls._managers.get((host, port))
+            if manager is None:
+                # imported here since the registry depends on the messaging module
+                from wiseagents.core import WiseAgentRegistry
+                connections = WiseAgentRegistry.get_config().get("stomp_shared_connections", 1)
+                manager = cls._managers[(host, port)] = cls(host, port, connections)
+            return manager
+
+    def _connection(self, index: int) -> stomp.Connection:
+        '''Get the connection with the given index, connecting it and restoring its subscriptions if needed.
+        The connection is connected holding only its connect lock, the lock of the manager being held to create it
+        and to restore its subscriptions once connected.'''
+        connection = self._connections[index]
+        if connection is not None and connection.is_connected():
+            return connection
+        with self._connect_locks[index]:
+            with self._lock:
+                connection = self._connections[index]
+                if connection is None:
+                    connection = stomp.Connection(host_and_ports=[(self._host, self._port)],
+                                                  heartbeats=(60000, 60000), auto_decode=False)
+                    connection.set_listener('StompConnectionManager', _StompRoutingListener(self, index))
+                    self._connections[index] = connection
+            if connection.is_connected():
+                # connected by another thread meanwhile
+                return connection
+            connection.connect(os.getenv("STOMP_USER"), os.getenv("STOMP_PASSWORD"), wait=True)
+            with self._lock:
+                # the broker forgets the subscriptions of a connection when it is lost
+                for subscription_id, subscription in self._subscriptions.items():
+                    if subscription.index == index:
+                        connection.subscribe(destination=subscription.destination, id=subscription_id,
+                                             ack=subscription.ack, headers=subscription.headers)
+            return connection
+
+    def _has_subscriptions(self, index: int) -> bool:
+        '''Whether the connection with the given index has subscriptions.'''
+        return any(subscription.index == index for subscription in self._subscriptions.values())
+
+    def reconnect_in_background(self, index: int):
+        '''Reconnect the connection with the given index and restore its subscriptions on a separate thread, since
+        the connection is lost on its receiver thread.
+
+        Args:
+            index (int): the index of the connection'''
+        with self._lock:
+            if index in self._reconnecting or not self._has_subscriptions(index):
+                return
+            self._reconnecting.add(index)
+        threading.Thread(target=self._reconnect, args=(index,), name=f"StompConnectionManager-reconnect-{index}",
+                         daemon=True).start()
+
+    def _reconnect(self, index: int):
+        '''Try to reconnect the connection with the given index until it succeeds or the connection has no
+        subscriptions left.'''
+        delay = self.RECONNECT_DELAY
+        try:
+            while True:
+                with self._lock:
+                    if not self._has_subscriptions(index):
+                        return
+                try:
+                    self._connection(index)
+                    logging.info(f"Reconnected the shared connection {index} to {self._host}:{self._port}")
+                    return
+                except Exception as e:
+                    logging.warning(f"Could not reconnect the shared connection {index} to "
+                                    f"{self._host}:{self._port}, retrying in {delay}s: {e}")
+                time.sleep(delay)
+                delay = min(delay * 2, self.MAX_RECONNECT_DELAY)
+        finally:
+            with self._lock:
+                self._reconnecting.discard(index)
+
+    def subscribe(self, destination: str, listener: stomp.ConnectionListener, ack: str = 'auto',
+                  headers: Optional[dict[str, str]] = None) -> str:
+        '''Subscribe to the given destination on the connection with the fewest subscriptions.
+
+        Args:
+            destination (str): the destination
+            listener (stomp.ConnectionListener): the listener of the messages and errors of the subscription
+            ack (str): the ack mode of the subscription
+            headers (Optional[dict[str, str]]): the headers of the subscription, e.g. its prefetch limit
+
+        Returns:
+            str: the id of the subscription'''
+        with self._lock:
+            counts = [0] * len(self._connections)
+            for subscription in self._subscriptions.values():
+                counts[subscription.index] += 1
+            index = counts.index(min(counts))
+        # the connect lock keeps a reconnection from restoring the subscription before it is subscribed
+        with self._connect_locks[index]:
+            connection = self._connection(index)
+            with self._lock:
+                subscription_id = str(next(self._subscription_ids))
+                self._subscriptions[subscription_id] = _StompSubscription(destination, listener, ack,
+                                                                          headers or {}, index)
+                connection.subscribe(destination=destination, id=subscription_id, ack=ack, headers=headers or {})
+                return subscription_id
+
+    def unsubscribe(self, subscription_id: str):
+        '''Remove the given subscription, closing its connection if it was the last one using it.
+
+        Args:
+            subscription_id (str): the id returned by subscribe'''
+        with self._lock:
+            subscription = self._subscriptions.pop(subscription_id, None)
+            if subscription is None:
+                return
+            connection = self._connections[subscription.index]
+            if connection is None or not connection.is_connected():
+                return
+            connection.unsubscribe(destination=subscription.destination, id=subscription_id)
+            if not self._has_subscriptions(subscription.index):
+                connection.disconnect()
+
+    def connection(self, subscription_id: str) -> stomp.Connection:
+        '''Get the connection of the given subscription, reconnecting it if needed. The messages of the
+        subscription must be acknowledged on this connection, and it can be used to send messages.
+
+        Args:
+            subscription_id (str): the id returned by subscribe
+
+        Returns:
+            stomp.Connection: the connection'''
+        return self._connection(self._subscriptions[subscription_id].index)
+
+    def get_listener(self, subscription_id: Optional[str]) -> Optional[stomp.ConnectionListener]:
+        '''Get the listener of the given subscription, None if there is no such subscription.'''
+        subscription = self._subscriptions.get(subscription_id)
+        return subscription.listener if subscription is not None else None
+
+    def get_listeners(self, index: int) -> list[stomp.ConnectionListener]:
+        '''Get the listeners of the subscriptions of the connection with the given index, once each.'''
+        listeners = []
+        # without the lock, which is held while restoring the subscriptions, and a copy since they can change
+        for subscription in list(self._subscriptions.values()):
+            if subscription.index == index and subscription.listener not in listeners:
+                listeners.append(subscription.listener)
+        return listeners
 
 
 class StompWiseAgentTransport(WiseAgentTransport):
-    '''A transport for sending messages between agents using the STOMP protocol.'''
+    '''A transport for sending messages between agents using the STOMP protocol.
+    When the maximum concurrency is greater than 1, the requests are handled by a pool of as many threads and
+    acknowledged individually once handled, so that the broker does not deliver more requests than the pool can
+    handle (prefetch limit) and redelivers the requests that were not handled if the agent stops.
+    With a shared connection, the transport subscribes to its queues on the connections shared by the agents of the
+    process (see StompConnectionManager) instead of opening its own connections, and its responses are passed to the
+    response receiver in order on a thread of the transport, rather than on the shared receiver thread.'''
     
     yaml_tag = u'!wiseagents.transports.StompWiseAgentTransport'
     request_conn : stomp.Connection = None
     response_conn : stomp.Connection = None
+    # The pool of threads handling the requests, and the slots limiting the requests in flight, when concurrent
+    _request_executor: Optional[ThreadPoolExecutor] = None
+    _request_slots: Optional[threading.BoundedSemaphore] = None
+    # The thread handling the responses in order, with a shared connection
+    _response_executor: Optional[ThreadPoolExecutor] = None
+    # The threads of the request and response executors, so that the transport knows when it is stopped by one of
+    # them, whatever the names of the threads of the other agents
+    _request_threads: Optional[set[threading.Thread]] = None
+    _response_threads: Optional[set[threading.Thread]] = None
+    # The size in bytes of the unacknowledged requests Artemis delivers to the transport, unlimited when not set
+    _consumer_window_size: Optional[int] = None
+    # Whether the connections shared by the process are used
+    _shared_connection: bool = False
+    # The manager of the shared connections and the ids of the subscriptions of the transport, once started
+    _connection_manager: Optional[StompConnectionManager] = None
+    _subscription_ids: Optional[list[str]] = None
     
-    def __init__(self, host: str, port: int, agent_name: str):
+    def __init__(self, host: str, port: int, agent_name: str, codec: Optional[str] = None,
+                 compression_threshold: Optional[int] = None, claim_check_threshold: Optional[int] = None,
+                 blob_store: Optional[str] = None,
+                 shared_connection: bool = False, consumer_window_size: Optional[int] = None):
         '''Initialize the transport.
 
         Args:
             host (str): the host
             port (int): the port
-            agent_name (str): the agent name'''
+            agent_name (str): the agent name
+            codec (Optional[str]): the codec encoding the messages sent by the transport: json (the default),
+            msgpack or yaml. The received messages are decoded according to their content-type header
+            compression_threshold (Optional[int]): the size in bytes above which the encoded messages are compressed
+            with zlib, None (the default) to never compress them
+            claim_check_threshold (Optional[int]): the size in bytes above which the message contents are stored in
+            the blob store and only their reference is sent, None (the default) to always send them
+            blob_store (Optional[str]): the blob store of the offloaded contents: redis (the default when the registry
+            uses Redis) or file, in the message_blob_directory of the registry configuration
+            shared_connection (bool): whether to use the connections shared by the agents of the process, rather than
+            two connections of the transport. Default is False
+            consumer_window_size (Optional[int]): when requests are handled concurrently, the size in bytes of the
+            unacknowledged requests delivered by an Artemis broker (consumer-window-size header), which ignores the
+            prefetch limit of max_concurrency messages used by ActiveMQ and RabbitMQ. Unlimited when not set'''
         self._host = host
         self._port = port
         self._agent_name = agent_name
+        self._codec = codec
+        self._compression_threshold = compression_threshold
+        self._claim_check_threshold = claim_check_threshold
+        self._blob_store = blob_store
+        self._shared_connection = shared_connection
+        self._consumer_window_size = consumer_window_size
         
 
     def __repr__(self) -> str:
@@ -75,6 +364,15 @@ class StompWiseAgentTransport(WiseAgentTransport):
         state = super().__getstate__()
         del state['request_conn']
         del state['response_conn']
+        state.pop('request_executor', None)
+        state.pop('request_slots', None)
+        state.pop('response_executor', None)
+        state.pop('request_threads', None)
+        state.pop('response_threads', None)
+        state.pop('connection_manager', None)
+        state.pop('subscription_ids', None)
+        if not self._shared_connection:
+            state.pop('shared_connection', None)
         return state
 
 
@@ -82,21 +380,158 @@ class StompWiseAgentTransport(WiseAgentTransport):
         '''
         Start the transport.
         require the environment variables STOMP_USER and STOMP_PASSWORD to be set'''
+        if self._shared_connection:
+            self._start_shared()
+            return
         if (self.request_conn is not None and self.request_conn.is_connected()) and (self.response_conn is not None and self.response_conn.is_connected()):
             return
         hosts = [(self.host, self.port)] 
-        self.request_conn = stomp.Connection(host_and_ports=hosts, heartbeats=(60000, 60000))
+        self.request_conn = stomp.Connection(host_and_ports=hosts, heartbeats=(60000, 60000), auto_decode=False)
         self.request_conn.set_listener('WiseAgentRequestTopicListener', WiseAgentRequestQueueListener(self))
         self.request_conn.connect(os.getenv("STOMP_USER"), os.getenv("STOMP_PASSWORD"), wait=True)
-        self.request_conn.subscribe(destination=self.request_queue, id=id(self), ack='auto')
+        if self.max_concurrency > 1:
+            self._start_request_executor()
+        else:
+            self._request_executor = None
+        ack, headers = self._request_subscription()
+        self.request_conn.subscribe(destination=self.request_queue, id=id(self), ack=ack, headers=headers)
         
-        self.response_conn = stomp.Connection(host_and_ports=hosts, heartbeats=(60000, 60000))
+        self.response_conn = stomp.Connection(host_and_ports=hosts, heartbeats=(60000, 60000), auto_decode=False)
         
         self.response_conn.set_listener('WiseAgentResponseQueueListener', WiseAgentResponseQueueListener(self))
         self.response_conn.connect(os.getenv("STOMP_USER"), os.getenv("STOMP_PASSWORD"), wait=True)
         
         self.response_conn.subscribe(destination=self.response_queue, id=id(self) + 1 , ack='auto')
+        if self.instance_id is not None:
+            # the responses to the requests sent by this instance of a replicated agent
+            self.response_conn.subscribe(destination=self.instance_response_queue, id=id(self) + 2, ack='auto')
+
+
+    def _start_shared(self):
+        '''Subscribe to the queues of the agent on the connections shared by the process.'''
+        if self._subscription_ids is not None:
+            return
+        self._connection_manager = StompConnectionManager.get(self.host, self.port)
+        # the requests are always handled by the pool of threads, so that an agent handling a request does not block
+        # the receiver thread shared with the other agents
+        self._start_request_executor()
+        # and the responses are handled in order by a thread of the transport, for the same reason
+        self._response_threads = set()
+        self._response_executor = ThreadPoolExecutor(max_workers=1,
+                                                     thread_name_prefix=self._response_thread_name_prefix,
+                                                     initializer=_track_thread, initargs=(self._response_threads,))
+        ack, headers = self._request_subscription()
+        response_listener = WiseAgentResponseQueueListener(self)
+        self._subscription_ids = [
+            self._connection_manager.subscribe(self.request_queue, WiseAgentRequestQueueListener(self), ack, headers),
+            self._connection_manager.subscribe(self.response_queue, response_listener)]
+        if self.instance_id is not None:
+            # the responses to the requests sent by this instance of a replicated agent
+            self._subscription_ids.append(
+                self._connection_manager.subscribe(self.instance_response_queue, response_listener))
+        self._connect_shared()
+
+    def _connect_shared(self):
+        '''Get the shared connections of the subscriptions of the transport, reconnecting them if needed.'''
+        # the requests are acknowledged on the connection of their subscription
+        self.request_conn = self._connection_manager.connection(self._subscription_ids[0])
+        self.response_conn = self._connection_manager.connection(self._subscription_ids[1])
+
+    def _request_subscription(self) -> tuple[str, dict[str, str]]:
+        '''Get the ack mode and headers of the subscription to the request queue.'''
+        if self._request_executor is None:
+            return 'auto', {}
+        # the prefetch limit of ActiveMQ (activemq.prefetchSize) and RabbitMQ (prefetch-count), in messages
+        headers = {'activemq.prefetchSize': str(self.max_concurrency), 'prefetch-count': str(self.max_concurrency)}
+        if self._consumer_window_size is not None:
+            # Artemis ignores the headers above and limits the unacknowledged messages delivered by size
+            headers['consumer-window-size'] = str(self._consumer_window_size)
+        return 'client-individual', headers
+
+    def _start_request_executor(self):
+        '''Create the pool of threads handling the requests.'''
+        self._request_threads = set()
+        self._request_executor = ThreadPoolExecutor(max_workers=self.max_concurrency,
+                                                    thread_name_prefix=self._request_thread_name_prefix,
+                                                    initializer=_track_thread, initargs=(self._request_threads,))
+        # a shared receiver thread must not wait for the threads of an agent, the prefetch limit bounds its requests
+        self._request_slots = (threading.BoundedSemaphore(self.max_concurrency) if not self._shared_connection
+                               else None)
+
+    def _stop_request_executor(self):
+        '''Wait for the requests being handled, so that they are acknowledged before unsubscribing, unless the
+        transport is stopped while handling a request. The requests received afterwards are not acknowledged, so
+        the broker delivers them again.'''
+        if self._request_executor is not None:
+            self._request_executor.shutdown(wait=threading.current_thread() not in self._request_threads)
 
+    def dispatch_request(self, message: WiseAgentMessage, headers: dict[str, str]):
+        '''Pass a request received to the request receiver, on the pool of threads when the transport handles
+        several requests concurrently.
+
+        Args:
+            message (WiseAgentMessage): the request
+            headers (dict[str, str]): the headers of the STOMP frame of the request'''
+        if self._request_executor is None:
+            self.request_receiver(message)
+            return
+        if self._request_slots is not None:
+            # blocks the listener while all the threads are busy, in case the broker ignores the prefetch limit
+            self._request_slots.acquire()
+        try:
+            self._request_executor.submit(self._handle_request, message, headers)
+        except RuntimeError:
+            # the transport is stopping
+            logging.debug(f"Not handling request {message.message_id}, the transport is stopping")
+            if self._request_slots is not None:
+                self._request_slots.release()
+
+    def dispatch_response(self, message: WiseAgentMessage):
+        '''Pass a response received to the response receiver, on the thread handling the responses of the transport
+        when it uses a shared connection.
+
+        Args:
+            message (WiseAgentMessage): the response'''
+        if self._response_executor is None:
+            self.response_receiver(message)
+            return
+        try:
+            self._response_executor.submit(self._handle_response, message)
+        except RuntimeError:
+            # the transport is stopping
+            logging.debug(f"Not handling response {message.message_id}, the transport is stopping")
+
+    def _handle_response(self, message: WiseAgentMessage):
+        '''Pass a response to the response receiver on the thread handling the responses.'''
+        try:
+            self.response_receiver(message)
+        except Exception:
+            logging.exception(f"Error processing response {message.message_id}")
+
+    def _handle_request(self, message: WiseAgentMessage, headers: dict[str, str]):
+        '''Pass a request to the request receiver on a thread of the pool, then acknowledge it, or reject it when
+        handling it failed so that the broker delivers it again, or moves it to its dead letter queue once it reaches
+        its maximum number of deliveries.'''
+        # the connection the request was received on, even if the transport is stopped while handling it
+        connection = self.request_conn
+        handled = False
+        try:
+            self.request_receiver(message)
+            handled = True
+        except Exception:
+            logging.exception(f"Error processing request {message.message_id}")
+        finally:
+            if self._request_slots is not None:
+                self._request_slots.release()
+            # STOMP 1.2 acknowledges the ack header, 1.1 the message-id header
+            ack_id = headers.get('ack', headers['message-id'])
+            try:
+                if handled:
+                    connection.ack(ack_id, headers['subscription'])
+                else:
+                    connection.nack(ack_id, headers['subscription'])
+            except Exception:
+                logging.warning(f"Could not acknowledge request {message.message_id}, it will be delivered again")
 
     def send_request(self, message: WiseAgentMessage, dest_agent_name: str):
         '''Send a request message to an agent.
@@ -107,28 +542,63 @@ class StompWiseAgentTransport(WiseAgentTransport):
         # Send the message using the STOMP protocol
         if self.request_conn is None or self.response_conn is None:
             self.start()
-        if self.request_conn.is_connected() == False:
-            self.request_conn.connect(os.getenv("STOMP_USER"), os.getenv("STOMP_PASSWORD"), wait=True)
-        if self.response_conn.is_connected() == False:
-            self.response_conn.connect(os.getenv("STOMP_USER"), os.getenv("STOMP_PASSWORD"), wait=True)
+        if self._connection_manager is not None:
+            # restores the subscriptions of the shared connections when reconnecting them
+            self._connect_shared()
+        else:
+            if self.request_conn.is_connected() == False:
+                self.request_conn.connect(os.getenv("STOMP_USER"), os.getenv("STOMP_PASSWORD"), wait=True)
+            if self.response_conn.is_connected() == False:
+                self.response_conn.connect(os.getenv("STOMP_USER"), os.getenv("STOMP_PASSWORD"), wait=True)
         request_destination = '/queue/request/' + dest_agent_name
         logging.debug(f"Sending request {message} to {request_destination}")    
-        self.request_conn.send(body=yaml.dump(message), destination=request_destination)
+        body, headers = self.encode_message(message)
+        headers.update(self._delivery_headers(message))
+        self.request_conn.send(body=body, destination=request_destination, headers=headers)
         
-    def send_response(self, message: WiseAgentMessage, dest_agent_name: str):
+    def send_response(self, message: WiseAgentMessage, dest_agent_name: str, dest_instance_id: Optional[str] = None):
         '''Send a response message to an agent.
 
         Args:
             message (WiseAgentMessage): the message to send
-            dest_agent_name (str): the destination agent name'''
+            dest_agent_name (str): the destination agent name
+            dest_instance_id (Optional[str]): the id of the instance of the destination agent when it is replicated'''
         # Send the message using the STOMP protocol
         if self.request_conn is None or self.response_conn is None:
             self.start()
-        response_destination = '/queue/response/' + dest_agent_name    
-        self.response_conn.send(body=yaml.dump(message), destination=response_destination)
+        response_destination = '/queue/response/' + dest_agent_name
+        if dest_instance_id is not None:
+            response_destination += '.' + dest_instance_id
+        body, headers = self.encode_message(message)
+        headers.update(self._delivery_headers(message))
+        self.response_conn.send(body=body, destination=response_destination, headers=headers)
+
+    def _delivery_headers(self, message: WiseAgentMessage) -> dict[str, str]:
+        '''Get the STOMP headers mapping the priority and deadline of the message, so that the broker delivers the
+        messages with a higher priority first and discards the expired messages.'''
+        headers = {}
+        if message.priority is not None:
+            headers['priority'] = str(message.priority)
+        if message.deadline is not None:
+            # in milliseconds since the epoch
+            headers['expires'] = str(int(message.deadline * 1000))
+        return headers
 
     def stop(self):
         '''Stop the transport.'''
+        self._stop_request_executor()
+        if self._response_executor is not None:
+            self._response_executor.shutdown(wait=threading.current_thread() not in self._response_threads)
+            self._response_executor = None
+        if self._connection_manager is not None:
+            # the shared connections are closed by the manager once they have no subscriptions
+            for subscription_id in self._subscription_ids:
+                self._connection_manager.unsubscribe(subscription_id)
+            self._connection_manager = None
+            self._subscription_ids = None
+            self.request_conn = None
+            self.response_conn = None
+            return
         if self.request_conn is not None and self.request_conn.is_connected():
             #unsubscribe from the request topic
             self.request_conn.unsubscribe(destination=self.request_queue, id=id(self))
@@ -137,6 +607,8 @@ class StompWiseAgentTransport(WiseAgentTransport):
         if self.response_conn is not None and self.response_conn.is_connected():
             #unsubscribe from the response queue
             self.response_conn.unsubscribe(destination=self.response_queue, id=id(self) + 1)
+            if self.instance_id is not None:
+                self.response_conn.unsubscribe(destination=self.instance_response_queue, id=id(self) + 2)
             # Disconnect response from the STOMP server
             self.response_conn.disconnect()
             
@@ -154,6 +626,18 @@ class StompWiseAgentTransport(WiseAgentTransport):
         '''Get the agent name.'''
         return self._agent_name
     @property
+    def shared_connection(self) -> bool:
+        '''Get whether the connections shared by the process are used.'''
+        return self._shared_connection
+    @property
+    def _request_thread_name_prefix(self) -> str:
+        '''Get the prefix of the names of the threads handling the requests.'''
+        return f"StompWiseAgentTransport-{self.agent_name}-requests"
+    @property
+    def _response_thread_name_prefix(self) -> str:
+        '''Get the prefix of the name of the thread handling the responses.'''
+        return f"StompWiseAgentTransport-{self.agent_name}-responses"
+    @property
     def request_queue(self) -> str:
         '''Get the request queue.'''
         return '/queue/request/' + self.agent_name
@@ -161,5 +645,7 @@ class StompWiseAgentTransport(WiseAgentTransport):
     def response_queue(self) -> str:
         '''Get the response queue.'''
         return '/queue/response/' + self.agent_name
-    
-    
\ No newline at end of file
+    @property
+    def instance_response_queue(self) -> str:
+        '''Get the response queue of this instance of a replicated agent.'''
+        return self.response_queue + '.' + self.instance_id
@@ -0,0 +1,221 @@
+import hashlib
+import os
+import re
+import tempfile
+import threading
+import time
+from abc import abstractmethod
+from typing import Optional
+
+from wiseagents import enforce_no_abstract_class_instances
+
+# The keys of the blobs, the sha256 of their content
+_KEY_PATTERN = re.compile(r"[0-9a-f]{64}")
+
+
+def _get_config() -> dict:
+    '''Get the configuration of the registry.'''
+    # imported here since the registry depends on the messaging module, which depends on this one
+    from wiseagents.core import WiseAgentRegistry
+    return WiseAgentRegistry.get_config()
+
+
+def _parse_reference(reference: str, scheme: str) -> str:
+    '''Get the key of the given reference, checking that it is a reference of the given scheme.'''
+    reference_scheme, _, key = reference.partition(":")
+    if reference_scheme != scheme or not _KEY_PATTERN.fullmatch(key):
+        raise ValueError(f"Invalid blob reference {reference}")
+    return key
+
+
+class WiseAgentBlobStore():
+    '''
+    A store for the large message bodies offloaded by the transports (claim check). A body is stored once, under
+    a key derived from its content, and only a reference to it is sent with the message.
+    The references are the sha256 of the content prefixed with the scheme of the store, so that the receivers can
+    resolve them with get_blob whatever store the sender used. Since they are received from other agents, they are
+    only resolved in the store configured by the receiver.
+    '''
+
+    scheme: str = None
+
+    def __init__(self):
+        enforce_no_abstract_class_instances(self.__class__, WiseAgentBlobStore)
+
+    @abstractmethod
+    def put(self, data: bytes) -> str:
+        '''Store the given data.
+
+        Args:
+            data (bytes): the data to store
+
+        Returns:
+            str: the reference of the stored data'''
+        ...
+
+    @abstractmethod
+    def get(self, reference: str) -> bytes:
+        '''Get the data stored with the given reference.
+
+        Args:
+            reference (str): the reference returned by put
+
+        Returns:
+            bytes: the stored data'''
+        ...
+
+
+class RedisWiseAgentBlobStore(WiseAgentBlobStore):
+    ''' A blob store keeping the data in the Redis server used by the registry, for a limited time. '''
+
+    scheme = "redis"
+    KEY_PREFIX = "blobs:"
+
+    def __init__(self, ttl: Optional[int] = None):
+        '''Initialize the store.
+
+        Args:
+            ttl (Optional[int]): the number of seconds the data is kept, message_blob_ttl from the registry
+            configuration (default 86400) when not set'''
+        super().__init__()
+        self._ttl = ttl
+
+    def put(self, data: bytes) -> str:
+        '''Store the given data in Redis, refreshing its expiration if it is already stored.'''
+        from wiseagents.core import WiseAgentRegistry
+        ttl = self._ttl if self._ttl is not None else _get_config().get("message_blob_ttl", 86400)
+        key = hashlib.sha256(data).hexdigest()
+        WiseAgentRegistry.get_redis_db().set(self.KEY_PREFIX + key, data, ex=ttl)
+        return f"{self.scheme}:{key}"
+
+    def get(self, reference: str) -> bytes:
+        '''Get the data stored in Redis with the given reference.'''
+        from wiseagents.core import WiseAgentRegistry
+        data = WiseAgentRegistry.get_redis_db().get(self.KEY_PREFIX + _parse_reference(reference, self.scheme))
+        if data is None:
+            raise ValueError(f"Blob {reference} not found, it may have expired")
+        return data
+
+
+class LocalWiseAgentBlobStore(WiseAgentBlobStore):
+    ''' A blob store keeping the data in files of a local directory, which must be shared by the agents
+    (e.g. a volume mounted by all the pods) when they don't run on the same host. The files are removed once they
+    are older than the TTL, by the stores putting data in the directory. '''
+
+    scheme = "file"
+    # The minimum number of seconds between two removals of the expired files of a directory
+    CLEANUP_INTERVAL = 600
+
+    # When the expired files were last removed, by directory
+    _last_cleanups: dict[str, float] = {}
+    _last_cleanups_lock = threading.Lock()
+
+    def __init__(self, directory: Optional[str] = None, ttl: Optional[int] = None):
+        '''Initialize the store.
+
+        Args:
+            directory (Optional[str]): the directory of the files, message_blob_directory from the registry
+            configuration (default wise-agents-blobs in the temporary directory) when not set
+            ttl (Optional[int]): the number of seconds the files are kept, message_blob_ttl from the registry
+            configuration (default 86400) when not set'''
+        super().__init__()
+        self._directory = directory
+        self._ttl = ttl
+
+    @property
+    def directory(self) -> str:
+        '''Get the directory of the files.'''
+        if self._directory is None:
+            return _get_config().get("message_blob_directory",
+                                     os.path.join(tempfile.gettempdir(), "wise-agents-blobs"))
+        return self._directory
+
+    @property
+    def ttl(self) -> int:
+        '''Get the number of seconds the files are kept.'''
+        return self._ttl if self._ttl is not None else _get_config().get("message_blob_ttl", 86400)
+
+    def put(self, data: bytes) -> str:
+        '''Store the given data in a file, refreshing its expiration if a file with the same content exists.'''
+        directory = self.directory
+        key = hashlib.sha256(data).hexdigest()
+        path = os.path.join(directory, key)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            os.makedirs(directory, exist_ok=True)
+            # written to a temporary file first, so that readers never see a partial file
+            fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".")
+            with os.fdopen(fd, "wb") as tmp_file:
+                tmp_file.write(data)
+            os.replace(tmp_path, path)
+        self._cleanup_if_due(directory)
+        return f"{self.scheme}:{key}"
+
+    def get(self, reference: str) -> bytes:
+        '''Get the data stored in the file with the given reference, in the directory of the store.'''
+        path = os.path.join(self.directory, _parse_reference(reference, self.scheme))
+        try:
+            if os.path.getmtime(path) < time.time() - self.ttl:
+                raise ValueError(f"Blob {reference} expired")
+            with open(path, "rb") as file:
+                return file.read()
+        except FileNotFoundError:
+            raise ValueError(f"Blob {reference} not found, it may have expired")
+
+    def cleanup(self):
+        '''Remove the files of the directory older than the TTL.'''
+        directory = self.directory
+        expiration = time.time() - self.ttl
+        try:
+            entries = list(os.scandir(directory))
+        except FileNotFoundError:
+            return
+        for entry in entries:
+            try:
+                if entry.is_file(follow_symlinks=False) and entry.stat(follow_symlinks=False).st_mtime < expiration:
+                    os.remove(entry.path)
+            except FileNotFoundError:
+                # removed by another process
+                pass
+
+    def _cleanup_if_due(self, directory: str):
+        '''Remove the expired files of the directory, unless it was done less than CLEANUP_INTERVAL ago.'''
+        now = time.time()
+        with self._last_cleanups_lock:
+            if now - self._last_cleanups.get(directory, 0) < self.CLEANUP_INTERVAL:
+                return
+            self._last_cleanups[directory] = now
+        self.cleanup()
+
+
+_BLOB_STORES = {RedisWiseAgentBlobStore.scheme: RedisWiseAgentBlobStore,
+                LocalWiseAgentBlobStore.scheme: LocalWiseAgentBlobStore}
+
+
+def create_blob_store(name: str) -> WiseAgentBlobStore:
+    '''Create the blob store with the given name, configured by the registry configuration.
+
+    Args:
+        name (str): the name of the store: redis or file
+
+    Returns:
+        WiseAgentBlobStore: the store'''
+    if name in _BLOB_STORES:
+        return _BLOB_STORES[name]()
+    raise ValueError(f"Unknown blob store {name}, it must be one of {list(_BLOB_STORES)}")
+
+
+def get_blob(reference: str) -> bytes:
+    '''Get the data with the given reference, from the store of its scheme configured by the registry
+    configuration. Invalid references, e.g. paths, are rejected.
+
+    Args:
+        reference (str): the reference returned by the put method of a store
+
+    Returns:
+        bytes: the stored data'''
+    scheme = reference.partition(":")[0]
+    if scheme not in _BLOB_STORES:
+        raise ValueError(f"Unsupported blob reference {reference}")
+    return _BLOB_STORES[scheme]().get(reference)
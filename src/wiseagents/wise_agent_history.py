@@ -0,0 +1,203 @@
+import threading
+from collections import OrderedDict, deque
+from typing import TYPE_CHECKING, Any, Callable, Deque, List, Optional, Tuple
+
+from openai.types.chat import ChatCompletionMessageParam
+
+from wiseagents.wise_agent_serialization import resolve_import_path
+from wiseagents.yaml import WiseAgentsYAMLObject
+
+if TYPE_CHECKING:
+    from wiseagents.core import WiseAgentContext
+
+
+def estimate_tokens(text: str) -> int:
+    '''Estimate the number of tokens in the given text, assuming about 4 characters per token.
+
+    Args:
+        text (str): the text
+
+    Returns:
+        int: the estimated number of tokens'''
+    return (len(text) + 3) // 4
+
+
+class _HistoryWindow:
+    ''' The window over the conversation history of a context, updated as new messages are appended. '''
+
+    def __init__(self):
+        # guards the window while the new messages of the context are fetched and added
+        self.lock = threading.Lock()
+        self.processed = 0
+        self.pinned: List[Any] = []
+        self.pinned_tokens = 0
+        self.messages: Deque[Tuple[Any, int, bool]] = deque()
+        self.tokens = 0
+        self.non_system_messages = 0
+
+
+class WiseAgentHistoryPolicy(WiseAgentsYAMLObject):
+    '''
+    A WiseAgentHistoryPolicy limits the conversation history an agent sends to its LLM, keeping the most recent
+    messages within a maximum number of messages and/or a token budget. System messages are always kept.
+    The window of each context is updated with the messages appended since the previous request instead of
+    going through the whole history again.
+    '''
+    yaml_tag = u'!wiseagents.WiseAgentHistoryPolicy'
+
+    # The number of tokens added to each message for the role and the message separators
+    MESSAGE_OVERHEAD_TOKENS = 4
+
+    def __new__(cls, *args, **kwargs):
+        '''Create a new instance of the class, setting default values for the instance variables.'''
+        obj = super().__new__(cls)
+        obj._max_messages = None
+        obj._max_tokens = None
+        obj._tokenizer = None
+        obj._max_contexts = 128
+        obj._windows = OrderedDict()
+        obj._lock = threading.Lock()
+        return obj
+
+    def __init__(self, max_messages: Optional[int] = None, max_tokens: Optional[int] = None,
+                 tokenizer: Optional[Callable[[str], int]] = None, max_contexts: Optional[int] = 128):
+        '''Initialize the policy.
+
+        Args:
+            max_messages (Optional[int]): the maximum number of non system messages to keep, None for no limit
+            max_tokens (Optional[int]): the maximum number of tokens of the returned history, None for no limit
+            tokenizer (Optional[Callable[[str], int]]): a function returning the number of tokens of a text,
+            by default the number of tokens is estimated from the number of characters
+            max_contexts (Optional[int]): the number of contexts for which the window is kept. Default is 128
+        '''
+        self._max_messages = max_messages
+        self._max_tokens = max_tokens
+        self._tokenizer = tokenizer
+        self._max_contexts = max_contexts
+
+    def __repr__(self):
+        '''Return a string representation of the policy.'''
+        return (f"{self.__class__.__name__}(max_messages={self.max_messages}, max_tokens={self.max_tokens},"
+                f"tokenizer={self._tokenizer})")
+
+    def __getstate__(self) -> dict:
+        '''Return the state of the policy, without the windows kept for the contexts.'''
+        state = dict(super().__getstate__())
+        state.pop("windows", None)
+        state.pop("lock", None)
+        return state
+
+    def _validate_and_convert_types(self, d: dict) -> dict:
+        '''Resolve the tokenizer when it is given as an import path (module:function) in the YAML.'''
+        tokenizer = d.get("_tokenizer")
+        if isinstance(tokenizer, str):
+            d["_tokenizer"] = resolve_import_path(tokenizer)
+            if d["_tokenizer"] is None:
+                raise ValueError(f"Can't resolve the tokenizer {tokenizer}")
+        return d
+
+    @property
+    def max_messages(self) -> Optional[int]:
+        """Get the maximum number of non system messages to keep."""
+        return self._max_messages
+
+    @property
+    def max_tokens(self) -> Optional[int]:
+        """Get the maximum number of tokens of the returned history."""
+        return self._max_tokens
+
+    def count_tokens(self, message: ChatCompletionMessageParam) -> int:
+        '''Count the tokens of the given message.
+
+        Args:
+            message (ChatCompletionMessageParam): the message, as a dict or as a pydantic model
+
+        Returns:
+            int: the number of tokens of the message'''
+        tokenizer = self._tokenizer or estimate_tokens
+        tokens = self.MESSAGE_OVERHEAD_TOKENS
+        content = _get(message, "content")
+        if isinstance(content, str):
+            tokens += tokenizer(content)
+        elif content:
+            for part in content:
+                text = _get(part, "text")
+                if text:
+                    tokens += tokenizer(text)
+        for tool_call in _get(message, "tool_calls") or []:
+            function = _get(tool_call, "function")
+            tokens += tokenizer(f"{_get(function, 'name')}{_get(function, 'arguments')}")
+        return tokens
+
+    def get_history(self, context: 'WiseAgentContext') -> List[ChatCompletionMessageParam]:
+        '''Get the conversation history of the given context, limited by this policy.
+
+        Args:
+            context (WiseAgentContext): the context
+
+        Returns:
+            List[ChatCompletionMessageParam]: the system messages and the most recent messages of the history'''
+        key = (context.name, context.created_at)
+        # the policy lock only guards the windows, the messages are fetched holding only the lock of the window
+        with self._lock:
+            window = self._windows.pop(key, None)
+            if window is None:
+                window = _HistoryWindow()
+            self._windows[key] = window
+            while self._max_contexts is not None and len(self._windows) > self._max_contexts:
+                self._windows.popitem(last=False)
+        with window.lock:
+            messages = context.get_chat_completion_since(window.processed)
+            self._extend(window, messages)
+            window.processed += len(messages)
+            return window.pinned + [message for message, _, _ in window.messages]
+
+    def reset(self, context_name: Optional[str] = None):
+        '''Forget the window of the given context, or of all the contexts.
+
+        Args:
+            context_name (Optional[str]): the name of the context, None for all the contexts'''
+        with self._lock:
+            if context_name is None:
+                self._windows.clear()
+            else:
+                for key in [key for key in self._windows if key[0] == context_name]:
+                    self._windows.pop(key)
+
+    def _extend(self, window: _HistoryWindow, messages: List[ChatCompletionMessageParam]):
+        '''Add the given messages to the window and drop the oldest ones exceeding the limits.'''
+        for message in messages:
+            tokens = self.count_tokens(message)
+            is_system = _get(message, "role") == "system"
+            window.messages.append((message, tokens, is_system))
+            window.tokens += tokens
+            if not is_system:
+                window.non_system_messages += 1
+        while len(window.messages) > 1 and self._exceeds_limits(window):
+            self._drop_oldest(window)
+        # a tool message can't be sent without the assistant message containing its tool call
+        while window.messages and _get(window.messages[0][0], "role") == "tool":
+            self._drop_oldest(window)
+
+    def _exceeds_limits(self, window: _HistoryWindow) -> bool:
+        '''Whether the window contains too many messages or tokens.'''
+        if self._max_messages is not None and window.non_system_messages > self._max_messages:
+            return True
+        return self._max_tokens is not None and window.pinned_tokens + window.tokens > self._max_tokens
+
+    def _drop_oldest(self, window: _HistoryWindow):
+        '''Drop the oldest message of the window, keeping it apart if it is a system message.'''
+        message, tokens, is_system = window.messages.popleft()
+        window.tokens -= tokens
+        if is_system:
+            window.pinned.append(message)
+            window.pinned_tokens += tokens
+        else:
+            window.non_system_messages -= 1
+
+
+def _get(value: Any, key: str) -> Any:
+    '''Get a field of a message, which can be a dict or a pydantic model.'''
+    if isinstance(value, dict):
+        return value.get(key)
+    return getattr(value, key, None)
@@ -1,12 +1,16 @@
+import json
 import logging
+import time
+import zlib
 from abc import *
 from enum import StrEnum
-from typing import Callable, Optional
+from typing import Callable, Optional, Tuple
 
 import yaml
 from yaml import YAMLObject
 from wiseagents.yaml import WiseAgentsYAMLObject
 from wiseagents import enforce_no_abstract_class_instances
+from wiseagents.wise_agent_blob_store import WiseAgentBlobStore, create_blob_store, get_blob
 from yaml.resolver import BaseResolver
 
 
@@ -18,6 +22,7 @@ class WiseAgentMessageType(StrEnum):
     RESPONSE = "RESPONSE"
     ACTION_REQUEST = "ACTION_REQUEST"
     HUMAN = "HUMAN"
+    CHUNK = "CHUNK"
 
 class WiseAgentEvent:
     """
@@ -28,12 +33,26 @@ def wiseAgentMessageType_representer(dumper, data):
     return dumper.represent_scalar(BaseResolver.DEFAULT_SCALAR_TAG, str(data.value))
 
 
+yaml.Dumper.add_representer(WiseAgentMessageType, wiseAgentMessageType_representer)
+
+# The default value of the arguments of WiseAgentMessage.copy_with, for the fields which are not changed
+_UNCHANGED = object()
+
+
 class WiseAgentMessage(YAMLObject):
-    ''' A message that can be sent between agents. '''
+    ''' A message that can be sent between agents.
+    The fields are stored in slots, so that messages are cheap to create and small in memory. '''
     yaml_tag = u'!wiseagents.WiseAgentMessage'
+    __slots__ = ("_message", "_sender", "_message_type", "_tool_id", "_route_response_to", "_context_name",
+                 "_sender_instance_id", "_message_ref", "_message_id", "_correlation_id",
+                 "_priority", "_deadline")
+
     def __init__(self, message: str, context_name: str, sender: Optional[str] = None, message_type: Optional[WiseAgentMessageType] = None, 
                  tool_id : Optional[str] = None,
-                 route_response_to: Optional[str] = None):
+                 route_response_to: Optional[str] = None, sender_instance_id: Optional[str] = None,
+                 message_ref: Optional[str] = None, message_id: Optional[str] = None,
+                 correlation_id: Optional[str] = None, priority: Optional[int] = None,
+                 deadline: Optional[float] = None):
         '''Initialize the message.
 
         Args:
@@ -43,6 +62,14 @@ class WiseAgentMessage(YAMLObject):
             tool_id Optional(str): the id of the tool
             context_name Optional(str): the context name of the message
             route_response_to Optional(str): the id of the tool to route the response to
+            sender_instance_id Optional(str): the id of the instance of the sender when the sender is a replicated agent
+            message_ref Optional(str): the reference of the message contents in a blob store, when they were
+            offloaded by the transport. The contents are then fetched when the message is first accessed
+            message_id Optional(str): the unique id of the message, set when the message is sent if not given
+            correlation_id Optional(str): the id of the request this message was sent for
+            priority Optional(int): the priority of the message, from 0 (lowest) to 9 (highest), 4 when not set
+            deadline Optional(float): the time (in seconds since the epoch) after which the message is expired
+            and should no longer be processed
             ''' 
         self._message = message
         self._sender = sender
@@ -50,7 +77,22 @@ class WiseAgentMessage(YAMLObject):
         self._tool_id = tool_id
         self._route_response_to = route_response_to
         self._context_name = context_name
-        self.__class__.yaml_dumper.add_representer(WiseAgentMessageType, wiseAgentMessageType_representer)
+        self._sender_instance_id = sender_instance_id
+        self._message_ref = message_ref
+        self._message_id = message_id
+        self._correlation_id = correlation_id
+        self._priority = priority
+        self._deadline = deadline
+
+    def __getstate__(self) -> dict:
+        '''Return the state of the message, as serialized by pyyaml, pickle and the registry serializers.
+        The contents of an offloaded message are not included, only their reference.'''
+        state = {slot: getattr(self, slot) for slot in self.__slots__}
+        if self._message_ref is None:
+            del state["_message_ref"]
+        else:
+            state["_message"] = None
+        return state
         
     def __setstate__(self, state):
         self._message = state["_message"]
@@ -63,10 +105,49 @@ class WiseAgentMessage(YAMLObject):
         self._tool_id =  state["_tool_id"]
         self._route_response_to =  state["_route_response_to"]
         self._context_name = state["_context_name"]
-        
+        self._sender_instance_id = state.get("_sender_instance_id")
+        self._message_ref = state.get("_message_ref")
+        self._message_id = state.get("_message_id")
+        self._correlation_id = state.get("_correlation_id")
+        self._priority = state.get("_priority")
+        self._deadline = state.get("_deadline")
+
+    def copy_with(self, message: str = _UNCHANGED, context_name: str = _UNCHANGED, sender: Optional[str] = _UNCHANGED,
+                  message_type: Optional[WiseAgentMessageType] = _UNCHANGED, tool_id: Optional[str] = _UNCHANGED,
+                  route_response_to: Optional[str] = _UNCHANGED,
+                  sender_instance_id: Optional[str] = _UNCHANGED,
+                  message_ref: Optional[str] = _UNCHANGED, message_id: Optional[str] = None,
+                  correlation_id: Optional[str] = _UNCHANGED, priority: Optional[int] = _UNCHANGED,
+                  deadline: Optional[float] = _UNCHANGED) -> 'WiseAgentMessage':
+        '''Create a copy of the message with the given fields changed, e.g. a message in the same context
+        with a new body. The arguments are the ones of the constructor, the fields not given are copied.
+        Giving a new message clears the reference of offloaded contents, unless message_ref is given too.
+        The copy is a new message, so it has no id unless message_id is given.
+
+        Returns:
+            WiseAgentMessage: the copy of the message'''
+        copy = self.__class__.__new__(self.__class__)
+        copy._message = self._message if message is _UNCHANGED else message
+        copy._context_name = self._context_name if context_name is _UNCHANGED else context_name
+        copy._sender = self._sender if sender is _UNCHANGED else sender
+        copy._message_type = self._message_type if message_type is _UNCHANGED else message_type
+        copy._tool_id = self._tool_id if tool_id is _UNCHANGED else tool_id
+        copy._route_response_to = self._route_response_to if route_response_to is _UNCHANGED else route_response_to
+        copy._sender_instance_id = (self._sender_instance_id if sender_instance_id is _UNCHANGED
+                                    else sender_instance_id)
+        if message_ref is _UNCHANGED:
+            copy._message_ref = self._message_ref if message is _UNCHANGED else None
+        else:
+            copy._message_ref = message_ref
+        copy._message_id = message_id
+        copy._correlation_id = self._correlation_id if correlation_id is _UNCHANGED else correlation_id
+        copy._priority = self._priority if priority is _UNCHANGED else priority
+        copy._deadline = self._deadline if deadline is _UNCHANGED else deadline
+        return copy
 
     def __repr__(self) -> str:
-        return f"{self.__class__.__name__}(message={self.message}, sender={self.sender}, message_type={self.message_type}, tool_id={self.tool_id}, context_name={self.context_name}, route_response_to={self.route_response_to}, route_response_to={self.route_response_to})"
+        message = self._message if self._message_ref is None else f"<{self._message_ref}>"
+        return f"{self.__class__.__name__}(message={message}, sender={self.sender}, message_type={self.message_type}, tool_id={self.tool_id}, context_name={self.context_name}, route_response_to={self.route_response_to}, sender_instance_id={self.sender_instance_id}, message_id={self.message_id}, correlation_id={self.correlation_id}, priority={self.priority}, deadline={self.deadline})"
 
     @property
     def context_name(self) -> str:
@@ -75,9 +156,17 @@ class WiseAgentMessage(YAMLObject):
     
     @property
     def message(self) -> str:
-        """Get the message contents (a natural language string)."""
+        """Get the message contents (a natural language string), fetching them from the blob store the first time
+        when they were offloaded."""
+        if self._message is None and self._message_ref is not None:
+            self._message = get_blob(self._message_ref).decode("utf-8")
         return self._message
 
+    @property
+    def message_ref(self) -> Optional[str]:
+        """Get the reference of the message contents in a blob store (or None if they were sent with the message)."""
+        return self._message_ref
+
     @property
     def sender(self) -> str:
         """Get the sender of the message (or None if the sender was not specified)."""
@@ -90,7 +179,77 @@ class WiseAgentMessage(YAMLObject):
             sender (str): the sender of the message
         '''
         self._sender = sender
+
+    @property
+    def sender_instance_id(self) -> Optional[str]:
+        """Get the id of the instance of the sender (or None if the sender is not a replicated agent)."""
+        return self._sender_instance_id
+    @sender_instance_id.setter
+    def sender_instance_id(self, sender_instance_id: Optional[str]):
+        '''Set the id of the instance of the sender.
+
+        Args:
+            sender_instance_id (Optional[str]): the id of the instance of the sender
+        '''
+        self._sender_instance_id = sender_instance_id
     
+    @property
+    def message_id(self) -> Optional[str]:
+        """Get the unique id of the message (or None if the message was not sent yet)."""
+        return self._message_id
+    @message_id.setter
+    def message_id(self, message_id: Optional[str]):
+        '''Set the unique id of the message.
+
+        Args:
+            message_id (Optional[str]): the id of the message
+        '''
+        self._message_id = message_id
+
+    @property
+    def correlation_id(self) -> Optional[str]:
+        """Get the id of the request this message was sent for (or None if it was not sent for a request)."""
+        return self._correlation_id
+    @correlation_id.setter
+    def correlation_id(self, correlation_id: Optional[str]):
+        '''Set the id of the request this message was sent for.
+
+        Args:
+            correlation_id (Optional[str]): the id of the request
+        '''
+        self._correlation_id = correlation_id
+
+    @property
+    def priority(self) -> Optional[int]:
+        """Get the priority of the message, from 0 (lowest) to 9 (highest), or None if it was not specified."""
+        return self._priority
+    @priority.setter
+    def priority(self, priority: Optional[int]):
+        '''Set the priority of the message.
+
+        Args:
+            priority (Optional[int]): the priority of the message, from 0 (lowest) to 9 (highest)
+        '''
+        self._priority = priority
+
+    @property
+    def deadline(self) -> Optional[float]:
+        """Get the time, in seconds since the epoch, after which the message is expired (or None if it never expires)."""
+        return self._deadline
+    @deadline.setter
+    def deadline(self, deadline: Optional[float]):
+        '''Set the time after which the message is expired.
+
+        Args:
+            deadline (Optional[float]): the time, in seconds since the epoch, after which the message is expired
+        '''
+        self._deadline = deadline
+
+    @property
+    def expired(self) -> bool:
+        """Whether the deadline of the message has passed."""
+        return self._deadline is not None and self._deadline <= time.time()
+
     @property
     def message_type(self) -> WiseAgentMessageType:
         """Get the type of the message (or None if the type was not specified)."""
@@ -106,7 +265,195 @@ class WiseAgentMessage(YAMLObject):
         """Get the id of the tool."""
         return self._route_response_to
 
+    def to_dict(self) -> dict:
+        '''Get the fields of the message which are set, as JSON compatible values. The contents of an offloaded
+        message are not included, only their reference.'''
+        fields = {"message": self._message if self._message_ref is None else None,
+                  "context_name": self._context_name,
+                  "sender": self._sender,
+                  "message_type": self._message_type.value if self._message_type else None,
+                  "tool_id": self._tool_id,
+                  "route_response_to": self._route_response_to,
+                  "sender_instance_id": self._sender_instance_id,
+                  "message_ref": self._message_ref,
+                  "message_id": self._message_id,
+                  "correlation_id": self._correlation_id,
+                  "priority": self._priority,
+                  "deadline": self._deadline}
+        return {key: value for key, value in fields.items() if value is not None}
+
+    @classmethod
+    def from_dict(cls, fields: dict) -> 'WiseAgentMessage':
+        '''Create a message from the fields returned by to_dict.
+
+        Args:
+            fields (dict): the fields of the message
+
+        Returns:
+            WiseAgentMessage: the message'''
+        fields = dict(fields)
+        fields.setdefault("message", None)
+        if fields.get("message_type"):
+            fields["message_type"] = WiseAgentMessageType(fields["message_type"])
+        return cls(**fields)
+
+
+class WiseAgentMessageCodec():
+    ''' A codec encoding the messages sent by the transports. The transports send the content type of the codec
+    along with each message, so that the receiver can decode it whatever its own codec is. '''
+
+    content_type: str = None
+
+    def __init__(self):
+        enforce_no_abstract_class_instances(self.__class__, WiseAgentMessageCodec)
+
+    @abstractmethod
+    def encode(self, message: WiseAgentMessage) -> bytes:
+        '''Encode the given message.
+
+        Args:
+            message (WiseAgentMessage): the message to encode
+
+        Returns:
+            bytes: the encoded message'''
+        ...
+
+    @abstractmethod
+    def decode(self, data: bytes) -> WiseAgentMessage:
+        '''Decode the given data.
+
+        Args:
+            data (bytes): the encoded message
+
+        Returns:
+            WiseAgentMessage: the message'''
+        ...
+
+
+class JSONWiseAgentMessageCodec(WiseAgentMessageCodec):
+    ''' A codec encoding the messages as compact JSON objects. This is the default codec. '''
+
+    content_type = "application/json"
+
+    def encode(self, message: WiseAgentMessage) -> bytes:
+        '''Encode the given message as JSON.'''
+        return json.dumps(message.to_dict(), separators=(",", ":")).encode("utf-8")
+
+    def decode(self, data: bytes) -> WiseAgentMessage:
+        '''Decode a message encoded as JSON.'''
+        return WiseAgentMessage.from_dict(json.loads(data))
+
+
+class MsgpackWiseAgentMessageCodec(WiseAgentMessageCodec):
+    ''' A codec encoding the messages with msgpack, which requires the msgpack package. '''
+
+    content_type = "application/msgpack"
+
+    def __init__(self):
+        super().__init__()
+        # imported here since msgpack is an optional dependency
+        import msgpack
+        self._msgpack = msgpack
+
+    def encode(self, message: WiseAgentMessage) -> bytes:
+        '''Encode the given message with msgpack.'''
+        return self._msgpack.packb(message.to_dict())
+
+    def decode(self, data: bytes) -> WiseAgentMessage:
+        '''Decode a message encoded with msgpack.'''
+        return WiseAgentMessage.from_dict(self._msgpack.unpackb(data))
+
+
+class _MessageYAMLLoader(yaml.SafeLoader):
+    ''' A safe YAML loader only constructing messages, for the messages encoded by the YAML codec. '''
+
+
+def _construct_message(loader: yaml.SafeLoader, node: yaml.Node) -> WiseAgentMessage:
+    '''Construct a message from its YAML mapping.'''
+    message = WiseAgentMessage.__new__(WiseAgentMessage)
+    message.__setstate__(loader.construct_mapping(node, deep=True))
+    return message
+
+
+_MessageYAMLLoader.add_constructor(WiseAgentMessage.yaml_tag, _construct_message)
+
+
+class YAMLWiseAgentMessageCodec(WiseAgentMessageCodec):
+    ''' A codec encoding the messages as YAML, as done by the previous versions. It is slower than the other codecs
+    and only kept for compatibility. The messages are decoded with a safe loader. '''
+
+    content_type = "application/yaml"
+
+    def encode(self, message: WiseAgentMessage) -> bytes:
+        '''Encode the given message as YAML.'''
+        return yaml.dump(message).encode("utf-8")
+
+    def decode(self, data: bytes) -> WiseAgentMessage:
+        '''Decode a message encoded as YAML.'''
+        return yaml.load(data, _MessageYAMLLoader)
+
+
+_MESSAGE_CODECS = {"json": JSONWiseAgentMessageCodec, "msgpack": MsgpackWiseAgentMessageCodec,
+                   "yaml": YAMLWiseAgentMessageCodec}
+_message_codecs: dict[str, WiseAgentMessageCodec] = {}
+
+
+def get_message_codec(name: str) -> WiseAgentMessageCodec:
+    '''Get the codec with the given name.
+
+    Args:
+        name (str): the name of the codec: json, msgpack or yaml
+
+    Returns:
+        WiseAgentMessageCodec: the codec'''
+    codec = _message_codecs.get(name)
+    if codec is None:
+        if name not in _MESSAGE_CODECS:
+            raise ValueError(f"Unknown message codec {name}, it must be one of {list(_MESSAGE_CODECS)}")
+        codec = _message_codecs[name] = _MESSAGE_CODECS[name]()
+    return codec
+
+
+def decode_message(data: bytes, content_type: Optional[str] = None,
+                   content_encoding: Optional[str] = None) -> WiseAgentMessage:
+    '''Decode a message with the codec of the given content type.
+
+    Args:
+        data (bytes): the encoded message
+        content_type (Optional[str]): the content type sent along with the message. Messages without content type
+        were sent by previous versions and are decoded as YAML
+        content_encoding (Optional[str]): the content encoding sent along with the message, deflate when the
+        message was compressed by the transport
+
+    Returns:
+        WiseAgentMessage: the message'''
+    if content_encoding is not None:
+        if content_encoding != "deflate":
+            raise ValueError(f"Unsupported message content encoding {content_encoding}")
+        data = zlib.decompress(data)
+    if content_type is None:
+        return get_message_codec("yaml").decode(data)
+    media_type = content_type.split(";")[0].strip()
+    for name, codec_class in _MESSAGE_CODECS.items():
+        if codec_class.content_type == media_type:
+            return get_message_codec(name).decode(data)
+    raise ValueError(f"Unsupported message content type {content_type}")
+
+
 class WiseAgentTransport(WiseAgentsYAMLObject):
+
+    # The id of the instance of the agent using the transport, set when the agent is replicated
+    _instance_id: Optional[str] = None
+    # The maximum number of requests passed concurrently to the request receiver, set by the agent
+    _max_concurrency: int = 1
+    # The name of the codec encoding the messages sent by the transport, json when not set
+    _codec: Optional[str] = None
+    # The size in bytes above which the encoded messages are compressed, never when not set
+    _compression_threshold: Optional[int] = None
+    # The size in bytes above which the message contents are offloaded to the blob store, never when not set
+    _claim_check_threshold: Optional[int] = None
+    # The name of the blob store of the offloaded contents, redis or file
+    _blob_store: Optional[str] = None
     
     def __init__(self):
         enforce_no_abstract_class_instances(self.__class__, WiseAgentTransport)
@@ -136,6 +483,8 @@ class WiseAgentTransport(WiseAgentsYAMLObject):
         del state['response_receiver']
         del state['event_receiver']
         del state['error_receiver']
+        state.pop('instance_id', None)
+        state.pop('max_concurrency', None)
         return state
 
        
@@ -158,13 +507,16 @@ class WiseAgentTransport(WiseAgentsYAMLObject):
         pass
     
     @abstractmethod
-    def send_response(self, message: WiseAgentMessage, dest_agent_name: str):
+    def send_response(self, message: WiseAgentMessage, dest_agent_name: str, dest_instance_id: Optional[str] = None):
         """
         Send a request message to an agent.
 
 
         Args:
             message (WiseAgentMessage): the message to send
+            dest_agent_name (str): the name of the destination agent
+            dest_instance_id (Optional[str]): the id of the instance of the destination agent when it is replicated,
+            None to send the response to any instance
         """
         pass
     
@@ -175,6 +527,102 @@ class WiseAgentTransport(WiseAgentsYAMLObject):
         """
         pass
     
+    @property
+    def codec(self) -> WiseAgentMessageCodec:
+        """Get the codec encoding the messages sent by the transport."""
+        return get_message_codec(self._codec or "json")
+
+    @property
+    def compression_threshold(self) -> Optional[int]:
+        """Get the size in bytes above which the encoded messages are compressed, None if they are never compressed."""
+        return self._compression_threshold
+
+    @property
+    def claim_check_threshold(self) -> Optional[int]:
+        """Get the size in bytes above which the message contents are offloaded to the blob store,
+        None if they are never offloaded."""
+        return self._claim_check_threshold
+
+    @property
+    def blob_store(self) -> WiseAgentBlobStore:
+        """Get the blob store of the offloaded message contents. It is the Redis server of the registry by default,
+        or the message_blob_directory of the registry configuration when the registry doesn't use Redis."""
+        name = self._blob_store
+        if name is None:
+            # imported here since the registry depends on this module
+            from wiseagents.core import WiseAgentRegistry
+            name = "redis" if WiseAgentRegistry.get_config().get("use_redis") == True else "file"
+        return create_blob_store(name)
+
+    def claim_check(self, message: WiseAgentMessage) -> WiseAgentMessage:
+        '''Offload the contents of the given message to the blob store when they are larger than the claim check
+        threshold. The contents are stored once, and the messages sent and traced afterwards only carry their reference.
+
+        Args:
+            message (WiseAgentMessage): the message
+
+        Returns:
+            WiseAgentMessage: a copy of the message with the reference of its contents,
+            or the message itself when its contents are not offloaded'''
+        threshold = self._claim_check_threshold
+        # an utf-8 character is at most 4 bytes, so short messages don't need to be encoded to be checked
+        if (threshold is None or message.message_ref is not None or message.message is None
+                or len(message.message) * 4 <= threshold):
+            return message
+        data = message.message.encode("utf-8")
+        if len(data) <= threshold:
+            return message
+        return message.copy_with(message_ref=self.blob_store.put(data), message_id=message.message_id)
+
+    def encode_message(self, message: WiseAgentMessage) -> Tuple[bytes, dict[str, str]]:
+        '''Encode the given message with the codec of the transport, offloading its contents when they are larger than
+        the claim check threshold and compressing it when it is larger than the compression threshold.
+
+        Args:
+            message (WiseAgentMessage): the message to encode
+
+        Returns:
+            Tuple[bytes, dict[str, str]]: the encoded message and the headers to send along with it,
+            to be given to decode_message by the receiver'''
+        codec = self.codec
+        data = codec.encode(self.claim_check(message))
+        headers = {"content-type": codec.content_type}
+        if self._compression_threshold is not None and len(data) > self._compression_threshold:
+            data = zlib.compress(data)
+            headers["content-encoding"] = "deflate"
+        return data, headers
+
+    @property
+    def instance_id(self) -> Optional[str]:
+        """Get the id of the instance of the agent using the transport, None if the agent is not replicated."""
+        return self._instance_id
+
+    @instance_id.setter
+    def instance_id(self, instance_id: Optional[str]):
+        '''Set the id of the instance of the agent using the transport. It must be set before the transport is started.
+
+        Args:
+            instance_id (Optional[str]): the id of the instance
+        '''
+        self._instance_id = instance_id
+
+    @property
+    def max_concurrency(self) -> int:
+        """Get the maximum number of requests passed concurrently to the request receiver."""
+        return self._max_concurrency
+
+    @max_concurrency.setter
+    def max_concurrency(self, max_concurrency: int):
+        '''Set the maximum number of requests passed concurrently to the request receiver. It must be set before
+        the transport is started.
+
+        Args:
+            max_concurrency (int): the maximum number of requests handled concurrently, at least 1
+        '''
+        if max_concurrency < 1:
+            raise ValueError(f"The maximum concurrency must be at least 1, not {max_concurrency}")
+        self._max_concurrency = max_concurrency
+
     @property
     def request_receiver(self) -> Optional[Callable[[], WiseAgentMessage]]:
         """Get the message receiver callback."""
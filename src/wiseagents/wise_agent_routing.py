@@ -0,0 +1,93 @@
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from wiseagents.constants import DEFAULT_EMBEDDING_MODEL_NAME
+
+
+class WiseAgentRoutingIndex:
+    '''
+    A WiseAgentRoutingIndex embeds the agent descriptions and finds the agents that are the most semantically
+    relevant for a query, so that a coordinator only needs to ask its LLM to choose among a few agents.
+    The embeddings are stored by the registry, this class only computes and compares them.
+    '''
+
+    def __init__(self, embedding_model_name: Optional[str] = DEFAULT_EMBEDDING_MODEL_NAME,
+                 embeddings: Optional[Embeddings] = None):
+        '''Initialize the index.
+
+        Args:
+            embedding_model_name (Optional[str]): the name of the HuggingFace embedding model to use
+            embeddings (Optional[Embeddings]): the embeddings to use instead of the HuggingFace embedding model
+        '''
+        self._embedding_model_name = embedding_model_name
+        self._embeddings = embeddings
+        # The agent embeddings the matrix was built from, the agent names, their rows and the matrix of the embeddings
+        self._matrix: Tuple[Optional[Dict[str, np.ndarray]], List[str], Dict[str, int], Optional[np.ndarray]] = \
+            (None, [], {}, None)
+
+    @property
+    def embeddings(self) -> Embeddings:
+        '''Get the embeddings used by the index, loading the embedding model if needed.'''
+        if self._embeddings is None:
+            # imported here since loading the embedding model is only needed when the index is used
+            from langchain_huggingface import HuggingFaceEmbeddings
+            model_kwargs = {'tokenizer_kwargs': {"clean_up_tokenization_spaces": True}}
+            self._embeddings = HuggingFaceEmbeddings(model_name=self._embedding_model_name, model_kwargs=model_kwargs)
+        return self._embeddings
+
+    def embed_descriptions(self, descriptions: List[str]) -> List[np.ndarray]:
+        '''Embed the given agent descriptions.
+
+        Args:
+            descriptions (List[str]): the agent descriptions
+
+        Returns:
+            List[np.ndarray]: the normalized embeddings of the descriptions, as float32 arrays'''
+        return [_normalize(vector) for vector in self.embeddings.embed_documents(descriptions)]
+
+    def get_most_relevant_agents(self, query: str, agent_embeddings: Dict[str, np.ndarray], top_k: int,
+                                 agent_names: Optional[Iterable[str]] = None) -> List[str]:
+        '''Get the names of the agents whose descriptions are the most similar to the given query.
+
+        Args:
+            query (str): the query
+            agent_embeddings (Dict[str, np.ndarray]): the embeddings of the agent descriptions by agent name,
+            as returned by embed_descriptions. The matrix built from them is reused as long as the same dict is given,
+            so it must not be modified
+            top_k (int): the maximum number of agents to return
+            agent_names (Optional[Iterable[str]]): the names of the agents to choose from, by default all the agents
+            of agent_embeddings. Only their rows of the matrix are used, so that the matrix is not built again for
+            each selection
+
+        Returns:
+            List[str]: the names of the most relevant agents, the most relevant first'''
+        if not agent_embeddings or top_k <= 0:
+            return []
+        source, names, rows, matrix = self._matrix
+        if source is not agent_embeddings:
+            names = list(agent_embeddings)
+            rows = {name: row for row, name in enumerate(names)}
+            matrix = np.stack([agent_embeddings[name] for name in names])
+            self._matrix = (agent_embeddings, names, rows, matrix)
+        if agent_names is None:
+            selected = np.arange(len(names))
+            scores = matrix @ _normalize(self.embeddings.embed_query(query))
+        else:
+            selected = np.fromiter((rows[name] for name in agent_names if name in rows), dtype=np.intp)
+            if len(selected) == 0:
+                return []
+            scores = matrix[selected] @ _normalize(self.embeddings.embed_query(query))
+        if top_k < len(selected):
+            best = np.argpartition(-scores, top_k)[:top_k]
+        else:
+            best = np.arange(len(selected))
+        return [names[selected[i]] for i in best[np.argsort(-scores[best])]]
+
+
+def _normalize(vector: List[float]) -> np.ndarray:
+    '''Convert an embedding to a float32 array of norm 1, so that the dot product gives the cosine similarity.'''
+    array = np.asarray(vector, dtype=np.float32)
+    norm = np.linalg.norm(array)
+    return array / norm if norm > 0 else array
@@ -0,0 +1,297 @@
+import base64
+import importlib
+import json
+import pickle
+import zlib
+from abc import abstractmethod
+from typing import Any, Callable, Optional
+
+import yaml
+from openai.types.chat import ChatCompletionMessage
+from pydantic import BaseModel
+
+from wiseagents import enforce_no_abstract_class_instances
+
+
+class WiseAgentSerializer():
+    ''' A serializer converting the values stored by the registry and the contexts to bytes and back. '''
+
+    def __init__(self):
+        enforce_no_abstract_class_instances(self.__class__, WiseAgentSerializer)
+
+    @abstractmethod
+    def dumps(self, value: Any) -> bytes:
+        '''Serialize the given value.
+
+        Args:
+            value (Any): the value to serialize
+
+        Returns:
+            bytes: the serialized value'''
+        ...
+
+    @abstractmethod
+    def loads(self, data: bytes) -> Any:
+        '''Deserialize the given data.
+
+        Args:
+            data (bytes): the data to deserialize
+
+        Returns:
+            Any: the deserialized value'''
+        ...
+
+
+class PickleWiseAgentSerializer(WiseAgentSerializer):
+    ''' A serializer using pickle. Since loading pickled data can run arbitrary code, it must only be used when
+    only trusted processes can write to Redis. '''
+
+    def dumps(self, value: Any) -> bytes:
+        '''Serialize the given value with pickle.'''
+        return pickle.dumps(value)
+
+    def loads(self, data: bytes) -> Any:
+        '''Deserialize the given data with pickle.'''
+        return pickle.loads(data)
+
+
+class JSONWiseAgentSerializer(WiseAgentSerializer):
+    '''
+    A compact serializer using JSON, which is faster and smaller than pickle for chat histories and doesn't
+    depend on the Python classes being identical on both sides.
+    The serialized data starts with a header containing a format version and flags, and the JSON payload is
+    compressed with zlib when it is larger than the compression threshold.
+    Objects are encoded as follows:
+        * tuples, sets and frozensets are encoded as lists tagged with their type, and loaded with the same type
+        * the pydantic models registered with register_type (e.g. the ChatCompletionMessage returned by the LLM) are
+          encoded as their class name and fields, other pydantic models are encoded, and loaded, as dicts
+        * YAML objects defining __getstate__/__setstate__ (e.g. WiseAgentMetaData), and the classes registered with
+          register_type, are encoded as their class name and state
+        * the functions registered with register_callable are encoded as their import path
+        * anything else raises a TypeError
+    Loading an object never imports a module: its class, or function, is looked up among the registered ones and the
+    YAML objects already imported, so that stored data can't make the process import arbitrary code.
+    The keys of the dicts starting with the prefix of the keys reserved by this encoding are escaped, so that stored
+    data can't be decoded as objects it was not encoded from.
+    Loading pickled data, i.e. data without the header, stored by the previous versions, or objects encoded with
+    pickle by them, can run arbitrary code, so it requires allow_pickle.
+    '''
+
+    MAGIC = b"WA"
+    VERSION = 1
+    FLAG_COMPRESSED = 0x01
+
+    _TYPE_KEY = "__wa_type__"
+    _STATE_KEY = "__wa_state__"
+    _CALLABLE_KEY = "__wa_callable__"
+    _TUPLE_KEY = "__wa_tuple__"
+    _SET_KEY = "__wa_set__"
+    _FROZENSET_KEY = "__wa_frozenset__"
+    # Only read when allow_pickle is set, for the values stored by the previous versions
+    _PICKLE_KEY = "__wa_pickle__"
+    # The user keys starting with the reserved prefix are escaped with this prefix
+    _RESERVED_PREFIX = "__wa_"
+    _ESCAPE_PREFIX = "__wa_escaped_"
+
+    # The classes that can be encoded with their state, besides the YAML objects, by import path
+    _registered_types: dict[str, type] = {}
+    # The YAML objects imported so far, by import path, refreshed when an unknown class is loaded
+    _yaml_types: dict[str, type] = {}
+    # The functions that can be encoded, by import path
+    _registered_callables: dict[str, Callable] = {}
+
+    def __init__(self, compression_threshold: Optional[int] = 1024, compression_level: Optional[int] = 6,
+                 allow_pickle: bool = False):
+        '''Initialize the serializer.
+
+        Args:
+            compression_threshold (Optional[int]): the size in bytes above which the payload is compressed,
+            None to never compress. Default is 1024
+            compression_level (Optional[int]): the zlib compression level. Default is 6
+            allow_pickle (bool): whether to load the pickled data stored by the previous versions, which can run
+            arbitrary code. Default is False
+        '''
+        self._compression_threshold = compression_threshold
+        self._compression_level = compression_level
+        self._allow_pickle = allow_pickle
+
+    @classmethod
+    def register_type(cls, type_: type):
+        '''Allow the instances of the given class, which must define __getstate__ and __setstate__, to be encoded
+        with their state.
+
+        Args:
+            type_ (type): the class'''
+        cls._registered_types[import_path(type_)] = type_
+
+    @classmethod
+    def register_callable(cls, callable_: Callable):
+        '''Allow the given module-level function to be encoded with its import path.
+
+        Args:
+            callable_ (Callable): the function'''
+        path = import_path(callable_)
+        if resolve_import_path(path) is not callable_:
+            raise ValueError(f"Can't register {callable_}, it can't be imported from {path}")
+        cls._registered_callables[path] = callable_
+
+    @classmethod
+    def _is_allowed_type(cls, type_: Any) -> bool:
+        '''Get whether the instances of the given class can be encoded with their state.'''
+        return isinstance(type_, type) and (issubclass(type_, yaml.YAMLObject)
+                                            or cls._registered_types.get(import_path(type_)) is type_)
+
+    @classmethod
+    def _get_allowed_type(cls, path: str) -> Optional[type]:
+        '''Get the registered class, or the YAML object already imported, with the given import path, without
+        importing anything.'''
+        type_ = cls._registered_types.get(path) or cls._yaml_types.get(path)
+        if type_ is None:
+            subclasses = [yaml.YAMLObject]
+            while subclasses:
+                subclass = subclasses.pop()
+                cls._yaml_types[import_path(subclass)] = subclass
+                subclasses.extend(subclass.__subclasses__())
+            type_ = cls._yaml_types.get(path)
+        return type_
+
+    @property
+    def compression_threshold(self) -> Optional[int]:
+        '''Get the size in bytes above which the payload is compressed.'''
+        return self._compression_threshold
+
+    def dumps(self, value: Any) -> bytes:
+        '''Serialize the given value to a versioned, optionally compressed, JSON payload.'''
+        payload = json.dumps(self._escape(value), separators=(",", ":"), default=self._encode).encode("utf-8")
+        flags = 0
+        if self._compression_threshold is not None and len(payload) > self._compression_threshold:
+            payload = zlib.compress(payload, self._compression_level)
+            flags |= self.FLAG_COMPRESSED
+        return self.MAGIC + bytes([self.VERSION, flags]) + payload
+
+    def loads(self, data: bytes) -> Any:
+        '''Deserialize the given data, falling back to pickle for data that was not serialized by this serializer
+        when pickle is allowed.'''
+        if not data.startswith(self.MAGIC):
+            if not self._allow_pickle:
+                raise ValueError("The data was not serialized by this serializer, and loading pickled data is not "
+                                 "allowed")
+            return pickle.loads(data)
+        version, flags = data[2], data[3]
+        if version > self.VERSION:
+            raise ValueError(f"Unsupported serialization format version {version}")
+        payload = data[4:]
+        if flags & self.FLAG_COMPRESSED:
+            payload = zlib.decompress(payload)
+        return json.loads(payload, object_hook=self._decode)
+
+    def _escape(self, value: Any) -> Any:
+        '''Escape the keys of the dicts of the given value starting with the reserved prefix, copying only the
+        containers that change.'''
+        if isinstance(value, dict):
+            for key, item in value.items():
+                if self._is_reserved(key) or self._escape(item) is not item:
+                    return {(self._ESCAPE_PREFIX + key if self._is_reserved(key) else key): self._escape(item)
+                            for key, item in value.items()}
+        elif isinstance(value, tuple):
+            # JSON encodes the tuples as lists without calling _encode
+            return {self._TUPLE_KEY: [self._escape(item) for item in value]}
+        elif isinstance(value, list):
+            for item in value:
+                if self._escape(item) is not item:
+                    return [self._escape(item) for item in value]
+        return value
+
+    def _is_reserved(self, key: Any) -> bool:
+        '''Get whether the given key starts with the reserved prefix.'''
+        return isinstance(key, str) and key.startswith(self._RESERVED_PREFIX)
+
+    def _encode(self, value: Any) -> Any:
+        '''Encode a value that is not natively supported by JSON.'''
+        if isinstance(value, BaseModel):
+            state = self._escape(value.model_dump(exclude_none=True))
+            if self._is_allowed_type(type(value)):
+                return {self._TYPE_KEY: import_path(value.__class__), self._STATE_KEY: state}
+            return state
+        if isinstance(value, (set, frozenset)):
+            return {self._SET_KEY if isinstance(value, set) else self._FROZENSET_KEY: self._escape(list(value))}
+        if callable(value) and self._registered_callables.get(import_path(value)) is value:
+            return {self._CALLABLE_KEY: import_path(value)}
+        if hasattr(value, "__setstate__") and self._is_allowed_type(type(value)):
+            state = value.__getstate__()
+            if isinstance(state, dict):
+                return {self._TYPE_KEY: import_path(value.__class__), self._STATE_KEY: self._escape(state)}
+        raise TypeError(f"Object of type {type(value).__qualname__} can't be serialized, register its class with "
+                        f"JSONWiseAgentSerializer.register_type if it defines __getstate__ and __setstate__, or the "
+                        f"function with JSONWiseAgentSerializer.register_callable")
+
+    def _decode(self, value: dict) -> Any:
+        '''Decode a JSON object produced by _encode, unescaping the keys of the other objects.'''
+        if self._TUPLE_KEY in value:
+            return tuple(value[self._TUPLE_KEY])
+        if self._SET_KEY in value:
+            return set(value[self._SET_KEY])
+        if self._FROZENSET_KEY in value:
+            return frozenset(value[self._FROZENSET_KEY])
+        if self._TYPE_KEY in value:
+            cls = self._get_allowed_type(value[self._TYPE_KEY])
+            if cls is None:
+                raise ValueError(f"Can't deserialize an instance of {value[self._TYPE_KEY]}, it is not an allowed type")
+            if issubclass(cls, BaseModel):
+                return cls.model_validate(value[self._STATE_KEY])
+            obj = cls.__new__(cls)
+            obj.__setstate__(value[self._STATE_KEY])
+            return obj
+        if self._CALLABLE_KEY in value:
+            callable_ = self._registered_callables.get(value[self._CALLABLE_KEY])
+            if callable_ is None:
+                raise ValueError(f"Can't deserialize the function {value[self._CALLABLE_KEY]}, it is not registered")
+            return callable_
+        if self._PICKLE_KEY in value:
+            if not self._allow_pickle:
+                raise ValueError("Can't deserialize a pickled object, loading pickled data is not allowed")
+            return pickle.loads(base64.b64decode(value[self._PICKLE_KEY]))
+        if any(isinstance(key, str) and key.startswith(self._ESCAPE_PREFIX) for key in value):
+            return {(key[len(self._ESCAPE_PREFIX):] if key.startswith(self._ESCAPE_PREFIX) else key): item
+                    for key, item in value.items()}
+        return value
+
+
+def import_path(value: Any) -> str:
+    '''Get the import path of a class or function, i.e. module:qualified_name.'''
+    return f"{getattr(value, '__module__', None)}:{getattr(value, '__qualname__', None)}"
+
+
+def resolve_import_path(import_path: str) -> Optional[Any]:
+    '''Resolve an import path created by import_path, returning None if it can't be resolved.'''
+    module_name, _, qualified_name = import_path.partition(":")
+    try:
+        resolved = importlib.import_module(module_name)
+        for name in qualified_name.split("."):
+            resolved = getattr(resolved, name)
+        return resolved
+    except (ImportError, AttributeError, ValueError):
+        return None
+
+
+# the messages returned by the LLM are stored in the chat completions of the contexts
+JSONWiseAgentSerializer.register_type(ChatCompletionMessage)
+
+
+def create_serializer(config: dict) -> WiseAgentSerializer:
+    '''Create the serializer described by the registry configuration.
+
+    Args:
+        config (dict): the registry configuration. The "serializer" key can be "json" (the default) or "pickle",
+        "serializer_compression_threshold" sets the size above which the JSON serializer compresses the payload
+        and "serializer_allow_pickle" lets it read the pickled values stored by the previous versions
+
+    Returns:
+        WiseAgentSerializer: the serializer'''
+    serializer = config.get("serializer", "json")
+    if serializer == "pickle":
+        return PickleWiseAgentSerializer()
+    if serializer == "json":
+        return JSONWiseAgentSerializer(compression_threshold=config.get("serializer_compression_threshold", 1024),
+                                       allow_pickle=config.get("serializer_allow_pickle", False))
+    raise ValueError(f"Unknown serializer {serializer}")
@@ -0,0 +1,136 @@
+from typing import Iterable, Iterator
+
+import pytest
+from openai.types.chat import ChatCompletion, ChatCompletionMessageParam, ChatCompletionToolParam
+
+from wiseagents import WiseAgentCollaborationType, WiseAgentMessage, WiseAgentMessageType, WiseAgentMetaData, \
+    WiseAgentRegistry, WiseAgentTransport
+from wiseagents.agents import LLMOnlyWiseAgent, PhasedCoordinatorWiseAgent, SequentialCoordinatorWiseAgent
+from wiseagents.llm import WiseAgentLLM
+from tests.wiseagents import assert_standard_variables_set
+
+
+@pytest.fixture(scope="session", autouse=True)
+def run_after_all_tests():
+    assert_standard_variables_set()
+    yield
+
+
+class RecordingTransport(WiseAgentTransport):
+    def __init__(self):
+        self.requests = []
+        self.responses = []
+
+    def send_request(self, message: WiseAgentMessage, dest_agent_name: str):
+        self.requests.append((message, dest_agent_name))
+
+    def send_response(self, message: WiseAgentMessage, dest_agent_name: str, dest_instance_id=None):
+        self.responses.append((message, dest_agent_name))
+
+    def start(self):
+        pass
+
+    def stop(self):
+        pass
+
+
+class FakeLLM(WiseAgentLLM):
+    def process_single_prompt(self, prompt):
+        pass
+
+    def process_chat_completion(self, messages: Iterable[ChatCompletionMessageParam],
+                                tools: Iterable[ChatCompletionToolParam]) -> ChatCompletion:
+        return ChatCompletion(id="fake", created=0, model=self.model_name, object="chat.completion",
+                              choices=[{"index": 0, "finish_reason": "stop",
+                                        "message": {"role": "assistant", "content": "Hello Stefano"}}])
+
+
+class FakeStreamingLLM(FakeLLM):
+    def process_chat_completion_stream(self, messages: Iterable[ChatCompletionMessageParam],
+                                       tools: Iterable[ChatCompletionToolParam]) -> Iterator[str]:
+        yield from ["Hello", " Stefano"]
+
+
+def test_default_stream_yields_whole_completion():
+    assert list(FakeLLM("fake").process_chat_completion_stream([], [])) == ["Hello Stefano"]
+
+
+@pytest.mark.parametrize("stream", [False, True])
+def test_llm_only_agent_streams_chunks(stream):
+    agent = LLMOnlyWiseAgent(name="StreamingAgent", metadata=WiseAgentMetaData(description="A streaming agent"),
+                             llm=FakeStreamingLLM("fake"), transport=RecordingTransport(), stream=stream)
+    try:
+        context = WiseAgentRegistry.create_context("StreamingContext")
+        request = WiseAgentMessage(message="Hello, my name is Stefano", sender="Client", context_name=context.name,
+                                   message_id="request-1")
+        agent.transport.request_receiver(request)
+        responses = [message for message, dest_agent_name in agent.transport.responses
+                     if dest_agent_name == "Client"]
+        chunks = [response.message for response in responses
+                  if response.message_type == WiseAgentMessageType.CHUNK]
+        assert chunks == (["Hello", " Stefano"] if stream else [])
+        assert responses[-1].message_type != WiseAgentMessageType.CHUNK
+        assert responses[-1].message == "Hello Stefano"
+        assert all(response.correlation_id == "request-1" for response in responses)
+    finally:
+        agent.stop_agent()
+        if WiseAgentRegistry.does_context_exist("StreamingContext"):
+            WiseAgentRegistry.remove_context("StreamingContext")
+
+
+def test_llm_only_agent_does_not_stream_in_phased_coordination():
+    agent = LLMOnlyWiseAgent(name="StreamingAgent", metadata=WiseAgentMetaData(description="A streaming agent"),
+                             llm=FakeStreamingLLM("fake"), transport=RecordingTransport(), stream=True)
+    try:
+        context = WiseAgentRegistry.create_context("StreamingContext")
+        context.set_collaboration_type(WiseAgentCollaborationType.PHASED)
+        request = WiseAgentMessage(message="Hello, my name is Stefano", sender="Coordinator",
+                                   context_name=context.name)
+        agent.transport.request_receiver(request)
+        responses = [message for message, dest_agent_name in agent.transport.responses]
+        assert [response.message_type for response in responses] == [WiseAgentMessageType.ACK]
+        assert responses[0].message == "Hello Stefano"
+    finally:
+        agent.stop_agent()
+        if WiseAgentRegistry.does_context_exist("StreamingContext"):
+            WiseAgentRegistry.remove_context("StreamingContext")
+
+
+def test_llm_only_agent_does_not_stream_in_sequential_coordination():
+    agent = LLMOnlyWiseAgent(name="StreamingAgent", metadata=WiseAgentMetaData(description="A streaming agent"),
+                             llm=FakeStreamingLLM("fake"), transport=RecordingTransport(), stream=True)
+    try:
+        context = WiseAgentRegistry.create_context("StreamingContext")
+        context.set_collaboration_type(WiseAgentCollaborationType.SEQUENTIAL)
+        context.set_agents_sequence(["StreamingAgent", "NextAgent"])
+        request = WiseAgentMessage(message="Hello, my name is Stefano", sender="Coordinator",
+                                   context_name=context.name)
+        agent.transport.request_receiver(request)
+        assert agent.transport.responses == []
+        assert [(message.message, dest_agent_name) for message, dest_agent_name in agent.transport.requests] == \
+            [("Hello Stefano", "NextAgent")]
+    finally:
+        agent.stop_agent()
+        if WiseAgentRegistry.does_context_exist("StreamingContext"):
+            WiseAgentRegistry.remove_context("StreamingContext")
+
+
+def test_coordinators_ignore_chunks():
+    sequential = SequentialCoordinatorWiseAgent(name="SequentialCoordinator",
+                                                metadata=WiseAgentMetaData(description="A sequential coordinator"),
+                                                transport=RecordingTransport(), agents=["StreamingAgent"])
+    phased = PhasedCoordinatorWiseAgent(name="PhasedCoordinator",
+                                        metadata=WiseAgentMetaData(description="A phased coordinator"),
+                                        transport=RecordingTransport(), llm=FakeLLM("fake"))
+    try:
+        WiseAgentRegistry.create_context("StreamingContext")
+        chunk = WiseAgentMessage(message="Hello", sender="StreamingAgent", context_name="StreamingContext",
+                                 message_type=WiseAgentMessageType.CHUNK)
+        assert sequential.process_response(chunk)
+        assert phased.process_response(chunk)
+        assert sequential.transport.requests == [] and phased.transport.requests == []
+    finally:
+        sequential.stop_agent()
+        phased.stop_agent()
+        if WiseAgentRegistry.does_context_exist("StreamingContext"):
+            WiseAgentRegistry.remove_context("StreamingContext")
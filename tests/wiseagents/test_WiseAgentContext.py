@@ -0,0 +1,291 @@
+import threading
+import time
+
+import pytest
+
+from wiseagents import WiseAgentCollaborationType, WiseAgentContext, WiseAgentRegistry
+from tests.wiseagents import assert_standard_variables_set
+
+
+@pytest.fixture(scope="session", autouse=True)
+def run_after_all_tests():
+    assert_standard_variables_set()
+    yield
+
+
+def test_context_lists():
+    try:
+        context = WiseAgentRegistry.create_context("ContextLists")
+        context.append_chat_completion({"role": "system", "content": "You are a test"})
+        context.append_chat_completion({"role": "user", "content": "Hello"})
+        context.append_required_tool_call("tool1")
+        context.append_required_tool_call("tool2")
+        context.append_required_tool_call("tool1")
+        context.remove_required_tool_call("tool1")
+        context.add_query("first query")
+        context.add_query("second query")
+
+        registered_context = WiseAgentRegistry.get_context(context.name)
+        assert registered_context.llm_chat_completion == [{"role": "system", "content": "You are a test"},
+                                                          {"role": "user", "content": "Hello"}]
+        assert registered_context.llm_required_tool_call == ["tool2", "tool1"]
+        assert registered_context.get_queries() == ["first query", "second query"]
+        assert registered_context.get_current_query() == "second query"
+    finally:
+        WiseAgentRegistry.remove_context(context.name)
+
+
+def test_phase_assignments():
+    try:
+        context = WiseAgentRegistry.create_context("ContextPhases")
+        context.set_agent_phase_assignments([["Agent1", "Agent2"], ["Agent3"]])
+        context.set_current_phase(0)
+        assert sorted(context.get_required_agents_for_current_phase()) == ["Agent1", "Agent2"]
+        assert context.remove_required_agent_for_current_phase("Agent1") == False
+        assert context.get_required_agents_for_current_phase() == ["Agent2"]
+        # removing an agent twice doesn't complete the phase
+        assert context.remove_required_agent_for_current_phase("Agent1") == False
+        assert context.remove_required_agent_for_current_phase("Agent2") == True
+        assert context.remove_required_agent_for_current_phase("Agent2") == False
+        assert context.get_agents_for_next_phase() == ["Agent3"]
+        assert context.get_current_phase() == 1
+        assert context.get_required_agents_for_current_phase() == ["Agent3"]
+        assert context.get_agents_for_next_phase() is None
+
+        # an agent assigned twice to a phase is only required once
+        context.set_agent_phase_assignments([["Agent1", "Agent2", "Agent1"]])
+        assert context.get_agent_phase_assignments() == [["Agent1", "Agent2"]]
+        context.set_current_phase(0)
+        assert context.remove_required_agent_for_current_phase("Agent1") == False
+        assert context.remove_required_agent_for_current_phase("Agent2") == True
+    finally:
+        WiseAgentRegistry.remove_context(context.name)
+
+
+def test_context_reads_see_writes_from_other_instances():
+    try:
+        context = WiseAgentRegistry.create_context("ContextCache")
+        # a handle not shared with context, as created in another process
+        other_context = WiseAgentContext.from_descriptor(context.descriptor, WiseAgentRegistry.get_config())
+        context.set_agents_sequence(["Agent1", "Agent2"])
+        context.append_chat_completion({"role": "user", "content": "Hello"})
+        assert other_context.get_agents_sequence() == ["Agent1", "Agent2"]
+        assert other_context.llm_chat_completion == [{"role": "user", "content": "Hello"}]
+
+        other_context.set_agents_sequence(["Agent3"])
+        other_context.append_chat_completion({"role": "assistant", "content": "Hi"})
+        assert context.get_agents_sequence() == ["Agent3"]
+        assert context.llm_chat_completion == [{"role": "user", "content": "Hello"},
+                                               {"role": "assistant", "content": "Hi"}]
+
+        # the returned lists are copies, so modifying them doesn't affect the context
+        context.llm_chat_completion.append({"role": "user", "content": "Not stored"})
+        assert len(other_context.llm_chat_completion) == 2
+    finally:
+        WiseAgentRegistry.remove_context(context.name)
+
+
+def test_batch():
+    try:
+        context = WiseAgentRegistry.create_context("ContextBatch")
+        other_context = WiseAgentContext.from_descriptor(context.descriptor, WiseAgentRegistry.get_config())
+        with context.batch():
+            context.set_collaboration_type(WiseAgentCollaborationType.PHASED)
+            context.set_route_response_to("Agent0")
+            context.set_agent_phase_assignments([["Agent1", "Agent2"], ["Agent3"]])
+            context.set_current_phase(0)
+            context.add_query("query")
+            # the buffered values can be read back within the batch
+            assert context.get_current_phase() == 0
+            assert other_context.get_route_response_to() is None
+        assert other_context.collaboration_type == WiseAgentCollaborationType.PHASED
+        assert other_context.get_route_response_to() == "Agent0"
+        assert sorted(other_context.get_required_agents_for_current_phase()) == ["Agent1", "Agent2"]
+        assert other_context.get_current_query() == "query"
+
+        with pytest.raises(ValueError):
+            with context.batch():
+                context.set_route_response_to("Agent4")
+                raise ValueError("Discard the batch")
+        assert other_context.get_route_response_to() == "Agent0"
+    finally:
+        WiseAgentRegistry.remove_context(context.name)
+
+
+def test_batch_discarded_on_exception():
+    try:
+        context = WiseAgentRegistry.create_context("ContextBatchDiscarded")
+        context.set_agent_phase_assignments([["Agent1", "Agent2"]])
+        context.set_current_phase(0)
+        chat_completion = context.llm_chat_completion
+        with pytest.raises(ValueError):
+            with context.batch():
+                context.append_chat_completion({"role": "user", "content": "Hello"})
+                context.add_query("query")
+                context.set_agent_phase_assignments([["Agent3"]])
+                context.set_current_phase(0)
+                raise ValueError("Discard the batch")
+        assert context.llm_chat_completion == chat_completion
+        assert "query" not in context.get_queries()
+        assert context.get_agent_phase_assignments() == [["Agent1", "Agent2"]]
+        assert sorted(context.get_required_agents_for_current_phase()) == ["Agent1", "Agent2"]
+    finally:
+        WiseAgentRegistry.remove_context(context.name)
+
+
+def test_in_memory_batch_holds_the_context():
+    if WiseAgentRegistry.get_config().get("use_redis") == True:
+        pytest.skip("Redis batches are isolated by their transaction")
+    try:
+        context = WiseAgentRegistry.create_context("ContextBatchLocked")
+        other_thread = threading.Thread(target=lambda: context.set_route_response_to("Agent1"))
+        with context.batch():
+            context.set_route_response_to("Agent0")
+            other_thread.start()
+            # the mutation of the other thread waits for the batch to exit
+            other_thread.join(0.1)
+            assert other_thread.is_alive()
+            assert context.get_route_response_to() == "Agent0"
+        other_thread.join()
+        assert context.get_route_response_to() == "Agent1"
+    finally:
+        WiseAgentRegistry.remove_context(context.name)
+
+
+def test_get_chat_completion_since():
+    try:
+        context = WiseAgentRegistry.create_context("ContextChatSince")
+        other_context = WiseAgentContext.from_descriptor(context.descriptor, WiseAgentRegistry.get_config())
+        for i in range(3):
+            context.append_chat_completion({"role": "user", "content": f"Message {i}"})
+        assert other_context.get_chat_completion_since(0) == context.llm_chat_completion
+        assert other_context.get_chat_completion_since(2) == [{"role": "user", "content": "Message 2"}]
+        assert other_context.get_chat_completion_since(3) == []
+
+        other_context.append_chat_completion({"role": "assistant", "content": "Answer"})
+        assert context.get_chat_completion_since(3) == [{"role": "assistant", "content": "Answer"}]
+        assert len(context.llm_chat_completion) == 4
+
+        # the returned lists are copies, which neither change with the context nor change it
+        history = context.get_chat_completion_since(0)
+        history.append({"role": "user", "content": "Not appended"})
+        context.append_chat_completion({"role": "user", "content": "Message 4"})
+        assert len(history) == 5 and history[-1]["content"] == "Not appended"
+        assert [message["content"] for message in other_context.get_chat_completion_since(3)] == ["Answer",
+                                                                                                   "Message 4"]
+        assert len(context.llm_chat_completion) == 5
+    finally:
+        WiseAgentRegistry.remove_context(context.name)
+
+
+def test_context_created_again_is_not_read_from_cache():
+    context = WiseAgentRegistry.create_context("ContextCreatedAgain")
+    context.append_chat_completion({"role": "user", "content": "Old message"})
+    assert len(context.llm_chat_completion) == 1
+    WiseAgentRegistry.remove_context(context.name)
+    try:
+        context = WiseAgentRegistry.create_context("ContextCreatedAgain")
+        context.append_chat_completion({"role": "user", "content": "New message"})
+        assert context.llm_chat_completion == [{"role": "user", "content": "New message"}]
+    finally:
+        WiseAgentRegistry.remove_context(context.name)
+
+
+def test_contexts_share_redis_client():
+    if WiseAgentRegistry.get_config().get("use_redis") != True:
+        pytest.skip("redis is not used")
+    try:
+        context = WiseAgentRegistry.create_context("ContextSharedClient")
+        assert context._redis_db is WiseAgentRegistry.get_redis_db()
+        assert WiseAgentRegistry.get_context(context.name)._redis_db is WiseAgentRegistry.get_redis_db()
+    finally:
+        WiseAgentRegistry.remove_context(context.name)
+
+
+def test_scripts_registered_once(monkeypatch):
+    if WiseAgentRegistry.get_config().get("use_redis") != True:
+        pytest.skip("redis is not used")
+    redis_db = WiseAgentRegistry.get_redis_db()
+    registered = []
+    register_script = redis_db.register_script
+    monkeypatch.setattr(redis_db, "register_script", lambda script: registered.append(script) or register_script(script))
+    try:
+        context = WiseAgentRegistry.create_context("ContextScripts")
+        for _ in range(3):
+            context.set_route_response_to("Agent0")
+            assert context.get_route_response_to() == "Agent0"
+            context.append_chat_completion({"role": "user", "content": "Hello"})
+            assert context.llm_chat_completion[-1] == {"role": "user", "content": "Hello"}
+        assert len(registered) == len(set(registered))
+    finally:
+        WiseAgentRegistry.remove_context(context.name)
+
+
+def test_get_context_returns_cached_handle():
+    try:
+        context = WiseAgentRegistry.create_context("ContextHandle")
+        handle = WiseAgentRegistry.get_context(context.name)
+        assert WiseAgentRegistry.get_context(context.name) is handle
+        assert handle.descriptor == context.descriptor
+
+        # a batch is only visible to the thread running it, even if the handle is shared
+        seen_by_other_thread = []
+        with handle.batch():
+            handle.set_route_response_to("Agent0")
+            thread = threading.Thread(target=lambda: seen_by_other_thread.append(handle.get_route_response_to()))
+            thread.start()
+            thread.join()
+            assert handle.get_route_response_to() == "Agent0"
+        if WiseAgentRegistry.get_config().get("use_redis") == True:
+            assert seen_by_other_thread == [None]
+    finally:
+        WiseAgentRegistry.remove_context(context.name)
+    assert WiseAgentRegistry.get_context(context.name) is None
+
+
+def test_context_values_cache_is_bounded(monkeypatch):
+    if WiseAgentRegistry.get_config().get("use_redis") != True:
+        pytest.skip("redis is not used")
+    monkeypatch.setitem(WiseAgentRegistry.get_config(), "context_values_cache_size", 3)
+    contexts = []
+    try:
+        for i in range(3):
+            context = WiseAgentRegistry.create_context(f"ContextBounded{i}")
+            contexts.append(context)
+            context.append_chat_completion({"role": "user", "content": f"Message {i}"})
+            context.set_route_response_to(f"Agent{i}")
+            assert context.llm_chat_completion == [{"role": "user", "content": f"Message {i}"}]
+            assert context.get_route_response_to() == f"Agent{i}"
+        assert len(WiseAgentContext._redis_cache) == 3
+        # the evicted fields are read again from redis
+        assert contexts[0].llm_chat_completion == [{"role": "user", "content": "Message 0"}]
+    finally:
+        for context in contexts:
+            WiseAgentRegistry.remove_context(context.name)
+    assert len(WiseAgentContext._redis_cache) == 0
+
+
+def test_context_removed_by_other_process_is_evicted():
+    if WiseAgentRegistry.get_config().get("use_redis") != True:
+        pytest.skip("redis is not used")
+    context = WiseAgentRegistry.create_context("ContextRemovedElsewhere")
+    context.set_route_response_to("Agent0")
+    assert context.get_route_response_to() == "Agent0"
+    cache_key = context._cache_key("route_response_to")
+    assert WiseAgentContext._redis_cache.get(cache_key) is not None
+    # removed by another process: its data is deleted and the removal is notified
+    context._redis_db.delete(context.name, context._redis_key("versions"))
+    WiseAgentRegistry.get_redis_db().publish(WiseAgentRegistry.REGISTRY_CHANNEL,
+                                             WiseAgentRegistry.CONTEXT_REMOVED_NOTIFICATION + context.name)
+    for _ in range(50):
+        if WiseAgentContext._redis_cache.get(cache_key) is None:
+            break
+        time.sleep(0.1)
+    assert WiseAgentContext._redis_cache.get(cache_key) is None
+
+    # a missed notification is detected by the missing version of the fields
+    context.set_route_response_to("Agent1")
+    assert context.get_route_response_to() == "Agent1"
+    context._redis_db.delete(context.name, context._redis_key("versions"))
+    assert context.get_route_response_to() is None
+    WiseAgentRegistry.remove_context(context.name)
@@ -0,0 +1,108 @@
+import threading
+
+import pytest
+import yaml
+
+from wiseagents import WiseAgentHistoryPolicy, WiseAgentRegistry
+from wiseagents.yaml import WiseAgentsLoader
+from tests.wiseagents import assert_standard_variables_set
+
+
+@pytest.fixture(scope="session", autouse=True)
+def run_after_all_tests():
+    assert_standard_variables_set()
+    yield
+
+
+def word_count(text: str) -> int:
+    return len(text.split())
+
+
+def test_max_messages_keeps_system_messages():
+    try:
+        context = WiseAgentRegistry.create_context("HistoryMaxMessages")
+        policy = WiseAgentHistoryPolicy(max_messages=2)
+        context.append_chat_completion({"role": "system", "content": "You are a test"})
+        for i in range(3):
+            context.append_chat_completion({"role": "user", "content": f"Message {i}"})
+        assert policy.get_history(context) == [{"role": "system", "content": "You are a test"},
+                                               {"role": "user", "content": "Message 1"},
+                                               {"role": "user", "content": "Message 2"}]
+
+        context.append_chat_completion({"role": "assistant", "content": "Answer"})
+        assert policy.get_history(context) == [{"role": "system", "content": "You are a test"},
+                                               {"role": "user", "content": "Message 2"},
+                                               {"role": "assistant", "content": "Answer"}]
+    finally:
+        WiseAgentRegistry.remove_context(context.name)
+
+
+def test_max_tokens():
+    try:
+        context = WiseAgentRegistry.create_context("HistoryMaxTokens")
+        policy = WiseAgentHistoryPolicy(max_tokens=20, tokenizer=word_count)
+        context.append_chat_completion({"role": "system", "content": "one two"})
+        context.append_chat_completion({"role": "user", "content": "one two three four five six"})
+        context.append_chat_completion({"role": "assistant", "content": "one two three"})
+        # 4 tokens of overhead per message
+        assert policy.count_tokens({"role": "user", "content": "one two"}) == 6
+        assert policy.get_history(context) == [{"role": "system", "content": "one two"},
+                                               {"role": "assistant", "content": "one two three"}]
+
+        # a tool message is not kept without the assistant message containing the tool call
+        context.append_chat_completion({"role": "assistant", "content": None, "tool_calls": [
+            {"id": "call_1", "type": "function", "function": {"name": "weather", "arguments": "{}"}}]})
+        context.append_chat_completion({"role": "tool", "tool_call_id": "call_1",
+                                        "content": "one two three four five six seven"})
+        assert policy.get_history(context) == [{"role": "system", "content": "one two"}]
+    finally:
+        WiseAgentRegistry.remove_context(context.name)
+
+
+class SlowContext:
+    def __init__(self, name, messages, fetching=None, release=None):
+        self.name = name
+        self.created_at = 0
+        self._messages = messages
+        self._fetching = fetching
+        self._release = release
+
+    def get_chat_completion_since(self, index):
+        if self._fetching is not None:
+            self._fetching.set()
+            self._release.wait(5)
+        return self._messages[index:]
+
+
+def test_fetch_of_a_context_does_not_block_the_others():
+    policy = WiseAgentHistoryPolicy(max_messages=2)
+    fetching, release = threading.Event(), threading.Event()
+    slow_context = SlowContext("SlowContext", [{"role": "user", "content": "Slow"}], fetching, release)
+    slow_thread = threading.Thread(target=policy.get_history, args=(slow_context,))
+    slow_thread.start()
+    try:
+        assert fetching.wait(5)
+        # the history of another context is returned while the slow context is being fetched
+        assert policy.get_history(SlowContext("FastContext", [{"role": "user", "content": "Fast"}])) == \
+            [{"role": "user", "content": "Fast"}]
+        assert slow_thread.is_alive()
+    finally:
+        release.set()
+        slow_thread.join()
+
+
+def test_history_policy_from_yaml():
+    policy = yaml.load("""
+!wiseagents.WiseAgentHistoryPolicy
+max_messages: 10
+max_tokens: 1000
+tokenizer: tests.wiseagents.test_WiseAgentHistoryPolicy:word_count
+""", Loader=WiseAgentsLoader)
+    assert policy.max_messages == 10
+    assert policy.max_tokens == 1000
+    assert policy.count_tokens({"role": "user", "content": "one two"}) == 6
+    with pytest.raises(ValueError):
+        yaml.load("""
+!wiseagents.WiseAgentHistoryPolicy
+tokenizer: tests.wiseagents.test_WiseAgentHistoryPolicy:missing_function
+""", Loader=WiseAgentsLoader)
@@ -0,0 +1,52 @@
+import pickle
+import time
+
+import pytest
+import yaml
+
+from wiseagents import JSONWiseAgentSerializer, WiseAgentMessage, WiseAgentMessageType
+from tests.wiseagents import assert_standard_variables_set
+
+
+@pytest.fixture(scope="session", autouse=True)
+def run_after_all_tests():
+    assert_standard_variables_set()
+    yield
+
+
+def test_message_has_no_dict():
+    message = WiseAgentMessage(message="Hello", context_name="Greetings", sender="Agent1")
+    assert not hasattr(message, "__dict__")
+    with pytest.raises(AttributeError):
+        message.unknown_field = "value"
+
+
+def test_copy_with():
+    request = WiseAgentMessage(message="Hello", context_name="Greetings", sender="Agent1",
+                               message_type=WiseAgentMessageType.QUERY, route_response_to="Agent0",
+                               message_id="request-1", correlation_id="query-1")
+    response = request.copy_with(message="Hi", sender="Agent2", message_type=WiseAgentMessageType.RESPONSE)
+    assert (response.message, response.sender, response.message_type) == ("Hi", "Agent2", WiseAgentMessageType.RESPONSE)
+    assert (response.context_name, response.route_response_to) == ("Greetings", "Agent0")
+    # the copy is a new message
+    assert (response.message_id, response.correlation_id) == (None, "query-1")
+    assert (request.message, request.sender, request.message_type) == ("Hello", "Agent1", WiseAgentMessageType.QUERY)
+    with pytest.raises(TypeError):
+        request.copy_with(body="Hi")
+
+
+def test_message_deadline():
+    assert not WiseAgentMessage(message="Hello", context_name="Greetings").expired
+    assert not WiseAgentMessage(message="Hello", context_name="Greetings", deadline=time.time() + 60).expired
+    assert WiseAgentMessage(message="Hello", context_name="Greetings", deadline=time.time() - 1).expired
+
+
+def test_message_serialization():
+    message = WiseAgentMessage(message="Hello", context_name="Greetings", sender="Agent1",
+                               message_type=WiseAgentMessageType.ACK, message_id="response-1",
+                               correlation_id="request-1", priority=7, deadline=1700000000.5)
+    for loaded in [pickle.loads(pickle.dumps(message)),
+                   JSONWiseAgentSerializer().loads(JSONWiseAgentSerializer().dumps(message)),
+                   yaml.load(yaml.dump(message), Loader=yaml.Loader)]:
+        assert repr(loaded) == repr(message)
+    assert "_message_type: ACK" in yaml.dump(message)
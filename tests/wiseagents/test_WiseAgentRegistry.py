@@ -1,8 +1,14 @@
+import json
 import logging
+import time
+from time import sleep
 
 import pytest
+from langchain_core.embeddings import Embeddings
 
 from wiseagents import WiseAgent, WiseAgentContext, WiseAgentMessage, WiseAgentMetaData, WiseAgentRegistry, WiseAgentTransport
+from wiseagents import WiseAgentMessageType, WiseAgentRoutingIndex, WiseAgentTool
+from wiseagents.agents import LLMWiseAgentWithTools
 from wiseagents.transports.stomp import StompWiseAgentTransport
 from tests.wiseagents import assert_standard_variables_set
 
@@ -73,4 +79,476 @@ def test_get_or_create_context():
         context = WiseAgentContext(name="Context1")
         assert context == WiseAgentRegistry.get_context(context.name)
     finally:
-        WiseAgentRegistry.remove_context(context.name)  
\ No newline at end of file
+        WiseAgentRegistry.remove_context(context.name)  
+
+def test_remove_context_removes_sub_contexts():
+    context = WiseAgentRegistry.create_context("ParentContext")
+    sub_context = WiseAgentRegistry.create_sub_context(context.name, "SubContext")
+    sub_sub_context = WiseAgentRegistry.create_sub_context(sub_context.name, "SubSubContext")
+    assert WiseAgentRegistry.get_sub_context_names(context.name) == [sub_context.name]
+    assert WiseAgentRegistry.get_context(sub_sub_context.name).parent_name == sub_context.name
+
+    WiseAgentRegistry.remove_context(context.name)
+    for name in [context.name, sub_context.name, sub_sub_context.name]:
+        assert False == WiseAgentRegistry.does_context_exist(name)
+    # e.g. when the context reaper removed it concurrently
+    assert WiseAgentRegistry.remove_context(context.name) is None
+
+
+def test_remove_missing_sub_context():
+    try:
+        context = WiseAgentRegistry.create_context("ParentContext")
+        sub_context = WiseAgentRegistry.create_sub_context(context.name, "SubContext")
+        WiseAgentRegistry.remove_context(sub_context.name)
+        # the parent is only known from the sub context, which was already removed, e.g. by the context reaper
+        assert WiseAgentRegistry.remove_context(sub_context.name, merge_chat_to_parent=True) is None
+        assert WiseAgentRegistry.does_context_exist(context.name)
+        assert WiseAgentRegistry.get_sub_context_names(context.name) == []
+    finally:
+        WiseAgentRegistry.remove_context(context.name)
+
+
+def test_reap_expired_contexts():
+    config = WiseAgentRegistry.get_config()
+    try:
+        config["context_ttl"] = 0.1
+        context = WiseAgentRegistry.create_context("ExpiringContext")
+        sub_context = WiseAgentRegistry.create_sub_context(context.name, "SubContext")
+        sleep(0.2)
+        assert WiseAgentRegistry.reap_expired_contexts() == [context.name]
+        assert False == WiseAgentRegistry.does_context_exist(context.name)
+        assert False == WiseAgentRegistry.does_context_exist(sub_context.name)
+    finally:
+        config.pop("context_ttl")
+        WiseAgentRegistry.stop_context_reaper()
+
+
+def test_registry_cache_sees_changes_from_other_processes():
+    if WiseAgentRegistry.get_config().get("use_redis") != True:
+        pytest.skip("redis is not used")
+    try:
+        agent = TestAgent(name="CachedAgent1", metadata=WiseAgentMetaData(description="This is a test agent"),
+                          transport=DummyTransport())
+        assert WiseAgentRegistry.get_agent_metadata("CachedAgent1") == agent.metadata
+        assert WiseAgentRegistry.get_agent_metadata("CachedAgent2") is None
+
+        # register an agent as another process would do
+        metadata = WiseAgentMetaData(description="This is another test agent")
+        WiseAgentRegistry.redis_db.hset("agents", key="CachedAgent2", value=WiseAgentRegistry.serializer.dumps(metadata))
+        WiseAgentRegistry.redis_db.publish(WiseAgentRegistry.REGISTRY_CHANNEL, "agents")
+        for _ in range(50):
+            if WiseAgentRegistry.get_agent_metadata("CachedAgent2") is not None:
+                break
+            sleep(0.1)
+        assert WiseAgentRegistry.get_agent_metadata("CachedAgent2") == metadata
+        assert "CachedAgent2" in WiseAgentRegistry.fetch_agents_metadata_dict()
+    finally:
+        agent.stop_agent()
+        WiseAgentRegistry.unregister_agent("CachedAgent2")
+    assert WiseAgentRegistry.get_agent_metadata("CachedAgent1") is None
+    assert WiseAgentRegistry.get_agent_metadata("CachedAgent2") is None
+
+
+class KeywordEmbeddings(Embeddings):
+    """Embeddings counting the occurrences of a few keywords, to avoid loading an embedding model."""
+    KEYWORDS = ["weather", "stock", "recipe"]
+
+    def embed_documents(self, texts):
+        return [self.embed_query(text) for text in texts]
+
+    def embed_query(self, text):
+        return [text.lower().count(keyword) + 0.01 for keyword in self.KEYWORDS]
+
+
+def test_routing_index_selects_rows():
+    index = WiseAgentRoutingIndex(embeddings=KeywordEmbeddings())
+    agent_embeddings = dict(zip(["WeatherAgent", "StockAgent", "RecipeAgent"],
+                                index.embed_descriptions(["weather", "stock", "recipe"])))
+    assert index.get_most_relevant_agents("stock recipe", agent_embeddings, 1) == ["StockAgent"]
+    matrix = index._matrix[3]
+    # a selection of the agents reuses the matrix of all of them
+    assert index.get_most_relevant_agents("stock recipe", agent_embeddings, 2,
+                                          ["WeatherAgent", "RecipeAgent", "DeadAgent"]) == ["RecipeAgent",
+                                                                                           "WeatherAgent"]
+    assert index._matrix[3] is matrix
+    assert index.get_most_relevant_agents("stock", agent_embeddings, 2, []) == []
+
+
+def test_get_relevant_agent_names_and_descriptions():
+    WiseAgentRegistry.set_routing_index(WiseAgentRoutingIndex(embeddings=KeywordEmbeddings()))
+    try:
+        agents = [TestAgent(name="WeatherAgent", metadata=WiseAgentMetaData(description="Gives the weather forecast"),
+                            transport=DummyTransport()),
+                  TestAgent(name="StockAgent", metadata=WiseAgentMetaData(description="Gives stock prices"),
+                            transport=DummyTransport()),
+                  TestAgent(name="RecipeAgent", metadata=WiseAgentMetaData(description="Finds a recipe"),
+                            transport=DummyTransport())]
+        assert WiseAgentRegistry.get_relevant_agent_names_and_descriptions("What is the weather in Rome?", 1) == \
+            ["Agent Name: WeatherAgent Agent Description: Gives the weather forecast"]
+        relevant = WiseAgentRegistry.get_relevant_agent_names_and_descriptions("A recipe using stock", 2)
+        assert sorted(relevant) == ["Agent Name: RecipeAgent Agent Description: Finds a recipe",
+                                    "Agent Name: StockAgent Agent Description: Gives stock prices"]
+        assert len(WiseAgentRegistry.get_relevant_agent_names_and_descriptions("Anything", 10)) == 3
+    finally:
+        for agent in agents:
+            agent.stop_agent()
+        WiseAgentRegistry.set_routing_index(None)
+
+
+def test_agent_heartbeats(monkeypatch):
+    monkeypatch.setitem(WiseAgentRegistry.get_config(), "agent_heartbeat_ttl", 1)
+    monkeypatch.setitem(WiseAgentRegistry.get_config(), "agent_heartbeat_interval", 0.2)
+    try:
+        alive_agent = TestAgent(name="AliveAgent", metadata=WiseAgentMetaData(description="This is a test agent"),
+                                transport=DummyTransport())
+        WiseAgentRegistry.register_agent("DeadAgent", WiseAgentMetaData(description="This agent dies"))
+        # simulate the death of the process of DeadAgent, which no longer renews its heartbeat
+        WiseAgentRegistry._local_agents.pop("DeadAgent")
+        assert "DeadAgent" in WiseAgentRegistry.fetch_agents_metadata_dict()
+        sleep(1.5)
+        assert "AliveAgent" in WiseAgentRegistry.fetch_agents_metadata_dict()
+        assert "DeadAgent" not in WiseAgentRegistry.fetch_agents_metadata_dict()
+        assert not any("DeadAgent" in agent for agent in WiseAgentRegistry.get_agent_names_and_descriptions())
+        # the heartbeat thread also sweeps the dead agents
+        assert WiseAgentRegistry.get_agent_metadata("DeadAgent") is None
+
+        # an agent whose heartbeat expired can be replaced
+        WiseAgentRegistry.register_agent("DeadAgent", WiseAgentMetaData(description="This agent restarted"))
+        WiseAgentRegistry._local_agents.pop("DeadAgent")
+        sleep(1.5)
+        WiseAgentRegistry.register_agent("DeadAgent", WiseAgentMetaData(description="This agent restarted again"))
+        assert WiseAgentRegistry.get_agent_metadata("DeadAgent").description == "This agent restarted again"
+        with pytest.raises(NameError):
+            WiseAgentRegistry.register_agent("DeadAgent", WiseAgentMetaData(description="A duplicate agent"))
+    finally:
+        WiseAgentRegistry.stop_agent_heartbeat()
+        alive_agent.stop_agent()
+        WiseAgentRegistry.unregister_agent("DeadAgent")
+
+
+def test_dead_agent_instances_swept(monkeypatch):
+    monkeypatch.setitem(WiseAgentRegistry.get_config(), "agent_heartbeat_ttl", 1)
+    monkeypatch.setitem(WiseAgentRegistry.get_config(), "agent_heartbeat_interval", 0.2)
+    metadata = WiseAgentMetaData(description="A replicated agent", replicated=True)
+    try:
+        WiseAgentRegistry.register_agents([("ReplicatedAgent", metadata, "instance1"),
+                                           ("ReplicatedAgent", metadata, "instance2")])
+        # simulate the death of the process of instance2, which no longer renews its heartbeat
+        WiseAgentRegistry._local_agent_instances["ReplicatedAgent"].discard("instance2")
+        sleep(1.5)
+        # the agent is alive as long as instance1 renews its heartbeat, but instance2 is removed
+        assert WiseAgentRegistry.get_agent_metadata("ReplicatedAgent") is not None
+        assert WiseAgentRegistry.get_agent_instances("ReplicatedAgent") == {"instance1": 0}
+    finally:
+        WiseAgentRegistry.stop_agent_heartbeat()
+        WiseAgentRegistry.unregister_agent("ReplicatedAgent")
+
+
+def test_dead_agent_names_cached(monkeypatch):
+    if not WiseAgentRegistry.get_config().get("use_redis"):
+        pytest.skip("the dead agents are read from the in-memory registry")
+    monkeypatch.setitem(WiseAgentRegistry.get_config(), "agent_heartbeat_ttl", 30)
+    reads = []
+    zrangebyscore = WiseAgentRegistry.redis_db.zrangebyscore
+    monkeypatch.setattr(WiseAgentRegistry.redis_db, "zrangebyscore",
+                        lambda *args, **kwargs: reads.append(args) or zrangebyscore(*args, **kwargs))
+    WiseAgentRegistry._dead_agent_names = None
+    try:
+        WiseAgentRegistry.register_agent("CachedAgent", WiseAgentMetaData(description="An agent"))
+        for _ in range(5):
+            assert "CachedAgent" in WiseAgentRegistry.fetch_agents_metadata_dict()
+        # read once per agent_heartbeat_interval rather than once per fetch
+        assert len(reads) == 1
+        WiseAgentRegistry.sweep_dead_agents()
+        WiseAgentRegistry.fetch_agents_metadata_dict()
+        assert len(reads) == 1
+    finally:
+        WiseAgentRegistry.stop_agent_heartbeat()
+        WiseAgentRegistry.unregister_agent("CachedAgent")
+        WiseAgentRegistry._dead_agent_names = None
+
+
+class RecordingTransport(DummyTransport):
+    def __init__(self):
+        self.responses = []
+
+    def send_response(self, message: WiseAgentMessage, dest_agent_name: str, dest_instance_id=None):
+        self.responses.append((message, dest_agent_name, dest_instance_id))
+
+
+class ReplicaAgent(TestAgent):
+    def process_request(self, request, conversation_history):
+        return f"Load: {WiseAgentRegistry.get_agent_instances(self.name)[self.instance_id]}"
+
+
+def test_replicated_agents():
+    metadata = WiseAgentMetaData(description="This is a replicated agent", replicated=True)
+    replicas = []
+    try:
+        replicas = [ReplicaAgent(name="ReplicatedAgent", metadata=metadata, transport=RecordingTransport()),
+                    ReplicaAgent(name="ReplicatedAgent", metadata=metadata, transport=RecordingTransport())]
+        assert replicas[0].instance_id != replicas[1].instance_id
+        assert WiseAgentRegistry.get_agent_instances("ReplicatedAgent") == {replicas[0].instance_id: 0,
+                                                                            replicas[1].instance_id: 0}
+        assert WiseAgentRegistry.get_agent_metadata("ReplicatedAgent").replicated
+        with pytest.raises(NameError):
+            WiseAgentRegistry.register_agent("ReplicatedAgent", WiseAgentMetaData(description="Not replicated"))
+
+        # the response is routed to the instance of the requester which sent the request
+        context = WiseAgentRegistry.create_context("ReplicatedAgentContext")
+        replicas[0].transport.request_receiver(WiseAgentMessage(message="Hello", sender="Requester",
+                                                                context_name=context.name,
+                                                                sender_instance_id="requester-1"))
+        response, dest_agent_name, dest_instance_id = replicas[0].transport.responses[0]
+        assert (response.message, dest_agent_name, dest_instance_id) == ("Load: 1", "Requester", "requester-1")
+        assert response.sender_instance_id == replicas[0].instance_id
+        assert WiseAgentRegistry.get_agent_instances("ReplicatedAgent")[replicas[0].instance_id] == 0
+
+        # the agent is unregistered with its last instance
+        replicas.pop(0).stop_agent()
+        assert WiseAgentRegistry.get_agent_metadata("ReplicatedAgent") is not None
+        assert list(WiseAgentRegistry.get_agent_instances("ReplicatedAgent")) == [replicas[0].instance_id]
+        replicas.pop(0).stop_agent()
+        assert WiseAgentRegistry.get_agent_metadata("ReplicatedAgent") is None
+        assert WiseAgentRegistry.get_agent_instances("ReplicatedAgent") == {}
+    finally:
+        for agent in replicas:
+            agent.stop_agent()
+        if WiseAgentRegistry.does_context_exist("ReplicatedAgentContext"):
+            WiseAgentRegistry.remove_context("ReplicatedAgentContext")
+
+
+class CountingAgent(TestAgent):
+    def process_request(self, request, conversation_history):
+        self.processed = getattr(self, "processed", 0) + 1
+        if request.message == "Fail once" and not getattr(self, "failed", False):
+            self.failed = True
+            raise RuntimeError("Failure")
+        return f"Processed {self.processed}"
+
+
+def test_request_dedup():
+    agent = CountingAgent(name="DedupAgent", metadata=WiseAgentMetaData(description="This is a test agent"),
+                          transport=RecordingTransport())
+    agent.dedup_window = 60
+    try:
+        context = WiseAgentRegistry.create_context("DedupContext")
+        request = WiseAgentMessage(message="Hello", sender="Requester", context_name=context.name,
+                                   message_id="request-1")
+        agent.transport.request_receiver(request)
+        # the duplicate is not processed again, the response is sent again instead
+        agent.transport.request_receiver(WiseAgentMessage.from_dict(request.to_dict()))
+        assert agent.processed == 1
+        first, second = [response for response, _, _ in agent.transport.responses]
+        assert first.message == second.message == "Processed 1"
+        assert first.message_id == second.message_id
+        assert first.correlation_id == "request-1"
+
+        # a request whose processing failed can be processed again
+        failing = WiseAgentMessage(message="Fail once", sender="Requester", context_name=context.name,
+                                   message_id="request-2")
+        with pytest.raises(RuntimeError):
+            agent.transport.request_receiver(failing)
+        agent.transport.request_receiver(failing)
+        assert agent.processed == 3
+        assert agent.transport.responses[-1][0].message == "Processed 3"
+
+        # requests without id are always processed
+        agent.transport.request_receiver(WiseAgentMessage(message="Hello", sender="Requester",
+                                                          context_name=context.name))
+        agent.transport.request_receiver(WiseAgentMessage(message="Hello", sender="Requester",
+                                                          context_name=context.name))
+        assert agent.processed == 5
+    finally:
+        agent.stop_agent()
+        if WiseAgentRegistry.does_context_exist("DedupContext"):
+            WiseAgentRegistry.remove_context("DedupContext")
+
+
+class CoordinatingTransport(RecordingTransport):
+    def __init__(self):
+        super().__init__()
+        self.requests = []
+
+    def send_request(self, message: WiseAgentMessage, dest_agent_name: str):
+        self.requests.append((message, dest_agent_name))
+
+
+class CoordinatingAgent(TestAgent):
+    def handle_request(self, request):
+        context = WiseAgentRegistry.get_context(request.context_name)
+        context.set_route_response_to(request.sender)
+        context.set_route_response_correlation_id(request.message_id)
+        self.send_request(WiseAgentMessage(message=request.message, context_name=request.context_name), "Worker")
+        return True
+
+    def process_response(self, response):
+        context = WiseAgentRegistry.get_context(response.context_name)
+        self.send_response(WiseAgentMessage(message=f"Final {response.message}", context_name=response.context_name,
+                                            correlation_id=context.get_route_response_correlation_id()),
+                           context.get_route_response_to())
+        return True
+
+
+def test_request_dedup_replays_final_response():
+    agent = CoordinatingAgent(name="DedupCoordinator", metadata=WiseAgentMetaData(description="A coordinator"),
+                              transport=CoordinatingTransport())
+    agent.dedup_window = 60
+    try:
+        context = WiseAgentRegistry.create_context("DedupContext")
+        request = WiseAgentMessage(message="Hello", sender="Requester", context_name=context.name,
+                                   message_id="request-1")
+        agent.transport.request_receiver(request)
+        # the sub-request is not sent again for a duplicate, whose response is not ready yet
+        agent.transport.request_receiver(WiseAgentMessage.from_dict(request.to_dict()))
+        assert len(agent.transport.requests) == 1
+        assert agent.transport.responses == []
+
+        agent.transport.response_receiver(WiseAgentMessage(message="answer", sender="Worker",
+                                                           context_name=context.name))
+        # the final response, sent once the collaboration completed, is replayed for a duplicate
+        agent.transport.request_receiver(WiseAgentMessage.from_dict(request.to_dict()))
+        assert len(agent.transport.requests) == 1
+        first, second = [response for response, _, _ in agent.transport.responses]
+        assert first.message == second.message == "Final answer"
+        assert first.message_id == second.message_id
+        assert first.correlation_id == "request-1"
+    finally:
+        agent.stop_agent()
+        if WiseAgentRegistry.does_context_exist("DedupContext"):
+            WiseAgentRegistry.remove_context("DedupContext")
+
+
+def test_expired_requests():
+    agent = CountingAgent(name="DeadlineAgent", metadata=WiseAgentMetaData(description="This is a test agent"),
+                          transport=RecordingTransport())
+    try:
+        context = WiseAgentRegistry.create_context("DeadlineContext")
+        # an expired request is reported to its sender without being processed
+        agent.transport.request_receiver(WiseAgentMessage(message="Hello", sender="Requester",
+                                                          context_name=context.name, message_id="request-1",
+                                                          deadline=time.time() - 1))
+        assert getattr(agent, "processed", 0) == 0
+        report = agent.transport.responses[0][0]
+        assert report.message_type == WiseAgentMessageType.CANNOT_ANSWER
+        assert report.correlation_id == "request-1"
+
+        # the response inherits the priority and the deadline of the request
+        deadline = time.time() + 60
+        agent.transport.request_receiver(WiseAgentMessage(message="Hello", sender="Requester",
+                                                          context_name=context.name, message_id="request-2",
+                                                          priority=9, deadline=deadline))
+        assert agent.processed == 1
+        response = agent.transport.responses[1][0]
+        assert (response.message, response.priority, response.deadline) == ("Processed 1", 9, deadline)
+    finally:
+        agent.stop_agent()
+        if WiseAgentRegistry.does_context_exist("DeadlineContext"):
+            WiseAgentRegistry.remove_context("DeadlineContext")
+
+
+def test_claim_check():
+    transport = RecordingTransport()
+    transport._claim_check_threshold = 1024
+    agent = TestAgent(name="ClaimCheckAgent", metadata=WiseAgentMetaData(description="This is a test agent"),
+                      transport=transport)
+    try:
+        context = WiseAgentRegistry.create_context("ClaimCheckContext")
+        context._trace_enabled = True
+        contents = "A large response. " * 100
+        agent.send_response(WiseAgentMessage(message=contents, context_name=context.name), "Requester")
+        response = transport.responses[0][0]
+        assert response.message_ref is not None
+        assert response.message == contents
+        # the trace only keeps the reference of the contents
+        assert response.message_ref in str(context.message_trace[0])
+        assert contents not in str(context.message_trace[0])
+        received = WiseAgentMessage.from_dict(response.to_dict())
+        assert received.message == contents
+    finally:
+        agent.stop_agent()
+        if WiseAgentRegistry.does_context_exist("ClaimCheckContext"):
+            WiseAgentRegistry.remove_context("ClaimCheckContext")
+
+
+def test_bulk_registration():
+    agents = []
+    try:
+        with WiseAgentRegistry.bulk_registration():
+            for i in range(3):
+                agents.append(TestAgent(name=f"BulkAgent{i}", metadata=WiseAgentMetaData(description=f"Bulk agent {i}"),
+                                        transport=DummyTransport()))
+            tool = WiseAgentTool(name="BulkTool", description="A bulk registered tool", agent_tool=False)
+            # the agents and tools are registered when the block exits
+            assert WiseAgentRegistry.get_agent_metadata("BulkAgent0") is None
+        for agent in agents:
+            assert agent.metadata == WiseAgentRegistry.get_agent_metadata(agent.name)
+        assert WiseAgentRegistry.get_tool("BulkTool").description == tool.description
+
+        # all the conflicting names are reported, and nothing is registered
+        with pytest.raises(NameError, match="BulkAgent0, BulkAgent2"):
+            WiseAgentRegistry.register_agents([("BulkAgent0", WiseAgentMetaData(description="Duplicate"), None),
+                                               ("BulkAgent3", WiseAgentMetaData(description="New"), None),
+                                               ("BulkAgent2", WiseAgentMetaData(description="Duplicate"), None)])
+        assert WiseAgentRegistry.get_agent_metadata("BulkAgent3") is None
+        assert WiseAgentRegistry.get_agent_metadata("BulkAgent0").description == "Bulk agent 0"
+        with pytest.raises(NameError):
+            WiseAgentRegistry.register_agents([("BulkAgent3", WiseAgentMetaData(description="New"), None),
+                                               ("BulkAgent3", WiseAgentMetaData(description="Duplicate"), None)])
+        assert WiseAgentRegistry.get_agent_metadata("BulkAgent3") is None
+    finally:
+        for agent in agents:
+            agent.stop_agent()
+
+
+def echo_arguments(**kwargs) -> str:
+    return json.dumps(kwargs)
+
+
+def test_tool_schemas():
+    tool = WiseAgentTool(name="SchemaTool", description="A tool returning its arguments", agent_tool=False,
+                         parameters_json_schema={"type": "object"}, call_back=echo_arguments)
+    schema = WiseAgentRegistry.get_tool_schemas()["SchemaTool"]
+    assert schema["tool_param"] == {"type": "function", "function": {"name": "SchemaTool",
+                                                                     "description": "A tool returning its arguments",
+                                                                     "parameters": {"type": "object"}}}
+    assert schema["call_back"] == "tests.wiseagents.test_WiseAgentRegistry:echo_arguments"
+    assert schema["hash"] == tool.hash
+    if WiseAgentRegistry.get_config().get("use_redis"):
+        # another process resolves the callback from its import path
+        WiseAgentRegistry._local_tools.pop("SchemaTool")
+        remote_tool = WiseAgentRegistry.get_tool("SchemaTool")
+        assert remote_tool is not tool
+        assert remote_tool.exec(city="Rome") == '{"city": "Rome"}'
+
+    agent = LLMWiseAgentWithTools(name="ToolsAgent", metadata=WiseAgentMetaData(description="An agent with tools"),
+                                  llm=None, transport=DummyTransport(), tools=["SchemaTool"])
+    try:
+        tools = agent.get_tools_OpenAI_format()
+        assert tools == [schema["tool_param"]]
+        assert agent.get_tools_OpenAI_format() is tools
+        WiseAgentTool(name="SchemaTool", description="A tool returning its arguments as JSON", agent_tool=False,
+                      parameters_json_schema={"type": "object"},
+                      call_back="tests.wiseagents.test_WiseAgentRegistry:echo_arguments")
+        assert agent.get_tools_OpenAI_format()[0]["function"]["description"] == "A tool returning its arguments as JSON"
+        assert WiseAgentRegistry.get_tool("SchemaTool").exec(city="Rome") == '{"city": "Rome"}'
+    finally:
+        agent.stop_agent()
+
+
+def test_tool_with_local_call_back(caplog):
+    tool = WiseAgentTool(name="LocalTool", description="A tool with a lambda callback", agent_tool=False,
+                         parameters_json_schema={"type": "object"}, call_back=lambda **kwargs: "local")
+    assert tool.has_local_call_back
+    assert tool.schema["call_back"] is None and tool.schema["local_call_back"]
+    assert tool.exec() == "local"
+    if WiseAgentRegistry.get_config().get("use_redis"):
+        assert "LocalTool can't be imported" in caplog.text
+        # another process can't execute the callback, rather than returning the arguments
+        WiseAgentRegistry._local_tools.pop("LocalTool")
+        with pytest.raises(ValueError):
+            WiseAgentRegistry.get_tool("LocalTool").exec(city="Rome")
+    tool = WiseAgentTool(name="LocalTool", description="A tool without callback", agent_tool=False,
+                         parameters_json_schema={"type": "object"})
+    assert not tool.has_local_call_back
+    assert WiseAgentTool.from_schema(tool.schema).exec(city="Rome") == '{"city": "Rome"}'
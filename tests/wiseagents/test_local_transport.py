@@ -0,0 +1,148 @@
+import threading
+import time
+from typing import List, Optional
+
+import pytest
+import yaml
+from openai.types.chat import ChatCompletionMessageParam
+
+from wiseagents import WiseAgent, WiseAgentMessage, WiseAgentMetaData, WiseAgentRegistry
+from wiseagents.transports import LocalWiseAgentTransport
+from wiseagents.yaml import WiseAgentsLoader
+from tests.wiseagents import assert_standard_variables_set
+
+
+@pytest.fixture(scope="session", autouse=True)
+def run_after_all_tests():
+    assert_standard_variables_set()
+    yield
+
+
+class EchoAgent(WiseAgent):
+    def __init__(self, name, metadata, transport, **kwargs):
+        self.threads = set()
+        super().__init__(name, metadata, transport, **kwargs)
+
+    def process_request(self, request: WiseAgentMessage,
+                        conversation_history: List[ChatCompletionMessageParam]) -> Optional[str]:
+        self.threads.add(threading.current_thread().name)
+        return f"Echo: {request.message}"
+
+    def process_response(self, message: WiseAgentMessage) -> bool:
+        return True
+
+    def process_event(self, event) -> bool:
+        return True
+
+    def process_error(self, error) -> bool:
+        return True
+
+
+class ClientAgent(EchoAgent):
+    def __init__(self, name, metadata, transport):
+        self.responses = []
+        self.received = threading.Semaphore(0)
+        super().__init__(name, metadata, transport)
+
+    def process_response(self, message: WiseAgentMessage) -> bool:
+        self.responses.append(message)
+        self.received.release()
+        return True
+
+    def wait_responses(self, count: int):
+        for _ in range(count):
+            assert self.received.acquire(timeout=5)
+
+
+@pytest.fixture
+def context():
+    context = WiseAgentRegistry.create_context("LocalTransportContext")
+    yield context
+    WiseAgentRegistry.remove_context("LocalTransportContext")
+
+
+def test_request_response(context):
+    client = ClientAgent(name="LocalClient", metadata=WiseAgentMetaData(description="A client"),
+                         transport=LocalWiseAgentTransport(agent_name="LocalClient"))
+    echo = EchoAgent(name="LocalEcho", metadata=WiseAgentMetaData(description="An echo agent"),
+                     transport=LocalWiseAgentTransport(agent_name="LocalEcho"))
+    try:
+        request = WiseAgentMessage(message="Hello", context_name=context.name)
+        client.send_request(request, "LocalEcho")
+        client.wait_responses(1)
+        response = client.responses[0]
+        assert (response.message, response.sender, response.correlation_id) == \
+            ("Echo: Hello", "LocalEcho", request.message_id)
+        # the requests are processed by the dispatcher thread of the agent
+        assert echo.threads == {"LocalWiseAgentTransport-/queue/request/LocalEcho"}
+    finally:
+        client.stop_agent()
+        echo.stop_agent()
+
+
+def test_priority_and_deadline(context):
+    client = ClientAgent(name="LocalPriorityClient", metadata=WiseAgentMetaData(description="A client"),
+                         transport=LocalWiseAgentTransport(agent_name="LocalPriorityClient"))
+    try:
+        # queued before the echo agent starts consuming its queue
+        for message, priority, deadline in [("Low", 1, None), ("Expired", 9, time.time() - 1), ("High", 9, None),
+                                            ("Default", None, None)]:
+            client.send_request(WiseAgentMessage(message=message, context_name=context.name, priority=priority,
+                                                 deadline=deadline), "LocalPriorityEcho")
+        echo = EchoAgent(name="LocalPriorityEcho", metadata=WiseAgentMetaData(description="An echo agent"),
+                         transport=LocalWiseAgentTransport(agent_name="LocalPriorityEcho"))
+        client.wait_responses(3)
+        assert [response.message for response in client.responses] == ["Echo: High", "Echo: Default", "Echo: Low"]
+        echo.stop_agent()
+    finally:
+        client.stop_agent()
+
+
+def test_receivers_get_a_copy(context):
+    client = ClientAgent(name="LocalCopyClient", metadata=WiseAgentMetaData(description="A client"),
+                         transport=LocalWiseAgentTransport(agent_name="LocalCopyClient"))
+    try:
+        message = WiseAgentMessage(message="Hello", context_name=context.name)
+        client.transport.send_response(message, "LocalCopyClient")
+        client.wait_responses(1)
+        assert client.responses[0] is not message
+        assert repr(client.responses[0]) == repr(message)
+    finally:
+        client.stop_agent()
+
+
+class BarrierAgent(EchoAgent):
+    def __init__(self, name, metadata, transport, max_concurrency):
+        self.barrier = threading.Barrier(max_concurrency, timeout=5)
+        super().__init__(name, metadata, transport, max_concurrency=max_concurrency)
+
+    def process_request(self, request: WiseAgentMessage,
+                        conversation_history: List[ChatCompletionMessageParam]) -> Optional[str]:
+        # only passes when max_concurrency requests are processed at the same time
+        self.barrier.wait()
+        return super().process_request(request, conversation_history)
+
+
+def test_max_concurrency(context):
+    client = ClientAgent(name="LocalConcurrentClient", metadata=WiseAgentMetaData(description="A client"),
+                         transport=LocalWiseAgentTransport(agent_name="LocalConcurrentClient"))
+    echo = BarrierAgent(name="LocalConcurrentEcho", metadata=WiseAgentMetaData(description="An echo agent"),
+                        transport=LocalWiseAgentTransport(agent_name="LocalConcurrentEcho"), max_concurrency=3)
+    try:
+        for i in range(6):
+            client.send_request(WiseAgentMessage(message=f"Hello {i}", context_name=context.name),
+                                "LocalConcurrentEcho")
+        client.wait_responses(6)
+        assert sorted(response.message for response in client.responses) == [f"Echo: Hello {i}" for i in range(6)]
+        assert len(echo.threads) == 3
+    finally:
+        client.stop_agent()
+        echo.stop_agent()
+
+
+def test_yaml():
+    transport = yaml.load("""
+!wiseagents.transports.LocalWiseAgentTransport
+agent_name: Agent1
+""", Loader=WiseAgentsLoader)
+    assert transport.request_queue == "/queue/request/Agent1"
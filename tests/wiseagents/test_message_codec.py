@@ -0,0 +1,218 @@
+import hashlib
+import os
+import threading
+import time
+
+import pytest
+import yaml
+
+from wiseagents import (JSONWiseAgentMessageCodec, WiseAgentMessage, WiseAgentMessageType, WiseAgentRegistry,
+                        YAMLWiseAgentMessageCodec)
+from wiseagents.wise_agent_blob_store import LocalWiseAgentBlobStore, get_blob
+from wiseagents.wise_agent_messaging import decode_message, get_message_codec
+from wiseagents.transports.stomp import StompWiseAgentTransport
+from wiseagents.yaml import WiseAgentsLoader
+from tests.wiseagents import assert_standard_variables_set
+
+
+@pytest.fixture(scope="session", autouse=True)
+def run_after_all_tests():
+    assert_standard_variables_set()
+    yield
+
+
+def assert_same_message(message: WiseAgentMessage, expected: WiseAgentMessage):
+    assert repr(message) == repr(expected)
+    assert message.message_type is expected.message_type
+
+
+@pytest.mark.parametrize("codec_name", ["json", "yaml", "msgpack"])
+def test_codec_round_trip(codec_name):
+    if codec_name == "msgpack":
+        pytest.importorskip("msgpack")
+    codec = get_message_codec(codec_name)
+    message = WiseAgentMessage(message="What is the weather in Rome? ☀", context_name="Weather", sender="Agent1",
+                               message_type=WiseAgentMessageType.QUERY, tool_id="call_1",
+                               route_response_to="Agent2", sender_instance_id="instance-1")
+    assert_same_message(decode_message(codec.encode(message), codec.content_type), message)
+    minimal = WiseAgentMessage(message="Hello", context_name="Greetings")
+    assert_same_message(decode_message(codec.encode(minimal), codec.content_type), minimal)
+
+
+def test_json_codec_is_compact():
+    message = WiseAgentMessage(message="Hello", context_name="Greetings", sender="Agent1")
+    assert JSONWiseAgentMessageCodec().encode(message) == \
+        b'{"message":"Hello","context_name":"Greetings","sender":"Agent1"}'
+
+
+def test_decode_messages_of_previous_versions():
+    # the previous versions sent the messages as YAML, without content type
+    message = WiseAgentMessage(message="Hello", context_name="Greetings", sender="Agent1",
+                               message_type=WiseAgentMessageType.ACK)
+    assert_same_message(decode_message(yaml.dump(message).encode("utf-8")), message)
+
+
+def test_yaml_codec_is_safe():
+    with pytest.raises(yaml.YAMLError):
+        YAMLWiseAgentMessageCodec().decode(b"!!python/object/apply:os.system ['echo unsafe']")
+
+
+def test_unknown_codec():
+    with pytest.raises(ValueError):
+        get_message_codec("xml")
+    with pytest.raises(ValueError):
+        decode_message(b"<message/>", "application/xml")
+
+
+def test_transport_codec():
+    assert isinstance(StompWiseAgentTransport(host="localhost", port=61616, agent_name="Agent1").codec,
+                      JSONWiseAgentMessageCodec)
+    assert isinstance(StompWiseAgentTransport(host="localhost", port=61616, agent_name="Agent1", codec="yaml").codec,
+                      YAMLWiseAgentMessageCodec)
+    transport = yaml.load("""
+!wiseagents.transports.StompWiseAgentTransport
+host: localhost
+port: 61616
+agent_name: Agent1
+codec: yaml
+""", Loader=WiseAgentsLoader)
+    assert isinstance(transport.codec, YAMLWiseAgentMessageCodec)
+
+
+def test_transport_compression():
+    transport = StompWiseAgentTransport(host="localhost", port=61616, agent_name="Agent1", compression_threshold=1024)
+    short = WiseAgentMessage(message="Hello", context_name="Greetings")
+    data, headers = transport.encode_message(short)
+    assert headers == {"content-type": "application/json"}
+    assert_same_message(decode_message(data, headers["content-type"]), short)
+    long = WiseAgentMessage(message="Hello " * 1000, context_name="Greetings")
+    data, headers = transport.encode_message(long)
+    assert headers["content-encoding"] == "deflate"
+    assert len(data) < 1024
+    assert_same_message(decode_message(data, headers["content-type"], headers["content-encoding"]), long)
+    with pytest.raises(ValueError):
+        decode_message(data, headers["content-type"], "br")
+
+
+def test_transport_claim_check(tmp_path, monkeypatch):
+    monkeypatch.setitem(WiseAgentRegistry.get_config(), "message_blob_directory", str(tmp_path))
+    transport = StompWiseAgentTransport(host="localhost", port=61616, agent_name="Agent1",
+                                        claim_check_threshold=1024, blob_store="file")
+    short = WiseAgentMessage(message="Hello", context_name="Greetings")
+    assert transport.claim_check(short) is short
+    contents = "Hello ☀ " * 1000
+    long = WiseAgentMessage(message=contents, context_name="Greetings", sender="Agent1")
+    offloaded = transport.claim_check(long)
+    assert offloaded.message_ref == "file:" + hashlib.sha256(contents.encode("utf-8")).hexdigest()
+    assert long.message_ref is None
+    # the contents are stored once, whatever the number of messages sent with them
+    assert transport.claim_check(long).message_ref == offloaded.message_ref
+    assert len(list(tmp_path.iterdir())) == 1
+
+    data, headers = transport.encode_message(long)
+    assert len(data) < 1024
+    received = decode_message(data, headers["content-type"])
+    assert received.message_ref == offloaded.message_ref
+    assert received._message is None
+    assert received.message == contents
+    # forwarding the message only sends the reference again
+    assert len(transport.encode_message(received)[0]) < 1024
+    assert received.copy_with(message="Bye").message_ref is None
+
+    blob = next(tmp_path.iterdir())
+    blob.unlink()
+    with pytest.raises(ValueError):
+        decode_message(data, headers["content-type"]).message
+
+
+def test_transport_delivery_headers():
+    transport = StompWiseAgentTransport(host="localhost", port=61616, agent_name="Agent1")
+    assert transport._delivery_headers(WiseAgentMessage(message="Hello", context_name="Greetings")) == {}
+    message = WiseAgentMessage(message="Hello", context_name="Greetings", priority=9, deadline=1700000000.5)
+    assert transport._delivery_headers(message) == {"priority": "9", "expires": "1700000000500"}
+    assert_same_message(WiseAgentMessage.from_dict(message.to_dict()), message)
+
+
+class AckRecordingConnection:
+    def __init__(self):
+        self.acks = []
+        self.nacks = []
+
+    def ack(self, id, subscription):
+        self.acks.append((id, subscription))
+
+    def nack(self, id, subscription):
+        self.nacks.append((id, subscription))
+
+
+def test_transport_concurrent_requests():
+    transport = StompWiseAgentTransport(host="localhost", port=61616, agent_name="Agent1")
+    transport.max_concurrency = 2
+    transport.request_conn = AckRecordingConnection()
+    barrier = threading.Barrier(2, timeout=5)
+    handled = []
+
+    def receive_request(message: WiseAgentMessage):
+        # only passes when the two requests are handled at the same time
+        barrier.wait()
+        handled.append(message.message)
+        if message.message == "Fail":
+            raise ValueError("Failed")
+
+    transport.set_call_backs(receive_request, None, None, None)
+    transport._start_request_executor()
+    transport.dispatch_request(WiseAgentMessage(message="Hello", context_name="Greetings"),
+                               {"message-id": "1", "subscription": "42"})
+    transport.dispatch_request(WiseAgentMessage(message="Fail", context_name="Greetings"),
+                               {"message-id": "2", "ack": "ack-2", "subscription": "42"})
+    transport._request_executor.shutdown(wait=True)
+    assert sorted(handled) == ["Fail", "Hello"]
+    # acknowledged once handled, or rejected when handling them failed so that they are delivered again
+    assert transport.request_conn.acks == [("1", "42")]
+    assert transport.request_conn.nacks == [("ack-2", "42")]
+
+
+def test_transport_request_subscription():
+    transport = StompWiseAgentTransport(host="localhost", port=61616, agent_name="Agent1")
+    assert transport._request_subscription() == ("auto", {})
+    transport.max_concurrency = 4
+    transport._start_request_executor()
+    assert transport._request_subscription() == ("client-individual", {"activemq.prefetchSize": "4",
+                                                                       "prefetch-count": "4"})
+    transport._request_executor.shutdown()
+    transport = StompWiseAgentTransport(host="localhost", port=61616, agent_name="Agent1",
+                                        consumer_window_size=65536)
+    transport.max_concurrency = 4
+    transport._start_request_executor()
+    assert transport._request_subscription()[1]["consumer-window-size"] == "65536"
+    transport._request_executor.shutdown()
+
+
+def test_local_blob_store(tmp_path):
+    store = LocalWiseAgentBlobStore(str(tmp_path), ttl=60)
+    reference = store.put(b"Hello")
+    assert store.put(b"Hello") == reference
+    assert store.get(reference) == b"Hello"
+    # only the keys of the blobs of the store are resolved
+    (tmp_path / "secret").write_bytes(b"Secret")
+    for invalid in ["file:/etc/passwd", "file:" + str(tmp_path / "secret"), "file:../secret", "redis:" + reference[5:],
+                    "file:" + reference[5:].upper()]:
+        with pytest.raises(ValueError):
+            store.get(invalid)
+    with pytest.raises(ValueError):
+        get_blob("file:/etc/passwd")
+
+
+def test_local_blob_store_expiration(tmp_path):
+    store = LocalWiseAgentBlobStore(str(tmp_path), ttl=60)
+    expired, kept = store.put(b"Expired"), store.put(b"Kept")
+    old = time.time() - 120
+    os.utime(tmp_path / expired[5:], (old, old))
+    with pytest.raises(ValueError):
+        store.get(expired)
+    store.cleanup()
+    assert [path.name for path in tmp_path.iterdir()] == [kept[5:]]
+    # putting the same data again refreshes its expiration
+    os.utime(tmp_path / kept[5:], (old, old))
+    assert store.put(b"Kept") == kept
+    assert store.get(kept) == b"Kept"
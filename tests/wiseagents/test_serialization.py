@@ -0,0 +1,112 @@
+import base64
+import json
+import pickle
+import sys
+
+import pytest
+from openai.types import CompletionUsage
+from openai.types.chat import ChatCompletionMessage
+
+from wiseagents import WiseAgentMetaData, WiseAgentTool
+from wiseagents.wise_agent_serialization import JSONWiseAgentSerializer, PickleWiseAgentSerializer, create_serializer
+from tests.wiseagents import assert_standard_variables_set
+
+
+@pytest.fixture(scope="session", autouse=True)
+def run_after_all_tests():
+    assert_standard_variables_set()
+    yield
+
+
+def test_json_serializer_round_trip():
+    serializer = JSONWiseAgentSerializer()
+    history = [{"role": "system", "content": "You are a test"}, {"role": "user", "content": "Hello"}]
+    data = serializer.dumps(history)
+    assert data[:4] == b"WA\x01\x00"
+    assert serializer.loads(data) == history
+    assert serializer.loads(serializer.dumps("query")) == "query"
+
+
+def test_json_serializer_compression():
+    serializer = JSONWiseAgentSerializer(compression_threshold=100)
+    value = {"role": "assistant", "content": "a long answer " * 100}
+    data = serializer.dumps(value)
+    assert data[3] & JSONWiseAgentSerializer.FLAG_COMPRESSED
+    assert len(data) < len(json.dumps(value))
+    assert serializer.loads(data) == value
+    assert not JSONWiseAgentSerializer(compression_threshold=None).dumps(value)[3]
+
+
+def test_json_serializer_objects():
+    serializer = JSONWiseAgentSerializer()
+    message = ChatCompletionMessage(role="assistant", content="Hi")
+    loaded_message = serializer.loads(serializer.dumps(message))
+    assert isinstance(loaded_message, ChatCompletionMessage) and loaded_message == message
+    # the pydantic models which are not registered are loaded as dicts
+    assert serializer.loads(serializer.dumps(CompletionUsage(prompt_tokens=1, completion_tokens=2, total_tokens=3))) == \
+        {"prompt_tokens": 1, "completion_tokens": 2, "total_tokens": 3}
+
+    values = [("user", "Hello"), {"Agent1", "Agent2"}, frozenset(["Agent3"])]
+    loaded_values = serializer.loads(serializer.dumps(values))
+    assert loaded_values == values
+    assert [type(value) for value in loaded_values] == [tuple, set, frozenset]
+
+    metadata = WiseAgentMetaData(description="A test agent", system_message="You are a test")
+    assert serializer.loads(serializer.dumps(metadata)) == metadata
+
+    tool = WiseAgentTool(name="SerializedTool", description="A test tool", agent_tool=False,
+                         parameters_json_schema={}, call_back=json.dumps)
+    with pytest.raises(TypeError):
+        serializer.dumps(tool)
+    JSONWiseAgentSerializer.register_callable(json.dumps)
+    loaded_tool = serializer.loads(serializer.dumps(tool))
+    assert loaded_tool.name == "SerializedTool"
+    assert loaded_tool.call_back is json.dumps
+
+
+def test_json_serializer_reads_pickled_data_only_when_allowed():
+    value = {"role": "user", "content": "Hello"}
+    assert JSONWiseAgentSerializer(allow_pickle=True).loads(pickle.dumps(value)) == value
+    with pytest.raises(ValueError):
+        JSONWiseAgentSerializer().loads(pickle.dumps(value))
+    pickled_object = b'WA\x01\x00{"__wa_pickle__":"' + base64.b64encode(pickle.dumps(value)) + b'"}'
+    assert JSONWiseAgentSerializer(allow_pickle=True).loads(pickled_object) == value
+    with pytest.raises(ValueError):
+        JSONWiseAgentSerializer().loads(pickled_object)
+    assert create_serializer({"serializer_allow_pickle": True}).loads(pickle.dumps(value)) == value
+
+
+def test_json_serializer_escapes_reserved_keys():
+    serializer = JSONWiseAgentSerializer()
+    value = {"role": "user", "content": [{"__wa_pickle__": "payload", "__wa_type__": "os:system"}],
+             "__wa_escaped_key": ("__wa_callable__",), "metadata": WiseAgentMetaData(description="A test agent")}
+    loaded = serializer.loads(serializer.dumps(value))
+    assert loaded == value
+    # the values without reserved keys are not copied
+    history = [{"role": "user", "content": "Hello"}]
+    assert serializer._escape(history) is history
+
+
+def test_json_serializer_rejects_unknown_types():
+    serializer = JSONWiseAgentSerializer()
+    with pytest.raises(TypeError):
+        serializer.dumps({"value": object()})
+    with pytest.raises(ValueError):
+        serializer.loads(b'WA\x01\x00{"__wa_type__":"subprocess:Popen","__wa_state__":{}}')
+    with pytest.raises(ValueError):
+        serializer.loads(b'WA\x01\x00{"__wa_callable__":"os:system"}')
+    # the classes and functions are looked up without importing their module
+    assert "tabnanny" not in sys.modules
+    with pytest.raises(ValueError):
+        serializer.loads(b'WA\x01\x00{"__wa_type__":"tabnanny:NannyNag","__wa_state__":{}}')
+    with pytest.raises(ValueError):
+        serializer.loads(b'WA\x01\x00{"__wa_callable__":"tabnanny:check"}')
+    assert "tabnanny" not in sys.modules
+
+
+def test_create_serializer():
+    assert isinstance(create_serializer({}), JSONWiseAgentSerializer)
+    assert create_serializer({"serializer_compression_threshold": None}).compression_threshold is None
+    assert isinstance(create_serializer({"serializer": "pickle"}), PickleWiseAgentSerializer)
+    with pytest.raises(ValueError):
+        create_serializer({"serializer": "xml"})
@@ -0,0 +1,243 @@
+import threading
+import time
+
+import pytest
+import stomp
+import stomp.exception
+import stomp.utils
+
+from wiseagents import WiseAgentMessage
+from wiseagents.transports.stomp import StompConnectionManager, StompWiseAgentTransport
+from wiseagents.wise_agent_messaging import get_message_codec
+from tests.wiseagents import assert_standard_variables_set
+
+
+@pytest.fixture(scope="session", autouse=True)
+def run_after_all_tests():
+    assert_standard_variables_set()
+    yield
+
+
+class FakeConnection:
+    instances = []
+
+    def __init__(self, host_and_ports, heartbeats, auto_decode):
+        self.connected = False
+        self.subscriptions = {}
+        self.acks = []
+        self.sent = []
+        # the number of the next attempts to connect failing
+        self.failing_connects = 0
+        # when set, the attempts to connect wait for it
+        self.connect_released = None
+        FakeConnection.instances.append(self)
+
+    def set_listener(self, name, listener):
+        self.listener = listener
+
+    def connect(self, username, passcode, wait):
+        if self.connect_released is not None:
+            self.connect_released.wait(5)
+        if self.failing_connects > 0:
+            self.failing_connects -= 1
+            raise stomp.exception.ConnectFailedException()
+        self.connected = True
+
+    def is_connected(self):
+        return self.connected
+
+    def disconnect(self):
+        self.connected = False
+        self.subscriptions = {}
+
+    def subscribe(self, destination, id, ack, headers):
+        self.subscriptions[id] = (destination, ack, headers)
+
+    def unsubscribe(self, destination, id):
+        del self.subscriptions[id]
+
+    def ack(self, id, subscription):
+        self.acks.append((id, subscription))
+
+    def send(self, body, destination, headers):
+        self.sent.append(destination)
+
+    def deliver(self, destination: str, message: WiseAgentMessage, message_id: str):
+        subscription_id = next(subscription_id for subscription_id, subscription in self.subscriptions.items()
+                               if subscription[0] == destination)
+        self.listener.on_message(stomp.utils.Frame("MESSAGE", {"subscription": subscription_id,
+                                                               "message-id": message_id,
+                                                               "content-type": "application/json"},
+                                                   get_message_codec("json").encode(message)))
+
+
+@pytest.fixture
+def manager(monkeypatch):
+    FakeConnection.instances = []
+    monkeypatch.setattr(stomp, "Connection", FakeConnection)
+    manager = StompConnectionManager("localhost", 61616, connections=2)
+    monkeypatch.setitem(StompConnectionManager._managers, ("localhost", 61616), manager)
+    return manager
+
+
+def start_transport(agent_name: str, received: list, done: threading.Semaphore) -> StompWiseAgentTransport:
+    def receive(message: WiseAgentMessage):
+        received.append((agent_name, message.message))
+        done.release()
+
+    transport = StompWiseAgentTransport(host="localhost", port=61616, agent_name=agent_name, shared_connection=True)
+    transport.set_call_backs(receive, None, None, receive)
+    transport.start()
+    return transport
+
+
+def test_shared_connections(manager):
+    received = []
+    done = threading.Semaphore(0)
+    transports = [start_transport(f"Agent{i}", received, done) for i in range(4)]
+    request_subscription_ids = [transport._subscription_ids[0] for transport in transports]
+    request_connections = [transport.request_conn for transport in transports]
+    try:
+        # the subscriptions of all the transports are spread over the two connections of the manager
+        assert len(FakeConnection.instances) == 2
+        assert all(len(connection.subscriptions) == 4 for connection in FakeConnection.instances)
+        for connection in FakeConnection.instances:
+            for destination, ack, headers in connection.subscriptions.values():
+                if destination.startswith("/queue/request/"):
+                    assert (ack, headers["prefetch-count"]) == ("client-individual", "1")
+
+        # the frames are routed to the transport of their subscription
+        for i, transport in enumerate(transports):
+            message = WiseAgentMessage(message=f"Hello {i}", context_name="Greetings")
+            manager.connection(transport._subscription_ids[0]).deliver(transport.request_queue, message, f"r{i}")
+            manager.connection(transport._subscription_ids[1]).deliver(transport.response_queue, message, f"s{i}")
+        for _ in range(8):
+            assert done.acquire(timeout=5)
+        assert sorted(received) == sorted([(f"Agent{i}", f"Hello {i}") for i in range(4)] * 2)
+    finally:
+        for transport in transports:
+            transport.stop()
+    # the requests are acknowledged on the connection they were received on
+    for i, subscription_id in enumerate(request_subscription_ids):
+        assert (f"r{i}", subscription_id) in request_connections[i].acks
+    assert sum(len(connection.acks) for connection in FakeConnection.instances) == 4
+    # the connections are closed once they have no subscriptions
+    assert not any(connection.is_connected() for connection in FakeConnection.instances)
+
+
+def test_reconnect_restores_subscriptions(manager):
+    transport = start_transport("Agent1", [], threading.Semaphore(0))
+    try:
+        connection = transport.request_conn
+        subscriptions = dict(connection.subscriptions)
+        connection.disconnect()
+        transport.send_request(WiseAgentMessage(message="Hello", context_name="Greetings"), "Agent2")
+        assert connection.subscriptions == subscriptions
+        assert connection.sent == ["/queue/request/Agent2"]
+    finally:
+        transport.stop()
+
+
+def test_responses_handled_off_the_receiver_thread(manager):
+    threads = []
+    done = threading.Semaphore(0)
+
+    def receive(message: WiseAgentMessage):
+        threads.append((threading.current_thread().name, message.message))
+        done.release()
+
+    transport = StompWiseAgentTransport(host="localhost", port=61616, agent_name="Agent1", shared_connection=True)
+    transport.set_call_backs(None, None, None, receive)
+    transport.start()
+    try:
+        for i in range(3):
+            transport.response_conn.deliver(transport.response_queue,
+                                            WiseAgentMessage(message=f"Hello {i}", context_name="Greetings"), f"s{i}")
+        for _ in range(3):
+            assert done.acquire(timeout=5)
+        # in order, on the thread of the transport rather than the receiver thread shared with the other agents
+        assert [message for _, message in threads] == ["Hello 0", "Hello 1", "Hello 2"]
+        assert all(name.startswith(transport._response_thread_name_prefix) for name, _ in threads)
+    finally:
+        transport.stop()
+
+
+def test_stop_waits_for_requests_of_agent_with_prefix_name(manager):
+    events = []
+    handled = threading.Semaphore(0)
+    agent = StompWiseAgentTransport(host="localhost", port=61616, agent_name="Agent", shared_connection=True)
+    other_agent = StompWiseAgentTransport(host="localhost", port=61616, agent_name="Agent2", shared_connection=True)
+
+    def handle_request(message: WiseAgentMessage):
+        time.sleep(0.2)
+        events.append("Agent handled the request")
+        handled.release()
+
+    def stop_agent(message: WiseAgentMessage):
+        # stopping a transport from the thread of another agent waits for the requests being handled
+        agent.stop()
+        events.append("Agent stopped")
+        handled.release()
+
+    agent.set_call_backs(handle_request, None, None, None)
+    other_agent.set_call_backs(stop_agent, None, None, None)
+    agent.start()
+    other_agent.start()
+    try:
+        agent.request_conn.deliver(agent.request_queue, WiseAgentMessage(message="Hello", context_name="Greetings"),
+                                   "r1")
+        time.sleep(0.05)
+        other_agent.request_conn.deliver(other_agent.request_queue,
+                                         WiseAgentMessage(message="Stop", context_name="Greetings"), "r2")
+        for _ in range(2):
+            assert handled.acquire(timeout=5)
+        assert events == ["Agent handled the request", "Agent stopped"]
+    finally:
+        other_agent.stop()
+
+
+def test_lost_connection_restores_subscriptions(manager, monkeypatch):
+    monkeypatch.setattr(StompConnectionManager, "RECONNECT_DELAY", 0.01)
+    transport = start_transport("Agent1", [], threading.Semaphore(0))
+    try:
+        connection = transport.request_conn
+        subscriptions = dict(connection.subscriptions)
+        connection.disconnect()
+        connection.failing_connects = 2
+        # the connection is reconnected in the background without sending any message
+        connection.listener.on_disconnected()
+        deadline = time.time() + 5
+        while connection.subscriptions != subscriptions and time.time() < deadline:
+            time.sleep(0.01)
+        assert connection.subscriptions == subscriptions
+        assert connection.failing_connects == 0
+    finally:
+        transport.stop()
+    # a connection closed with its last subscription is not reconnected
+    connection.listener.on_disconnected()
+    time.sleep(0.05)
+    assert not connection.is_connected()
+
+
+def test_connect_does_not_block_the_other_connections(manager):
+    first = manager.subscribe("/queue/first", None)
+    second = manager.subscribe("/queue/second", None)
+    first_connection, second_connection = manager.connection(first), manager.connection(second)
+    assert first_connection is not second_connection
+    first_connection.disconnect()
+    first_connection.connect_released = threading.Event()
+    connecting = threading.Thread(target=manager.connection, args=(first,))
+    connecting.start()
+    try:
+        # while the first connection is being connected, the second one can be used
+        assert manager.connection(second) is second_connection
+        assert connecting.is_alive()
+    finally:
+        first_connection.connect_released.set()
+        connecting.join()
+    assert first_connection.subscriptions == {first: ("/queue/first", "auto", {})}
+
+
+def test_invalid_connections():
+    with pytest.raises(ValueError):
+        StompConnectionManager("localhost", 61616, connections=0)